@@ -0,0 +1,60 @@
+"""
+Compare import time and peak RSS of the server with lazily and eagerly imported adapters
+"""
+import argparse
+import subprocess
+import sys
+
+PROBE = """
+import resource, time
+start = time.perf_counter()
+{imports}
+elapsed = time.perf_counter() - start
+print(elapsed, resource.getrusage(resource.RUSAGE_SELF).ru_maxrss)
+"""
+
+SCENARIOS = {
+    # What every worker paid before adapters were registered lazily
+    'eager (all SDKs)': (
+        "import mcp.app\n"
+        "import mcp.adapters.ai.openai_adapter\n"
+        "import mcp.adapters.ai.gemini_adapter\n"
+        "import mcp.adapters.ai.local_llama_adapter"
+    ),
+    'lazy (no model)': "import mcp.app",
+    'lazy + openai': "import mcp.app\nfrom mcp.core.ai_factory import AIModelFactory\nAIModelFactory.get_model_class('openai')",
+    'lazy + local_llama': "import mcp.app\nfrom mcp.core.ai_factory import AIModelFactory\nAIModelFactory.get_model_class('local_llama')",
+}
+
+
+def measure(imports: str, runs: int):
+    times, rss = [], []
+    for _ in range(runs):
+        output = subprocess.run(
+            [sys.executable, '-c', PROBE.format(imports=imports)],
+            capture_output=True, text=True
+        )
+        if output.returncode != 0:
+            return None, output.stderr.strip().splitlines()[-1]
+        elapsed, maxrss = output.stdout.split()
+        times.append(float(elapsed))
+        rss.append(int(maxrss))
+    return (min(times), min(rss)), None
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--runs', type=int, default=5, help='Fresh interpreters per scenario')
+    args = parser.parse_args()
+
+    for name, imports in SCENARIOS.items():
+        result, error = measure(imports, args.runs)
+        if error:
+            print(f"{name:20s} unavailable: {error}")
+            continue
+        seconds, maxrss_kb = result
+        print(f"{name:20s} import {seconds * 1000:8.1f} ms   peak RSS {maxrss_kb / 1024:8.1f} MiB")
+
+
+if __name__ == '__main__':
+    main()
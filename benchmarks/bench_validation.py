@@ -0,0 +1,55 @@
+"""
+Measure the per-request overhead of the compiled request schema validation
+"""
+import argparse
+import json
+import timeit
+
+from mcp.utils.model_validator import ModelValidator
+from mcp.utils.request_schema import RequestSchemaRegistry
+
+
+class _BenchModel:
+    capabilities = {"text_generation": True, "chat": True, "embeddings": True, "moderation": True}
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--number', type=int, default=100_000, help='Validations per measurement')
+    args = parser.parse_args()
+
+    schemas = RequestSchemaRegistry()
+    models = {'bench': _BenchModel()}
+    schemas.compile_all(models)
+
+    generate = {'prompt': 'Explain the CAP theorem in two sentences.' * 4,
+                'options': {'temperature': 0.2, 'max_tokens': 256, 'top_p': 0.9}}
+    chat = {'messages': [{'role': 'user', 'content': 'Hello'},
+                         {'role': 'assistant', 'content': 'Hi, how can I help?'},
+                         {'role': 'user', 'content': 'Summarise our conversation.'}] * 5,
+            'options': {'temperature': 0.7}}
+    cases = {
+        'generate': (generate, len(json.dumps(generate))),
+        'chat': (chat, len(json.dumps(chat))),
+    }
+
+    for route, (payload, size) in cases.items():
+        schema = schemas.get('bench', route, models)
+
+        def validate():
+            schema.check_size(size)
+            schema.validate(payload)
+
+        seconds = min(timeit.repeat(validate, number=args.number, repeat=5))
+        print(f"{route:10s} schema validation: {seconds / args.number * 1e6:6.2f} us/request")
+
+    prompt = generate['prompt']
+    seconds = min(timeit.repeat(lambda: ModelValidator.sanitize_prompt(prompt), number=args.number, repeat=5))
+    print(f"{'sanitize':10s} prompt sanitising: {seconds / args.number * 1e6:6.2f} us/request")
+
+    seconds = min(timeit.repeat(lambda: json.loads(json.dumps(chat)), number=args.number // 10, repeat=5))
+    print(f"{'reference':10s} JSON round-trip of the chat body: {seconds / (args.number // 10) * 1e6:6.2f} us/request")
+
+
+if __name__ == '__main__':
+    main()
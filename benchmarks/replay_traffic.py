@@ -0,0 +1,133 @@
+"""
+Replay captured traffic (CAPTURE_DIR) against a server at its recorded arrival times, or N times faster
+
+Requests are rebuilt from their recorded shapes: filler text of the captured token
+counts, the captured options, and max_tokens set to the captured output length so
+simulated adapters (SIMULATED_MODELS) produce the same amount of output. Requests are
+sent open-loop, so a slow server builds a backlog just as it would in production.
+"""
+import argparse
+import json
+import threading
+import time
+import urllib.error
+import urllib.request
+from concurrent.futures import ThreadPoolExecutor
+
+from mcp.utils.traffic_capture import read_trace
+
+REPLAYED_ROUTES = ('generate', 'chat', 'embed', 'moderate')
+
+
+def filler(tokens: int, seed: str) -> str:
+    # Four characters per token, matching estimate_tokens; the seed keeps distinct prompts distinct
+    return (seed + ' ' + 'tok ' * tokens)[:max(4 * tokens, len(seed))]
+
+
+def build_payload(record: dict, index: int, match_output: bool) -> dict:
+    # Repeated prompts (same content hash) stay identical so coalescing and caching behave as captured
+    seed = record.get('content_hash') or f'r{index}'
+    options = dict(record.get('options') or {})
+    if match_output and record.get('output_tokens'):
+        options['max_tokens'] = record['output_tokens']
+    route = record['route']
+    if route == 'chat':
+        counts = record.get('input_tokens') or [1]
+        roles = ['user' if (len(counts) - i) % 2 else 'assistant' for i in range(len(counts))]
+        payload = {'messages': [{'role': role, 'content': filler(count, f'{seed}-{i}')}
+                                for i, (role, count) in enumerate(zip(roles, counts))]}
+    else:
+        field = {'generate': 'prompt', 'embed': 'text', 'moderate': 'content'}[route]
+        payload = {field: filler(record.get('input_tokens') or 1, seed)}
+    if options:
+        payload['options'] = options
+    return payload
+
+
+def send(url: str, payload: dict, timeout: float):
+    request = urllib.request.Request(url, data=json.dumps(payload).encode(),
+                                     headers={'Content-Type': 'application/json'})
+    start = time.perf_counter()
+    try:
+        with urllib.request.urlopen(request, timeout=timeout) as response:
+            response.read()
+            status = response.status
+    except urllib.error.HTTPError as e:
+        status = e.code
+    except Exception:
+        status = 0
+    return status, (time.perf_counter() - start) * 1000
+
+
+def percentile(values, fraction: float) -> float:
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(fraction * len(ordered)))]
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('trace', help='Capture directory or a single capture-*.jsonl.gz segment')
+    parser.add_argument('--url', default='http://127.0.0.1:3000', help='Server to replay against')
+    parser.add_argument('--speed', type=float, default=1.0, help='Replay N times faster than captured')
+    parser.add_argument('--model', action='append', default=[], metavar='CAPTURED=TARGET',
+                        help='Send requests captured for one model to another')
+    parser.add_argument('--limit', type=int, help='Replay only the first N requests')
+    parser.add_argument('--workers', type=int, default=256, help='Maximum requests in flight')
+    parser.add_argument('--timeout', type=float, default=300.0, help='Per-request timeout in seconds')
+    parser.add_argument('--no-match-output', action='store_true',
+                        help="Keep the captured options instead of requesting the captured output length")
+    args = parser.parse_args()
+
+    rename = dict(mapping.split('=', 1) for mapping in args.model)
+    records = [record for record in read_trace(args.trace) if record['route'] in REPLAYED_ROUTES]
+    if args.limit:
+        records = records[:args.limit]
+    if not records:
+        parser.error('No replayable requests in the trace')
+
+    results = {}
+    lock = threading.Lock()
+    lags = []
+
+    def run(record, payload, key):
+        model = rename.get(record['model'], record['model'])
+        status, latency_ms = send(f"{args.url}/api/{model}/{record['route']}", payload, args.timeout)
+        with lock:
+            results.setdefault(key, []).append((status, latency_ms))
+
+    first = records[0]['ts']
+    print(f"Replaying {len(records)} requests spanning {records[-1]['ts'] - first:.1f}s at {args.speed}x")
+    start = time.monotonic()
+    with ThreadPoolExecutor(max_workers=args.workers) as executor:
+        for index, record in enumerate(records):
+            due = start + (record['ts'] - first) / args.speed
+            delay = due - time.monotonic()
+            if delay > 0:
+                time.sleep(delay)
+            else:
+                lags.append(-delay * 1000)
+            payload = build_payload(record, index, not args.no_match_output)
+            key = (record['route'], rename.get(record['model'], record['model']))
+            executor.submit(run, record, payload, key)
+    elapsed = time.monotonic() - start
+
+    print(f"Completed {len(records)} requests in {elapsed:.1f}s ({len(records) / elapsed:.1f} req/s); "
+          f"{len(lags)} sent late, worst by {max(lags, default=0.0):.0f} ms")
+    captured = {}
+    for record in records:
+        key = (record['route'], rename.get(record['model'], record['model']))
+        captured.setdefault(key, []).append(record['latency_ms'])
+    print(f"{'route':10s} {'model':16s} {'count':>6s} {'errors':>6s} {'p50 ms':>9s} {'p90 ms':>9s} "
+          f"{'p99 ms':>9s} {'max ms':>9s} {'captured p50':>13s}")
+    for (route, model), outcomes in sorted(results.items()):
+        latencies = [latency for status, latency in outcomes if status == 200]
+        errors = sum(1 for status, _ in outcomes if status != 200)
+        print(f"{route:10s} {model:16s} {len(outcomes):6d} {errors:6d} {percentile(latencies, 0.5):9.1f} "
+              f"{percentile(latencies, 0.9):9.1f} {percentile(latencies, 0.99):9.1f} "
+              f"{max(latencies, default=0.0):9.1f} {percentile(captured[(route, model)], 0.5):13.1f}")
+
+
+if __name__ == '__main__':
+    main()
@@ -1,31 +1,277 @@
-from huggingface_hub import hf_hub_download
+import argparse
+import hashlib
+import json
 import os
+import threading
+import urllib.error
+import urllib.parse
+import urllib.request
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Dict, List, Optional
 
-def download_model(model_name="llama-2-7b-chat.Q4_K_M.gguf"):
-    # Create models directory if it doesn't exist
-    os.makedirs('models', exist_ok=True)
-    
-    # Download the model
-    model_path = hf_hub_download(
-        repo_id="TheBloke/Llama-2-7B-Chat-GGUF",
-        filename=model_name,
-        local_dir="models",
-        # Temporarily disable SSL verification for troubleshooting
-        # WARNING: Not recommended for production environments
-        force_download=True, # Force download to ensure it retries
-        resume_download=False, # Start fresh
-        # Add 'config_kwargs': {'trust_remote_code': True} if `allow_unsafe_deserialization` or similar is needed
-        # For SSL issues, direct SSL parameter is usually in requests/urllib3
-        # For hf_hub_download, a common workaround for persistent SSL is to set environment var
-        # or use a custom http_client/session, but given the error, force_download + resume_download
-        # combined with previous cert steps is the way. If still fails, manual download is option.
-    )
+DEFAULT_REPO_ID = "TheBloke/Llama-2-7B-Chat-GGUF"
+DEFAULT_MODEL_NAME = "llama-2-7b-chat.Q4_K_M.gguf"
+DEFAULT_ENDPOINT = os.getenv('HF_ENDPOINT', 'https://huggingface.co')
+DEFAULT_CHUNK_SIZE = 64 * 1024 * 1024
+DEFAULT_WORKERS = 8
+READ_BLOCK_SIZE = 1024 * 1024
+
+
+class _NoRedirect(urllib.request.HTTPRedirectHandler):
+    """Keep redirect responses so the LFS metadata headers stay visible"""
+
+    def redirect_request(self, req, fp, code, msg, headers, newurl):
+        return None
+
+
+class ModelDownloader:
+    """Resumable, parallel downloader for GGUF files hosted on a Hugging Face compatible endpoint"""
+
+    def __init__(self, endpoint: str = DEFAULT_ENDPOINT, token: Optional[str] = None,
+                 workers: int = DEFAULT_WORKERS, chunk_size: int = DEFAULT_CHUNK_SIZE,
+                 timeout: float = 60.0):
+        self.endpoint = endpoint.rstrip('/')
+        self.token = token or os.getenv('HF_TOKEN')
+        self.workers = max(1, workers)
+        self.chunk_size = max(READ_BLOCK_SIZE, chunk_size)
+        self.timeout = timeout
+        self._state_lock = threading.Lock()
+
+    def _request(self, url: str, method: str = 'GET', headers: Optional[Dict[str, str]] = None):
+        request = urllib.request.Request(url, method=method, headers=dict(headers or {}))
+        # The token is only for the Hub itself: CDN and pre-signed storage URLs must not see it,
+        # and an unredirected header is dropped if the Hub redirects the request elsewhere
+        if self.token and self._origin(url) == self._origin(self.endpoint):
+            request.add_unredirected_header('Authorization', f'Bearer {self.token}')
+        return request
+
+    @staticmethod
+    def _origin(url: str) -> tuple:
+        parts = urllib.parse.urlsplit(url)
+        return parts.scheme, parts.netloc.lower()
+
+    def file_metadata(self, repo_id: str, filename: str, revision: str = 'main') -> Dict[str, Any]:
+        """Resolve download URL, size, SHA256 and range support for a repository file"""
+        url = f"{self.endpoint}/{repo_id}/resolve/{revision}/{urllib.parse.quote(filename)}"
+        opener = urllib.request.build_opener(_NoRedirect)
+        try:
+            response = opener.open(self._request(url, 'HEAD'), timeout=self.timeout)
+            headers, location = response.headers, None
+            response.close()
+        except urllib.error.HTTPError as e:
+            if e.code not in (301, 302, 303, 307, 308):
+                raise
+            headers, location = e.headers, e.headers.get('Location')
+
+        # LFS files report their content hash as the linked etag
+        etag = (headers.get('X-Linked-Etag') or headers.get('ETag') or '').strip('"')
+        if etag.startswith('W/'):
+            etag = ''
+        size = headers.get('X-Linked-Size') or headers.get('Content-Length')
+        download_url = urllib.parse.urljoin(url, location) if location else url
+
+        accepts_ranges = headers.get('Accept-Ranges', '').lower() == 'bytes'
+        if location:
+            probe = urllib.request.urlopen(
+                self._request(download_url, 'HEAD'), timeout=self.timeout
+            )
+            accepts_ranges = probe.headers.get('Accept-Ranges', '').lower() == 'bytes'
+            size = size or probe.headers.get('Content-Length')
+            probe.close()
+
+        return {
+            'url': download_url,
+            'size': int(size) if size else None,
+            'sha256': etag if len(etag) == 64 else None,
+            'accepts_ranges': accepts_ranges
+        }
+
+    @staticmethod
+    def sha256_file(path: str) -> str:
+        """Compute the SHA256 of a file without loading it into memory"""
+        digest = hashlib.sha256()
+        with open(path, 'rb') as f:
+            for block in iter(lambda: f.read(READ_BLOCK_SIZE), b''):
+                digest.update(block)
+        return digest.hexdigest()
+
+    @staticmethod
+    def _verified_marker(path: str) -> str:
+        return path + '.sha256'
+
+    def is_verified(self, path: str, sha256: Optional[str], size: Optional[int]) -> bool:
+        """Check whether a file is already present and matches the expected checksum"""
+        if not os.path.exists(path):
+            return False
+        stat = os.stat(path)
+        if size is not None and stat.st_size != size:
+            return False
+
+        marker = self._verified_marker(path)
+        if os.path.exists(marker):
+            with open(marker) as f:
+                recorded = json.load(f)
+            # Trust the recorded hash while the file is untouched
+            if recorded.get('size') == stat.st_size and recorded.get('mtime') == stat.st_mtime:
+                return sha256 is None or recorded.get('sha256') == sha256
+
+        actual = self.sha256_file(path)
+        if sha256 is not None and actual != sha256:
+            return False
+        self._write_marker(path, actual)
+        return True
+
+    def _write_marker(self, path: str, sha256: str) -> None:
+        stat = os.stat(path)
+        with open(self._verified_marker(path), 'w') as f:
+            json.dump({'sha256': sha256, 'size': stat.st_size, 'mtime': stat.st_mtime}, f)
+
+    def _load_state(self, state_path: str, size: int) -> List[int]:
+        if not os.path.exists(state_path):
+            return []
+        with open(state_path) as f:
+            state = json.load(f)
+        if state.get('size') != size or state.get('chunk_size') != self.chunk_size:
+            return []
+        return state.get('completed', [])
+
+    def _save_state(self, state_path: str, size: int, completed: List[int]) -> None:
+        tmp_path = state_path + '.tmp'
+        with open(tmp_path, 'w') as f:
+            json.dump({'size': size, 'chunk_size': self.chunk_size, 'completed': sorted(completed)}, f)
+        os.replace(tmp_path, state_path)
+
+    def _fetch_range(self, url: str, part_path: str, start: int, end: int) -> None:
+        request = self._request(url, headers={'Range': f'bytes={start}-{end}'})
+        with urllib.request.urlopen(request, timeout=self.timeout) as response:
+            if response.status != 206:
+                raise RuntimeError(f"Server ignored range request for bytes {start}-{end}")
+            with open(part_path, 'r+b') as f:
+                f.seek(start)
+                for block in iter(lambda: response.read(READ_BLOCK_SIZE), b''):
+                    f.write(block)
+
+    def _download_ranged(self, url: str, part_path: str, size: int) -> None:
+        state_path = part_path + '.json'
+        completed = set(self._load_state(state_path, size))
+        if not completed or not os.path.exists(part_path):
+            completed = set()
+            with open(part_path, 'wb') as f:
+                f.truncate(size)
+
+        chunks = [
+            (index, start, min(start + self.chunk_size, size) - 1)
+            for index, start in enumerate(range(0, size, self.chunk_size))
+            if index not in completed
+        ]
+        if chunks:
+            print(f"Fetching {len(chunks)} chunk(s) with {self.workers} worker(s)"
+                  f" ({len(completed)} already complete)")
+
+        def fetch(chunk):
+            index, start, end = chunk
+            self._fetch_range(url, part_path, start, end)
+            with self._state_lock:
+                completed.add(index)
+                self._save_state(state_path, size, list(completed))
+
+        with ThreadPoolExecutor(max_workers=self.workers) as executor:
+            # Consume results so the first failed chunk is re-raised here
+            for _ in executor.map(fetch, chunks):
+                pass
+
+        if os.path.exists(state_path):
+            os.remove(state_path)
+
+    def _download_stream(self, url: str, part_path: str, accepts_ranges: bool, size: Optional[int]) -> None:
+        offset = os.path.getsize(part_path) if accepts_ranges and os.path.exists(part_path) else 0
+        if size is not None and offset == size:
+            # Fully downloaded on an earlier run; asking for bytes past the end would get a 416
+            return
+        if size is not None and offset > size:
+            offset = 0
+        headers = {'Range': f'bytes={offset}-'} if offset else {}
+        with urllib.request.urlopen(self._request(url, headers=headers), timeout=self.timeout) as response:
+            mode = 'ab' if offset and response.status == 206 else 'wb'
+            with open(part_path, mode) as f:
+                for block in iter(lambda: response.read(READ_BLOCK_SIZE), b''):
+                    f.write(block)
+
+    def download(self, repo_id: str, filename: str, local_dir: str = 'models',
+                 revision: str = 'main', sha256: Optional[str] = None) -> str:
+        """Download a single file, skipping verified copies and resuming partial ones"""
+        os.makedirs(local_dir, exist_ok=True)
+        dest = os.path.join(local_dir, filename)
+        os.makedirs(os.path.dirname(dest) or '.', exist_ok=True)
+
+        meta = self.file_metadata(repo_id, filename, revision)
+        expected_sha = sha256 or meta['sha256']
+        if self.is_verified(dest, expected_sha, meta['size']):
+            print(f"Already present and verified: {dest}")
+            return dest
+
+        part_path = dest + '.part'
+        if meta['size'] and meta['accepts_ranges'] and self.workers > 1:
+            self._download_ranged(meta['url'], part_path, meta['size'])
+        else:
+            self._download_stream(meta['url'], part_path, meta['accepts_ranges'], meta['size'])
+
+        actual_sha = self.sha256_file(part_path)
+        if expected_sha and actual_sha != expected_sha:
+            os.remove(part_path)
+            raise ValueError(f"Checksum mismatch for {filename}: expected {expected_sha}, got {actual_sha}")
+        if not expected_sha:
+            print(f"Warning: no SHA256 published for {filename}, skipping verification")
+
+        os.replace(part_path, dest)
+        self._write_marker(dest, actual_sha)
+        return dest
+
+    def download_manifest(self, manifest: Dict[str, Any], local_dir: str = 'models') -> List[str]:
+        """Download every file listed in a manifest"""
+        default_repo = manifest.get('repo_id', DEFAULT_REPO_ID)
+        default_revision = manifest.get('revision', 'main')
+        paths = []
+        for entry in manifest.get('files', []):
+            if isinstance(entry, str):
+                entry = {'filename': entry}
+            paths.append(self.download(
+                entry.get('repo_id', default_repo),
+                entry['filename'],
+                local_dir=entry.get('local_dir', local_dir),
+                revision=entry.get('revision', default_revision),
+                sha256=entry.get('sha256')
+            ))
+        return paths
+
+
+def download_model(model_name=DEFAULT_MODEL_NAME, repo_id=DEFAULT_REPO_ID, local_dir="models",
+                   endpoint=DEFAULT_ENDPOINT, workers=DEFAULT_WORKERS, chunk_size=DEFAULT_CHUNK_SIZE):
+    downloader = ModelDownloader(endpoint=endpoint, workers=workers, chunk_size=chunk_size)
+    model_path = downloader.download(repo_id, model_name, local_dir=local_dir)
     print(f"Model downloaded to: {model_path}")
     return model_path
 
+
 if __name__ == "__main__":
-    import argparse
     parser = argparse.ArgumentParser()
-    parser.add_argument("--model_name", type=str, default="llama-2-7b-chat.Q4_K_M.gguf", help="Name of the GGUF model file to download")
+    parser.add_argument("--model_name", type=str, action="append", help="Name of a GGUF model file to download (repeatable)")
+    parser.add_argument("--repo_id", type=str, default=DEFAULT_REPO_ID, help="Repository to download from")
+    parser.add_argument("--manifest", type=str, help="JSON manifest listing several files/quantisations to download")
+    parser.add_argument("--local_dir", type=str, default="models", help="Directory to store the models in")
+    parser.add_argument("--endpoint", type=str, default=DEFAULT_ENDPOINT, help="Hugging Face compatible endpoint")
+    parser.add_argument("--workers", type=int, default=DEFAULT_WORKERS, help="Parallel ranged requests per file")
+    parser.add_argument("--chunk_size_mb", type=int, default=DEFAULT_CHUNK_SIZE // (1024 * 1024), help="Size of each ranged chunk in MiB")
     args = parser.parse_args()
-    download_model(args.model_name) 
\ No newline at end of file
+
+    downloader = ModelDownloader(endpoint=args.endpoint, workers=args.workers,
+                                 chunk_size=args.chunk_size_mb * 1024 * 1024)
+    if args.manifest:
+        with open(args.manifest) as f:
+            manifest = json.load(f)
+        for path in downloader.download_manifest(manifest, local_dir=args.local_dir):
+            print(f"Model downloaded to: {path}")
+    else:
+        for name in args.model_name or [DEFAULT_MODEL_NAME]:
+            path = downloader.download(args.repo_id, name, local_dir=args.local_dir)
+            print(f"Model downloaded to: {path}")
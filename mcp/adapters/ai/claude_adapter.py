@@ -1,10 +1,16 @@
 from typing import Dict, List, Optional, Any
 from mcp.core.ai_interface import AIModel
+from mcp.utils.rate_limiter import report_provider_response
+from mcp.utils.request_schema import GENERATION_OPTIONS, pick_options
 import anthropic
 
+_CHAT_OPTIONS = pick_options(GENERATION_OPTIONS, 'temperature', 'max_tokens')
+
 class ClaudeAdapter(AIModel):
     """Adapter for Anthropic's Claude models."""
     
+    option_schema = {'generate': _CHAT_OPTIONS, 'chat': _CHAT_OPTIONS}
+    
     def __init__(self):
         self.client = None
         self._capabilities = {
@@ -20,7 +26,14 @@ class ClaudeAdapter(AIModel):
         """Initialize the Claude client."""
         self.api_key = config.get('api_key')
         self.model_name = config.get('model_name', self.default_model)
-        self.client = anthropic.Client(api_key=self.api_key)
+        # The adaptive limiter handles 429s; SDK retries would hide them from it and hold the permit
+        self.client = anthropic.Client(api_key=self.api_key, max_retries=config.get('max_retries', 0))
+    
+    def _create_message(self, **params) -> Any:
+        """Create a message, passing the rate-limit headers to the adaptive limiter."""
+        raw = self.client.messages.with_raw_response.create(**params)
+        report_provider_response(raw.headers, raw.status_code)
+        return raw.parse()
     
     def generate_text(self, prompt: str, options: Optional[Dict[str, Any]] = None) -> str:
         """Generate text using Claude."""
@@ -31,7 +44,7 @@ class ClaudeAdapter(AIModel):
         temperature = options.get('temperature', 0.7)
         max_tokens = options.get('max_tokens', 1024)
         
-        message = self.client.messages.create(
+        message = self._create_message(
             model=self.model_name,
             max_tokens=max_tokens,
             temperature=temperature,
@@ -40,12 +53,12 @@ class ClaudeAdapter(AIModel):
         return message.content[0].text
     
     def generate_chat_response(self, messages: List[Dict[str, str]], 
-                             options: Optional[Dict[str, Any]] = None) -> str:
+                             options: Optional[Dict[str, Any]] = None, **kwargs) -> str:
         """Generate chat response using Claude."""
         if not self.client:
             raise RuntimeError("Claude not initialized")
         
-        options = options or {}
+        options = dict(options or {}, **kwargs)
         temperature = options.get('temperature', 0.7)
         max_tokens = options.get('max_tokens', 1024)
         
@@ -55,7 +68,7 @@ class ClaudeAdapter(AIModel):
             role = "assistant" if msg["role"] == "assistant" else "user"
             claude_messages.append({"role": role, "content": msg["content"]})
         
-        message = self.client.messages.create(
+        message = self._create_message(
             model=self.model_name,
             max_tokens=max_tokens,
             temperature=temperature,
@@ -74,7 +87,7 @@ class ClaudeAdapter(AIModel):
         max_tokens = options.get('max_tokens', 1024)
         
         # Create message with image
-        message = self.client.messages.create(
+        message = self._create_message(
             model=self.model_name,
             max_tokens=max_tokens,
             temperature=temperature,
@@ -113,7 +126,7 @@ class ClaudeAdapter(AIModel):
         
         Content to analyze: {content}"""
         
-        message = self.client.messages.create(
+        message = self._create_message(
             model=self.model_name,
             max_tokens=1024,
             temperature=0,
@@ -128,4 +141,14 @@ class ClaudeAdapter(AIModel):
     @property
     def capabilities(self) -> Dict[str, bool]:
         """Return Claude's capabilities."""
-        return self._capabilities 
\ No newline at end of file
+        return self._capabilities
+    
+    @property
+    def model_info(self) -> Dict[str, Any]:
+        """Return information about the Claude model."""
+        return {
+            "provider": "Anthropic",
+            "model": getattr(self, 'model_name', self.default_model),
+            "type": "Large Language Model",
+            "capabilities": self.capabilities
+        }
@@ -1,9 +1,16 @@
 from typing import Dict, List, Optional, Any
 from mcp.core.ai_interface import AIModel
+from mcp.utils.request_schema import GENERATION_OPTIONS, pick_options
 
 class ExampleModelAdapter(AIModel):
     """Example adapter showing how to integrate any new AI model."""
     
+    # Declare the request options your model honours, per route; others are rejected
+    option_schema = {
+        'generate': pick_options(GENERATION_OPTIONS, 'temperature', 'max_tokens'),
+        'chat': pick_options(GENERATION_OPTIONS, 'temperature', 'max_tokens')
+    }
+    
     def __init__(self):
         self.client = None
         self._capabilities = {
@@ -32,11 +39,13 @@ class ExampleModelAdapter(AIModel):
         pass
     
     def generate_chat_response(self, messages: List[Dict[str, str]], 
-                             options: Optional[Dict[str, Any]] = None) -> str:
+                             options: Optional[Dict[str, Any]] = None, **kwargs) -> str:
         """Generate response for a chat conversation."""
         if not self.client:
             raise RuntimeError("Model not initialized")
             
+        # The chat route passes options as keyword arguments
+        # options = dict(options or {}, **kwargs)
         # Add your model-specific chat implementation here
         # formatted_messages = [format_message(m) for m in messages]
         # response = self.client.chat(formatted_messages, **options)
@@ -4,10 +4,40 @@ from PIL import Image
 import io
 
 from ...core.ai_interface import AIModel
+from ...utils.rate_limiter import report_provider_error
+from ...utils.request_schema import GENERATION_OPTIONS, SAMPLING_OPTIONS, pick_options
+
+_CHAT_OPTIONS = pick_options(GENERATION_OPTIONS, 'temperature', 'max_tokens', 'top_p', 'top_k', 'stop')
+# Gemini draws n candidates with candidate_count, but cannot rank them for best_of, and its
+# chat sessions take a single candidate only
+_GENERATE_OPTIONS = dict(_CHAT_OPTIONS, **pick_options(SAMPLING_OPTIONS, 'n'))
+
+# Request option -> Gemini generation_config field
+_GENERATION_CONFIG = {
+    'temperature': 'temperature',
+    'max_tokens': 'max_output_tokens',
+    'top_p': 'top_p',
+    'top_k': 'top_k',
+    'stop': 'stop_sequences',
+    'n': 'candidate_count'
+}
+
+def _generation_config(options: Dict[str, Any]) -> Dict[str, Any]:
+    """Map request options onto Gemini's generation_config"""
+    config = {_GENERATION_CONFIG[key]: value for key, value in options.items() if key in _GENERATION_CONFIG}
+    if isinstance(config.get('stop_sequences'), str):
+        config['stop_sequences'] = [config['stop_sequences']]
+    return config
+
+def _candidate_texts(response: Any) -> List[str]:
+    """Text of every candidate; response.text only works when there is a single one"""
+    return [''.join(part.text for part in candidate.content.parts) for candidate in response.candidates]
 
 class GeminiAdapter(AIModel):
     """Google Gemini implementation of the AI model interface"""
     
+    option_schema = {'generate': _GENERATE_OPTIONS, 'chat': _CHAT_OPTIONS}
+    
     def __init__(self):
         self.model = None
         self.vision_model = None
@@ -32,17 +62,24 @@ class GeminiAdapter(AIModel):
         self.vision_model = genai.GenerativeModel('gemini-pro-vision')
         self.embedding_model = genai.GenerativeModel('embedding-001')
         
-    def generate_text(self, prompt: str, **kwargs) -> Dict[str, Any]:
+    def generate_text(self, prompt: str, options: Optional[Dict[str, Any]] = None, **kwargs) -> Dict[str, Any]:
         """Generate text using Gemini"""
         try:
-            response = self.model.generate_content(prompt, **kwargs)
+            response = self.model.generate_content(
+                prompt, generation_config=_generation_config(dict(options or {}, **kwargs))
+            )
+            texts = _candidate_texts(response)
             
-            return {
-                "text": response.text,
+            result = {
+                "text": texts[0],
                 "usage": {},  # Gemini doesn't provide usage stats
                 "model": "gemini-pro"
             }
+            if len(texts) > 1:
+                result["choices"] = texts
+            return result
         except Exception as e:
+            report_provider_error(e)
             return {"error": str(e)}
             
     def generate_chat_response(self, messages: List[Dict[str, str]], **kwargs) -> Dict[str, Any]:
@@ -59,7 +96,7 @@ class GeminiAdapter(AIModel):
             
             # Process the last message and get response
             last_message = messages[-1]
-            response = chat.send_message(last_message["content"])
+            response = chat.send_message(last_message["content"], generation_config=_generation_config(kwargs))
             
             return {
                 "response": response.text,
@@ -67,15 +104,17 @@ class GeminiAdapter(AIModel):
                 "model": "gemini-pro"
             }
         except Exception as e:
+            report_provider_error(e)
             return {"error": str(e)}
             
-    def embed_text(self, text: str, **kwargs) -> List[float]:
+    def embed_text(self, text: str, **kwargs) -> Any:
         """Generate embeddings using Gemini"""
         try:
             response = self.embedding_model.embed_content(text)
             return response.embedding
         except Exception as e:
-            return []
+            report_provider_error(e)
+            return {"error": str(e)}
             
     def analyze_image(self, image_data: bytes, prompt: Optional[str] = None, **kwargs) -> Dict[str, Any]:
         """Analyze an image using Gemini Vision"""
@@ -94,6 +133,7 @@ class GeminiAdapter(AIModel):
                 "model": "gemini-pro-vision"
             }
         except Exception as e:
+            report_provider_error(e)
             return {"error": str(e)}
             
     def moderate_content(self, content: str) -> Dict[str, Any]:
@@ -1,15 +1,24 @@
-from typing import Dict, List, Optional, Any
+from typing import Dict, List, Optional, Any, Tuple
 from mcp.core.ai_interface import AIModel
-from transformers import AutoTokenizer, AutoModelForCausalLM, pipeline
+from mcp.core.chat_template import ChatTemplate
+from mcp.utils.batcher import DynamicBatcher
+from mcp.utils.request_schema import EMBEDDING_OPTIONS, GENERATION_OPTIONS, pick_options
+from transformers import AutoTokenizer, AutoModelForCausalLM
 import torch
 
+_CHAT_OPTIONS = pick_options(GENERATION_OPTIONS, 'temperature', 'max_tokens', 'max_new_tokens')
+
 class Llama2Adapter(AIModel):
     """Adapter for Meta's Llama 2 models using Hugging Face transformers."""
     
+    option_schema = {'generate': _CHAT_OPTIONS, 'chat': _CHAT_OPTIONS, 'embed': EMBEDDING_OPTIONS}
+    
     def __init__(self):
         self.model = None
         self.tokenizer = None
-        self.pipeline = None
+        self.chat_template = None
+        self._generate_batcher = None
+        self._embed_batcher = None
         self._capabilities = {
             "text_generation": True,
             "chat": True,
@@ -26,78 +35,159 @@ class Llama2Adapter(AIModel):
         
         # Initialize tokenizer and model
         self.tokenizer = AutoTokenizer.from_pretrained(self.model_name, token=config.get('hf_token'))
+        # Decoder-only models must be padded on the left so new tokens follow the prompt
+        self.tokenizer.padding_side = "left"
+        if self.tokenizer.pad_token is None:
+            self.tokenizer.pad_token = self.tokenizer.eos_token
+        self.chat_template = ChatTemplate.from_tokenizer(self.tokenizer, fallback=config.get('chat_format', 'llama-2'))
         self.model = AutoModelForCausalLM.from_pretrained(
             self.model_name,
             token=config.get('hf_token'),
-            torch_dtype=torch.float16,
+            torch_dtype=torch.float16 if self.device == "cuda" else torch.float32,
             device_map="auto"
         )
+        self.model.eval()
         
-        # Create text generation pipeline
-        self.pipeline = pipeline(
-            "text-generation",
-            model=self.model,
-            tokenizer=self.tokenizer,
-            device=self.device
+        # Concurrent requests are grouped into padded batches
+        self.max_padding_ratio = config.get('max_padding_ratio', 0.5)
+        self._generate_batcher = DynamicBatcher(
+            self._generate_batch,
+            max_batch_size=config.get('batch_size', 8),
+            max_wait_ms=config.get('batch_wait_ms', 10),
+            key=lambda request: request[1],
+            name="llama2-generate"
+        )
+        self._embed_batcher = DynamicBatcher(
+            self._embed_batch,
+            max_batch_size=config.get('embedding_batch_size', 32),
+            max_wait_ms=config.get('batch_wait_ms', 10),
+            key=lambda request: request[1],
+            name="llama2-embed"
         )
     
+    def _padding_groups(self, lengths: List[int]) -> List[List[int]]:
+        """Split indices into length-sorted groups whose padding stays under max_padding_ratio."""
+        order = sorted(range(len(lengths)), key=lambda i: lengths[i])
+        groups: List[List[int]] = []
+        for index in order:
+            if groups:
+                group = groups[-1]
+                longest = lengths[index]
+                padded = longest * (len(group) + 1)
+                real = sum(lengths[i] for i in group) + longest
+                if padded - real <= self.max_padding_ratio * padded:
+                    group.append(index)
+                    continue
+            groups.append([index])
+        return groups
+    
+    def _generate_batch(self, requests: List[Tuple[str, Tuple[int, float]]]) -> List[str]:
+        """Generate completions for a batch of prompts sharing the same sampling settings."""
+        max_new_tokens, temperature = requests[0][1]
+        prompts = [prompt for prompt, _ in requests]
+        lengths = [len(ids) for ids in self.tokenizer(prompts)["input_ids"]]
+        results: List[str] = [""] * len(prompts)
+        
+        for group in self._padding_groups(lengths):
+            inputs = self.tokenizer(
+                [prompts[i] for i in group], return_tensors="pt", padding=True
+            ).to(self.device)
+            sampling = {"do_sample": True, "temperature": temperature} if temperature > 0 else {"do_sample": False}
+            with torch.no_grad():
+                output = self.model.generate(
+                    **inputs,
+                    max_new_tokens=max_new_tokens,
+                    pad_token_id=self.tokenizer.pad_token_id,
+                    **sampling
+                )
+            # Only decode the newly generated tokens
+            new_tokens = output[:, inputs["input_ids"].shape[1]:]
+            for index, text in zip(group, self.tokenizer.batch_decode(new_tokens, skip_special_tokens=True)):
+                results[index] = text
+        return results
+    
     def generate_text(self, prompt: str, options: Optional[Dict[str, Any]] = None) -> str:
         """Generate text using Llama 2."""
-        if not self.pipeline:
+        if not self.model:
             raise RuntimeError("Llama 2 not initialized")
         
         options = options or {}
-        max_length = options.get('max_tokens', 1024)
+        # max_tokens counts generated tokens only, never the prompt
+        max_new_tokens = options.get('max_new_tokens', options.get('max_tokens', 1024))
         temperature = options.get('temperature', 0.7)
         
-        response = self.pipeline(
-            prompt,
-            max_length=max_length,
-            temperature=temperature,
-            num_return_sequences=1,
-            pad_token_id=self.tokenizer.eos_token_id
-        )
-        
-        return response[0]['generated_text'][len(prompt):]
+        return self._generate_batcher((prompt, (max_new_tokens, temperature)))
+    
+    def count_tokens(self, text: str) -> int:
+        """Number of tokens the model's tokenizer makes of text, without special tokens."""
+        if not self.tokenizer:
+            raise RuntimeError("Llama 2 not initialized")
+        return len(self.tokenizer(text, add_special_tokens=False)["input_ids"])
     
     def generate_chat_response(self, messages: List[Dict[str, str]], 
-                             options: Optional[Dict[str, Any]] = None) -> str:
+                             options: Optional[Dict[str, Any]] = None, **kwargs) -> str:
         """Generate chat response using Llama 2."""
-        if not self.pipeline:
+        if not self.model:
             raise RuntimeError("Llama 2 not initialized")
         
-        # Format messages in Llama 2 chat format
-        formatted_prompt = ""
-        for msg in messages:
-            role = msg["role"]
-            content = msg["content"]
-            if role == "system":
-                formatted_prompt += f"<s>[INST] <<SYS>>{content}<</SYS>>\n\n"
-            elif role == "user":
-                formatted_prompt += f"[INST] {content} [/INST]"
-            elif role == "assistant":
-                formatted_prompt += f"{content} </s>"
+        formatted_prompt = self.chat_template.render(messages)
+        # The tokenizer adds its own BOS token
+        bos = self.tokenizer.bos_token
+        if bos and getattr(self.tokenizer, 'add_bos_token', True) and formatted_prompt.startswith(bos):
+            formatted_prompt = formatted_prompt[len(bos):]
         
-        return self.generate_text(formatted_prompt, options)
+        return self.generate_text(formatted_prompt, dict(options or {}, **kwargs))
     
-    def embed_text(self, text: str, options: Optional[Dict[str, Any]] = None) -> List[float]:
-        """Generate text embeddings using Llama 2's hidden states."""
-        if not self.model or not self.tokenizer:
-            raise RuntimeError("Llama 2 not initialized")
+    def _embed_batch(self, requests: List[Tuple[str, Tuple[str, bool]]]) -> List[List[float]]:
+        """Embed a batch of texts using only the final hidden state."""
+        pooling, normalize = requests[0][1]
+        texts = [text for text, _ in requests]
+        lengths = [len(ids) for ids in self.tokenizer(texts, truncation=True)["input_ids"]]
+        results: List[List[float]] = [[] for _ in texts]
         
-        # Tokenize input text
-        inputs = self.tokenizer(text, return_tensors="pt", padding=True, truncation=True)
-        inputs = {k: v.to(self.device) for k, v in inputs.items()}
-        
-        # Get model's hidden states
-        with torch.no_grad():
-            outputs = self.model(**inputs, output_hidden_states=True)
+        for group in self._padding_groups(lengths):
+            inputs = self.tokenizer(
+                [texts[i] for i in group], return_tensors="pt", padding=True, truncation=True
+            ).to(self.device)
+            mask = inputs["attention_mask"]
+            # Positions count from each text's first real token, so left padding doesn't shift
+            # them and an embedding doesn't depend on the other texts in its batch
+            position_ids = (mask.cumsum(-1) - 1).clamp(min=0)
+            with torch.no_grad():
+                # The base model returns last_hidden_state without materialising every layer
+                hidden = self.model.base_model(**inputs, position_ids=position_ids).last_hidden_state
+            
+            if pooling == "mean":
+                weights = mask.unsqueeze(-1).to(hidden.dtype)
+                pooled = (hidden * weights).sum(dim=1) / weights.sum(dim=1).clamp(min=1)
+            elif pooling == "last":
+                # Left padding puts the last real token at the end of every row
+                pooled = hidden[:, -1, :]
+            elif pooling == "first":
+                first = (mask.cumsum(dim=1) == 1).float().argmax(dim=1)
+                pooled = hidden[torch.arange(hidden.shape[0]), first]
+            else:
+                raise ValueError(f"Unknown pooling: {pooling}")
             
-        # Use the last hidden state's CLS token as embedding
-        last_hidden_state = outputs.hidden_states[-1]
-        embedding = last_hidden_state[0, 0, :].cpu().numpy().tolist()
+            if normalize:
+                pooled = torch.nn.functional.normalize(pooled.float(), dim=-1)
+            for index, vector in zip(group, pooled.float().cpu().tolist()):
+                results[index] = vector
+        return results
+    
+    def embed_texts(self, texts: List[str], options: Optional[Dict[str, Any]] = None, **kwargs) -> List[List[float]]:
+        """Generate embeddings for several texts in padded batches."""
+        if not self.model or not self.tokenizer:
+            raise RuntimeError("Llama 2 not initialized")
         
-        return embedding
+        options = dict(options or {}, **kwargs)
+        settings = (options.get('pooling', 'mean'), options.get('normalize', False))
+        futures = [self._embed_batcher.submit((text, settings)) for text in texts]
+        return [future.result() for future in futures]
+    
+    def embed_text(self, text: str, options: Optional[Dict[str, Any]] = None, **kwargs) -> List[float]:
+        """Generate text embeddings using Llama 2's final hidden state."""
+        return self.embed_texts([text], options, **kwargs)[0]
     
     def analyze_image(self, image_data: bytes, prompt: Optional[str] = None, 
                      options: Optional[Dict[str, Any]] = None) -> str:
@@ -112,4 +202,22 @@ class Llama2Adapter(AIModel):
     @property
     def capabilities(self) -> Dict[str, bool]:
         """Return Llama 2's capabilities."""
-        return self._capabilities 
\ No newline at end of file
+        return self._capabilities
+    
+    def close(self) -> None:
+        """Stop the batching workers and drop the model."""
+        for batcher in (self._generate_batcher, self._embed_batcher):
+            if batcher is not None:
+                batcher.close()
+        self.model = None
+        self.tokenizer = None
+    
+    @property
+    def model_info(self) -> Dict[str, Any]:
+        """Return information about the Llama 2 model."""
+        return {
+            "provider": "Meta Llama 2 (transformers)",
+            "model": getattr(self, 'model_name', self.default_model),
+            "type": "Local Large Language Model",
+            "capabilities": self.capabilities
+        }
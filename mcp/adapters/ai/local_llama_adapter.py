@@ -1,13 +1,107 @@
-from typing import Dict, List, Optional, Any
+from typing import Dict, Iterator, List, Optional, Any
 from mcp.core.ai_interface import AIModel
-from llama_cpp import Llama
+from mcp.core.chat_template import ChatTemplate, TokenizedPromptCache
+from mcp.utils.cpu_topology import pinned, resolve_thread_settings
+from mcp.utils.memory_budget import estimate_memory, plan_memory, process_rss_bytes
+from mcp.utils.batcher import DynamicBatcher
+from mcp.utils.request_schema import EMBEDDING_OPTIONS, GENERATION_OPTIONS, SAMPLING_OPTIONS, pick_options
+from llama_cpp import Llama, LogitsProcessorList, LLAMA_POOLING_TYPE_CLS, LLAMA_POOLING_TYPE_LAST, LLAMA_POOLING_TYPE_MEAN
+from contextlib import contextmanager
+import numpy as np
 import os
+import threading
+
+POOLING_TYPES = {
+    'mean': LLAMA_POOLING_TYPE_MEAN,
+    'cls': LLAMA_POOLING_TYPE_CLS,
+    'last': LLAMA_POOLING_TYPE_LAST
+}
+
+_CHAT_OPTIONS = dict(pick_options(
+    GENERATION_OPTIONS, 'temperature', 'max_tokens', 'top_p', 'top_k', 'repeat_penalty'
+), **SAMPLING_OPTIONS)
+
+class LlamaEmbeddingEngine:
+    """Embedding-mode llama.cpp context, separate from the one used for generation.
+    
+    Concurrent requests are collected into batches and evaluated as one multi-sequence
+    batch. Pooling happens in llama.cpp; normalisation is applied to the whole batch in
+    NumPy.
+    """
+    
+    def __init__(self, model_path: str, n_ctx: int = 2048, n_threads: Optional[int] = None,
+                 pooling: str = 'mean', batch_size: int = 32, batch_wait_ms: float = 5.0,
+                 cpu_affinity: Optional[List[int]] = None):
+        if pooling not in POOLING_TYPES:
+            raise ValueError(f"Unknown pooling: {pooling}")
+        self.model_path = model_path
+        self.pooling = pooling
+        self.cpu_affinity = cpu_affinity
+        # A sequence must fit in one micro-batch, so batch and context sizes match
+        with pinned(cpu_affinity):
+            self.llm = Llama(
+                model_path=model_path,
+                embedding=True,
+                n_ctx=n_ctx,
+                n_batch=n_ctx,
+                n_ubatch=n_ctx,
+                n_threads=n_threads,
+                n_threads_batch=n_threads,
+                n_gpu_layers=0,
+                pooling_type=POOLING_TYPES[pooling],
+                logits_all=False,
+                verbose=False
+            )
+        self.dimensions = self.llm.n_embd()
+        self._batcher = DynamicBatcher(
+            self._embed_batch,
+            max_batch_size=batch_size,
+            max_wait_ms=batch_wait_ms,
+            name="local-llama-embed"
+        )
+    
+    def _embed_batch(self, texts: List[str]) -> List[np.ndarray]:
+        # llama.cpp packs as many sequences per decode as fit in n_batch tokens
+        with pinned(self.cpu_affinity):
+            vectors = np.asarray(self.llm.embed(texts, normalize=False, truncate=True), dtype=np.float32)
+        return list(vectors)
+    
+    def embed(self, texts: List[str], normalize: bool = True) -> np.ndarray:
+        """Embed texts into a (len(texts), dimensions) float32 array."""
+        futures = [self._batcher.submit(text) for text in texts]
+        vectors = np.stack([future.result() for future in futures]) if futures else np.empty((0, self.dimensions), np.float32)
+        if normalize:
+            norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+            vectors /= np.maximum(norms, 1e-12)
+        return vectors
+    
+    def close(self) -> None:
+        self._batcher.close()
+        close = getattr(self.llm, 'close', None)
+        if close:
+            close()
 
 class LocalLlamaAdapter(AIModel):
     """Adapter for running Llama models locally using llama.cpp."""
     
+    option_schema = {
+        'generate': _CHAT_OPTIONS,
+        'chat': _CHAT_OPTIONS,
+        'embed': EMBEDDING_OPTIONS
+    }
+    
     def __init__(self):
         self.llm = None
+        self.chat_template = None
+        self.prompt_cache = None
+        self.memory = {}
+        self.embedding_engine = None
+        self.cpu_affinity = None
+        self._embedding_config = {}
+        self._embedding_lock = threading.Lock()
+        # One llama.cpp context serves one request at a time. Not re-entrant, so a
+        # stream may be closed from a thread other than the one that opened it
+        self._inference_lock = threading.Lock()
         self._capabilities = {
             "text_generation": True,
             "chat": True,
@@ -22,102 +116,289 @@ class LocalLlamaAdapter(AIModel):
         if not model_path or not os.path.exists(model_path):
             raise ValueError(f"Model path not found: {model_path}")
         
-        n_ctx = config.get('n_ctx', 2048)
+        threads = resolve_thread_settings(config)
+        self._embedding_config = {
+            'model_path': config.get('embedding_model_path') or model_path,
+            'n_ctx': config.get('embedding_n_ctx', 2048),
+            'n_threads': threads['n_threads_batch'],
+            'pooling': config.get('embedding_pooling', 'mean'),
+            'batch_size': config.get('embedding_batch_size', 32),
+            'batch_wait_ms': config.get('embedding_batch_wait_ms', 5.0),
+            'cpu_affinity': threads['cpu_affinity']
+        }
+        self.cpu_affinity = threads['cpu_affinity']
+        self.normalize_embeddings = config.get('embedding_normalize', True)
+        if not os.path.exists(self._embedding_config['model_path']):
+            raise ValueError(f"Embedding model path not found: {self._embedding_config['model_path']}")
+        if self._embedding_config['pooling'] not in POOLING_TYPES:
+            raise ValueError(f"Unknown embedding pooling: {self._embedding_config['pooling']}")
+        settings = self.memory_settings(config, threads['n_batch'])
+        estimate = settings.pop('estimate')
+        kv_cache_type = settings.pop('kv_cache_type', 'f16')
         
         print(f"Initializing Llama model from: {model_path}")
-        print(f"Context size: {n_ctx}")
+        print(f"Context size: {settings['n_ctx']}")
+        print(f"Threads: {threads['n_threads']} decode, {threads['n_threads_batch']} prompt, batch {threads['n_batch']}")
+        if estimate:
+            print(f"Estimated memory: {estimate['total'] // 2**20} MiB (KV cache {kv_cache_type})")
         
         try:
-            # Initialize with basic configuration
-            self.llm = Llama(
-                model_path=model_path,
-                n_ctx=n_ctx,
-                verbose=True,
-                n_threads=4,     # Use multiple threads
-                n_batch=512,     # Process 512 tokens at a time
-                use_mmap=False,  # Disable memory mapping
-                use_mlock=True,  # Lock memory to prevent swapping
-                n_gpu_layers=0,  # Force CPU usage
-                logits_all=True, # Return all logits
-            )
+            rss_before = process_rss_bytes()
+            with self._inference():
+                self.llm = Llama(
+                    model_path=model_path,
+                    verbose=True,
+                    n_threads=threads['n_threads'],              # Decode threads
+                    n_threads_batch=threads['n_threads_batch'],  # Prompt evaluation threads
+                    n_batch=threads['n_batch'],                  # Prompt tokens per evaluation step
+                    n_gpu_layers=0,  # Force CPU usage
+                    **settings
+                )
+            rss_after = process_rss_bytes()
+            self.memory = {
+                'settings': dict(settings, kv_cache_type=kv_cache_type),
+                'estimated': estimate,
+                'rss_at_load': rss_after - rss_before if rss_before is not None and rss_after is not None else None
+            }
             
             # Test the model initialization
             test_prompt = "Hello"
             print(f"Testing model with prompt: {test_prompt}")
-            test_output = self.llm(
-                test_prompt,
-                max_tokens=1,
-                temperature=0.0,
-                echo=False,
-                logprobs=1,      # Get log probabilities
-                top_p=1.0,       # Use all tokens
-                top_k=0          # No top-k filtering
-            )
+            with self._inference():
+                test_output = self.llm(
+                    test_prompt,
+                    max_tokens=1,
+                    temperature=0.0,
+                    echo=False,
+                    top_p=1.0,       # Use all tokens
+                    top_k=0          # No top-k filtering
+                )
             print(f"Test output: {test_output}")
             
+            # Prefer the chat template embedded in the GGUF file
+            self.chat_template = ChatTemplate.from_llama(self.llm, fallback=config.get('chat_format', 'llama-2'))
+            self.prompt_cache = TokenizedPromptCache.for_llama(self.llm, self.chat_template)
+            print(f"Chat format: {self.chat_template.style}")
+            
             print("Llama model initialized and tested successfully")
         except Exception as e:
             print(f"Error initializing Llama model: {str(e)}")
             raise RuntimeError("Local Llama not initialized")
     
+    @staticmethod
+    def memory_settings(config: Dict[str, Any], n_batch: int = 512) -> Dict[str, Any]:
+        """Choose Llama load settings, fitting them to memory_budget_mb when one is configured."""
+        model_path = config['model_path']
+        n_ctx = config.get('n_ctx', 2048)
+        # Per-position logits are only needed for prompt logprobs
+        logits_all = config.get('logits_all', False)
+        budget_mb = config.get('memory_budget_mb')
+        if budget_mb:
+            return plan_memory(
+                model_path, int(budget_mb) * 2**20, n_ctx, n_batch,
+                logits_all=logits_all, min_ctx=config.get('min_ctx', 512)
+            )
+        
+        try:
+            estimate = estimate_memory(model_path, n_ctx, n_batch, logits_all=logits_all)
+        except ValueError:
+            estimate = None
+        return {
+            'n_ctx': n_ctx,
+            'logits_all': logits_all,
+            'use_mmap': config.get('use_mmap', True),
+            'use_mlock': config.get('use_mlock', False),
+            'estimate': estimate
+        }
+    
+    @classmethod
+    def estimate_memory(cls, config: Dict[str, Any]) -> int:
+        """Estimated bytes needed to load the model with this config, checked before loading."""
+        settings = cls.memory_settings(config, int(config.get('n_batch') or 512))
+        if settings['estimate']:
+            return settings['estimate']['total']
+        return os.path.getsize(config['model_path'])
+    
     def generate_text(self, prompt: str, options: Optional[Dict[str, Any]] = None) -> str:
         """Generate text using local Llama."""
         if not self.llm:
             raise RuntimeError("Local Llama not initialized")
         
-        options = options or {}
-        max_tokens = options.get('max_tokens', 1024)
-        temperature = options.get('temperature', 0.7)
-        
-        # Convert to llama.cpp format
         messages = [
             {"role": "system", "content": "You are a helpful assistant."},
             {"role": "user", "content": prompt}
         ]
+        return self.generate_chat_response(messages, options)
+    
+    def generate_chat_response(self, messages: List[Dict[str, str]], 
+                             options: Optional[Dict[str, Any]] = None, **kwargs) -> Any:
+        """Generate chat response using local Llama.
         
-        # Convert messages to llama.cpp format
-        formatted_prompt = "".join([
-            f"{msg['role']}: {msg['content']}\n" 
-            for msg in messages
-        ])
-        
-        output = self.llm(
-            formatted_prompt,
-            max_tokens=max_tokens,
-            temperature=temperature,
-            echo=False
-        )
+        With n or best_of above 1, a list of the n candidates is returned, best first.
+        """
+        if not self.llm:
+            raise RuntimeError("Local Llama not initialized")
+        
+        options = dict(options or {}, **kwargs)
+        rendered = self.chat_template.render(messages)
+        # History already seen in earlier turns is not re-tokenised
+        tokens = self.prompt_cache.tokens_for(messages, rendered)
+        
+        n = options.get('n', 1)
+        best_of = max(options.get('best_of') or n, n)
+        if best_of > 1:
+            # Held for every sample, so no other request touches the KV cache in between
+            with self._inference():
+                samples = [self._sample(tokens, options) for _ in range(best_of)]
+            if best_of > n:
+                # Highest log-probability per token, as OpenAI ranks best_of
+                samples.sort(key=lambda sample: sample[1] / max(sample[2], 1), reverse=True)
+            return [text for text, _, _ in samples[:n]]
+        
+        with self._inference():
+            output = self.llm(
+                tokens,
+                max_tokens=options.get('max_tokens', 1024),
+                temperature=options.get('temperature', 0.7),
+                stop=self.chat_template.stop,
+                echo=False,
+                **self._sampling_options(options)
+            )
         
         return output['choices'][0]['text']
     
-    def generate_chat_response(self, messages: List[Dict[str, str]], 
-                             options: Optional[Dict[str, Any]] = None) -> str:
-        """Generate chat response using local Llama."""
+    def stream_chat_response(self, messages: List[Dict[str, str]],
+                             options: Optional[Dict[str, Any]] = None, **kwargs) -> Iterator[str]:
+        """Yield the chat response token by token; closing the generator stops generation."""
         if not self.llm:
             raise RuntimeError("Local Llama not initialized")
         
-        # Format messages in chat format
-        formatted_prompt = ""
-        for msg in messages:
-            role = msg["role"]
-            content = msg["content"]
-            if role == "system":
-                formatted_prompt += f"### System:\n{content}\n\n"
-            elif role == "user":
-                formatted_prompt += f"### User:\n{content}\n\n"
-            elif role == "assistant":
-                formatted_prompt += f"### Assistant:\n{content}\n\n"
-        
-        formatted_prompt += "### Assistant:\n"
-        return self.generate_text(formatted_prompt, options)
-    
-    def embed_text(self, text: str, options: Optional[Dict[str, Any]] = None) -> List[float]:
-        """Generate embeddings using local Llama."""
+        options = dict(options or {}, **kwargs)
+        if max(options.get('n', 1), options.get('best_of') or 1) > 1:
+            raise ValueError("n and best_of cannot be used when streaming")
+        tokens = self.prompt_cache.tokens_for(messages, self.chat_template.render(messages))
+        # The context is held until the stream ends, as each chunk continues the same KV cache
+        with self._inference_lock:
+            chunks = self.llm(
+                tokens,
+                max_tokens=options.get('max_tokens', 1024),
+                temperature=options.get('temperature', 0.7),
+                stop=self.chat_template.stop,
+                echo=False,
+                stream=True,
+                **self._sampling_options(options)
+            )
+            try:
+                while True:
+                    # Only the evaluation is pinned, not the consumer between chunks
+                    with pinned(self.cpu_affinity):
+                        chunk = next(chunks, None)
+                    if chunk is None:
+                        return
+                    yield chunk['choices'][0]['text']
+            finally:
+                chunks.close()
+    
+    def count_tokens(self, text: str) -> int:
+        """Number of tokens the model's tokenizer makes of text, without BOS."""
+        if not self.llm:
+            raise RuntimeError("Local Llama not initialized")
+        return len(self.llm.tokenize(text.encode('utf-8'), add_bos=False))
+    
+    def complete_text(self, prompt: str, options: Optional[Dict[str, Any]] = None) -> str:
+        """Continue a raw prompt without applying the chat template."""
         if not self.llm:
             raise RuntimeError("Local Llama not initialized")
         
-        embeddings = self.llm.embed(text)
-        return embeddings.tolist()
+        options = options or {}
+        with self._inference():
+            output = self.llm(
+                prompt,
+                max_tokens=options.get('max_tokens', 1024),
+                temperature=options.get('temperature', 0.7),
+                stop=options.get('stop'),
+                echo=False,
+                **self._sampling_options(options)
+            )
+        
+        return output['choices'][0]['text']
+    
+    @contextmanager
+    def _inference(self) -> Iterator[None]:
+        """Context for running self.llm: exclusive, and pinned to the configured CPUs, if any"""
+        with self._inference_lock, pinned(self.cpu_affinity):
+            yield
+    
+    @staticmethod
+    def _sampling_options(options: Dict[str, Any]) -> Dict[str, Any]:
+        return {key: options[key] for key in ('top_p', 'top_k', 'repeat_penalty') if key in options}
+    
+    def _sample(self, tokens: List[int], options: Dict[str, Any]) -> tuple:
+        """Draw one completion of tokens as (text, log-probability, token count).
+        
+        llama.cpp keeps the longest common prefix of the KV cache between calls, so later
+        samples of the same prompt rewind to the end of the prompt instead of evaluating it again.
+        """
+        eos = self.llm.token_eos()
+        stop = self.chat_template.stop or []
+        max_tokens = options.get('max_tokens', 1024)
+        logits = []
+        
+        def keep_logits(input_ids, scores):
+            # Raw logits for the next token, before temperature and truncation
+            logits.append(scores)
+            return scores
+        
+        generated = []
+        logprob = 0.0
+        text = b''
+        tokens_out = self.llm.generate(
+            tokens,
+            temp=options.get('temperature', 0.7),
+            logits_processor=LogitsProcessorList([keep_logits]),
+            **self._sampling_options(options)
+        )
+        try:
+            for token in tokens_out:
+                if token == eos:
+                    break
+                scores = np.asarray(logits[-1], dtype=np.float64)
+                peak = scores.max()
+                logprob += scores[token] - peak - np.log(np.exp(scores - peak).sum())
+                generated.append(token)
+                text += self.llm.detokenize([token])
+                decoded = text.decode('utf-8', errors='ignore')
+                cut = min((decoded.find(s) for s in stop if s in decoded), default=-1)
+                if cut != -1:
+                    return decoded[:cut], logprob, len(generated)
+                if len(generated) >= max_tokens:
+                    break
+        finally:
+            tokens_out.close()
+        return text.decode('utf-8', errors='ignore'), logprob, len(generated)
+    
+    def _embeddings(self) -> LlamaEmbeddingEngine:
+        """The embedding engine, loaded on first use so chat-only deployments don't pay for it."""
+        if not self.llm:
+            raise RuntimeError("Local Llama not initialized")
+        with self._embedding_lock:
+            if self.embedding_engine is None:
+                # With mmap the weights of a shared GGUF are mapped, not copied, a second time
+                self.embedding_engine = LlamaEmbeddingEngine(**self._embedding_config)
+            return self.embedding_engine
+    
+    def embed_texts(self, texts: List[str], options: Optional[Dict[str, Any]] = None, **kwargs) -> np.ndarray:
+        """Embed several texts with the embedding engine, as a (len(texts), dimensions) array."""
+        options = dict(options or {}, **kwargs)
+        engine = self._embeddings()
+        # Pooling is fixed when the llama.cpp context is created
+        if options.get('pooling', engine.pooling) != engine.pooling:
+            raise ValueError(f"Local embeddings use {engine.pooling} pooling; set embedding_pooling to change it")
+        return engine.embed(texts, normalize=options.get('normalize', self.normalize_embeddings))
+    
+    def embed_text(self, text: str, options: Optional[Dict[str, Any]] = None, **kwargs) -> np.ndarray:
+        """Embed one text with the embedding engine."""
+        return self.embed_texts([text], options, **kwargs)[0]
     
     def analyze_image(self, image_data: bytes, prompt: Optional[str] = None, 
                      options: Optional[Dict[str, Any]] = None) -> str:
@@ -129,6 +410,18 @@ class LocalLlamaAdapter(AIModel):
         """Content moderation is not supported by local Llama."""
         raise NotImplementedError("Local Llama does not support content moderation")
     
+    def close(self) -> None:
+        """Free the llama.cpp model and context."""
+        if self.llm is not None:
+            close = getattr(self.llm, 'close', None)
+            if close:
+                close()
+            self.llm = None
+            self.prompt_cache = None
+        if self.embedding_engine is not None:
+            self.embedding_engine.close()
+            self.embedding_engine = None
+    
     @property
     def capabilities(self) -> Dict[str, bool]:
         """Return local Llama's capabilities."""
@@ -141,5 +434,12 @@ class LocalLlamaAdapter(AIModel):
             "provider": "Local Llama (llama.cpp)",
             "model": getattr(self.llm, 'model_path', 'unknown') if self.llm else 'uninitialized',
             "type": "Local Large Language Model",
-            "capabilities": self.capabilities
+            "capabilities": self.capabilities,
+            "memory": dict(self.memory, rss=process_rss_bytes()),
+            "embeddings": {
+                "model": self._embedding_config.get('model_path'),
+                "pooling": self._embedding_config.get('pooling'),
+                "normalize": getattr(self, 'normalize_embeddings', True),
+                "loaded": self.embedding_engine is not None
+            }
         } 
\ No newline at end of file
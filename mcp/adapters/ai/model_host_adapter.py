@@ -0,0 +1,178 @@
+from typing import Dict, Iterator, List, Optional, Any
+from mcp.core.ai_interface import AIModel
+from mcp.utils.ipc import send_message, recv_message, unpack_vectors
+from mcp.utils.request_schema import EMBEDDING_OPTIONS, GENERATION_OPTIONS, SAMPLING_OPTIONS
+import base64
+import itertools
+import queue
+import socket
+
+# Exceptions raised on the host that keep their type on the client
+_REMOTE_ERRORS = {
+    'ValueError': ValueError,
+    'NotImplementedError': NotImplementedError,
+    'KeyError': LookupError
+}
+
+# Specs for the option names a host reports for its models
+_KNOWN_OPTIONS = dict(GENERATION_OPTIONS, **SAMPLING_OPTIONS, **EMBEDDING_OPTIONS)
+
+class ModelHostAdapter(AIModel):
+    """Thin client for a model served by the out-of-process model host (mcp.model_host)."""
+
+    def __init__(self):
+        self.socket_path = None
+        self.remote_model = None
+        self._connections = None
+        self._ids = itertools.count(1)
+        self._capabilities = {}
+        self._remote_info = {}
+        self._option_schema = {}
+
+    def initialize(self, config: Dict[str, Any]) -> None:
+        """Connect to the model host and fetch the remote model's capabilities."""
+        self.socket_path = config.get('socket_path')
+        if not self.socket_path:
+            raise ValueError("socket_path is required for the model host adapter")
+        self.remote_model = config.get('model', 'local_llama')
+        self.timeout = config.get('timeout', 300.0)
+        # Idle connections are reused so each request skips the connect
+        self._connections = queue.LifoQueue(maxsize=config.get('pool_size', 8))
+
+        hosted = self._call('list_models')
+        if self.remote_model not in hosted:
+            raise ValueError(f"Model host at {self.socket_path} does not serve {self.remote_model}")
+        self._capabilities = hosted[self.remote_model]['capabilities']
+        self._remote_info = hosted[self.remote_model]['model_info']
+        self._option_schema = {
+            route: {name: _KNOWN_OPTIONS[name] for name in names if name in _KNOWN_OPTIONS}
+            for route, names in hosted[self.remote_model].get('options', {}).items()
+        }
+
+    def _connect(self) -> socket.socket:
+        try:
+            return self._connections.get_nowait()
+        except queue.Empty:
+            sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+            sock.settimeout(self.timeout)
+            sock.connect(self.socket_path)
+            return sock
+
+    def _request(self, request: Dict[str, Any]) -> Dict[str, Any]:
+        sock = self._connect()
+        try:
+            send_message(sock, request)
+            reply = recv_message(sock)
+            if reply is None:
+                raise ConnectionError("Model host closed the connection")
+        except Exception:
+            sock.close()
+            raise
+        try:
+            self._connections.put_nowait(sock)
+        except queue.Full:
+            sock.close()
+        return reply
+
+    def _call(self, method: str, *args: Any, **kwargs: Any) -> Any:
+        reply = self._request({
+            'id': next(self._ids),
+            'model': self.remote_model,
+            'method': method,
+            'args': list(args),
+            'kwargs': kwargs
+        })
+        if 'error' in reply:
+            raise _REMOTE_ERRORS.get(reply.get('type'), RuntimeError)(reply['error'])
+        if 'vectors' in reply:
+            return unpack_vectors(reply['vectors'])
+        return reply['result']
+
+    def generate_text(self, prompt: str, options: Optional[Dict[str, Any]] = None, **kwargs) -> str:
+        """Generate text on the model host."""
+        return self._call('generate_text', prompt, dict(options or {}, **kwargs))
+
+    def complete_text(self, prompt: str, options: Optional[Dict[str, Any]] = None) -> str:
+        """Raw completion of the prompt, without a chat template, on the model host."""
+        return self._call('complete_text', prompt, options)
+
+    def generate_chat_response(self, messages: List[Dict[str, str]],
+                             options: Optional[Dict[str, Any]] = None, **kwargs) -> str:
+        """Generate chat response on the model host."""
+        return self._call('generate_chat_response', messages, dict(options or {}, **kwargs))
+
+    def stream_chat_response(self, messages: List[Dict[str, str]],
+                             options: Optional[Dict[str, Any]] = None, **kwargs) -> Iterator[str]:
+        """Stream a chat response from the model host; closing the generator cancels it."""
+        sock = self._connect()
+        finished = False
+        try:
+            send_message(sock, {
+                'id': next(self._ids),
+                'model': self.remote_model,
+                'method': 'stream_chat_response',
+                'args': [messages, options],
+                'kwargs': kwargs
+            })
+            while True:
+                reply = recv_message(sock)
+                if reply is None:
+                    raise ConnectionError("Model host closed the connection")
+                if 'error' in reply:
+                    finished = True
+                    raise _REMOTE_ERRORS.get(reply.get('type'), RuntimeError)(reply['error'])
+                if reply.get('done'):
+                    finished = True
+                    return
+                yield reply['chunk']
+        finally:
+            # An abandoned stream leaves unread chunks on the socket, so it can't be reused
+            if finished:
+                try:
+                    self._connections.put_nowait(sock)
+                except queue.Full:
+                    sock.close()
+            else:
+                sock.close()
+
+    def embed_text(self, text: str, options: Optional[Dict[str, Any]] = None, **kwargs) -> List[float]:
+        """Generate embeddings on the model host."""
+        return self._call('embed_text', text, dict(options or {}, **kwargs))[0]
+
+    def embed_texts(self, texts: List[str], options: Optional[Dict[str, Any]] = None,
+                    **kwargs) -> List[List[float]]:
+        """Generate embeddings for several texts in one round trip."""
+        return self._call('embed_texts', texts, dict(options or {}, **kwargs))
+
+    def analyze_image(self, image_data: bytes, prompt: Optional[str] = None,
+                     options: Optional[Dict[str, Any]] = None) -> str:
+        """Analyze an image on the model host."""
+        return self._call('analyze_image', base64.b64encode(image_data).decode(), prompt, options)
+
+    def moderate_content(self, content: str,
+                        options: Optional[Dict[str, Any]] = None) -> Dict[str, Any]:
+        """Moderate content on the model host."""
+        return self._call('moderate_content', content, options)
+
+    def close(self) -> None:
+        """Close pooled connections; the hosted model stays loaded."""
+        while self._connections is not None:
+            try:
+                self._connections.get_nowait().close()
+            except queue.Empty:
+                break
+
+    @property
+    def capabilities(self) -> Dict[str, bool]:
+        """Return the hosted model's capabilities."""
+        return self._capabilities
+
+    @property
+    def option_schema(self) -> Dict[str, Any]:
+        """Return the request options the hosted model accepts."""
+        return self._option_schema
+
+    @property
+    def model_info(self) -> Dict[str, Any]:
+        """Return information about the hosted model."""
+        return dict(self._remote_info, host=self.socket_path, remote_model=self.remote_model)
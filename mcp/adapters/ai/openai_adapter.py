@@ -1,13 +1,21 @@
-from typing import Dict, Any, List, Optional
+from typing import Dict, Any, Iterator, List, Optional
 import openai
 from openai import OpenAI
 import base64
 
 from ...core.ai_interface import AIModel
+from ...utils.rate_limiter import report_provider_response, report_provider_error
+from ...utils.request_schema import GENERATION_OPTIONS, SAMPLING_OPTIONS, pick_options
+
+_CHAT_OPTIONS = dict(pick_options(
+    GENERATION_OPTIONS, 'temperature', 'max_tokens', 'top_p', 'frequency_penalty', 'presence_penalty', 'seed', 'stop'
+), **SAMPLING_OPTIONS)
 
 class OpenAIAdapter(AIModel):
     """OpenAI implementation of the AI model interface"""
     
+    option_schema = {'generate': _CHAT_OPTIONS, 'chat': _CHAT_OPTIONS}
+    
     def __init__(self):
         self.client = None
         self.model = "gpt-4"
@@ -23,57 +31,107 @@ class OpenAIAdapter(AIModel):
         
     def initialize(self, config: Dict[str, Any]) -> None:
         """Initialize the OpenAI client with configuration"""
-        api_key = config.get('api_key')
         self.model = config.get('model', self.model)
-        # The OpenAI v1.x client does not accept api_key in the constructor
-        # It should be set via environment variable or passed per-request
-        self.client = OpenAI()
+        # Each instance gets its own client so several keys or deployments can be used side by side;
+        # without an api_key the client falls back to OPENAI_API_KEY
+        self.client = OpenAI(
+            api_key=config.get('api_key'),
+            organization=config.get('organization'),
+            base_url=config.get('base_url'),
+            # The adaptive limiter handles 429s; SDK retries would hide them from it and hold the permit
+            max_retries=config.get('max_retries', 0)
+        )
+        
+    def _create(self, resource: Any, **params) -> Any:
+        """Call a create endpoint, passing the rate-limit headers to the adaptive limiter"""
+        raw = resource.with_raw_response.create(**params)
+        report_provider_response(raw.headers, raw.status_code)
+        return raw.parse()
+        
+    def _choices(self, messages: List[Dict[str, Any]], params: Dict[str, Any]) -> tuple:
+        """Create a chat completion with every candidate in one call; returns (response, texts best first)"""
+        n = params.pop('n', 1)
+        best_of = max(params.pop('best_of', None) or n, n)
+        if best_of > 1:
+            params['n'] = best_of
+        if best_of > n:
+            params['logprobs'] = True
+        response = self._create(self.client.chat.completions, model=self.model, messages=messages, **params)
+        choices = list(response.choices)
+        if best_of > n:
+            # Highest log-probability per token, as best_of ranks completions
+            def mean_logprob(choice):
+                tokens = choice.logprobs.content if choice.logprobs and choice.logprobs.content else []
+                return sum(token.logprob for token in tokens) / max(len(tokens), 1)
+            choices.sort(key=mean_logprob, reverse=True)
+        return response, [choice.message.content for choice in choices[:n]]
         
-    def generate_text(self, prompt: str, **kwargs) -> Dict[str, Any]:
+    def generate_text(self, prompt: str, options: Optional[Dict[str, Any]] = None, **kwargs) -> Dict[str, Any]:
         """Generate text using OpenAI's completion API"""
         try:
-            response = self.client.chat.completions.create(
-                model=self.model,
-                messages=[{"role": "user", "content": prompt}],
-                **kwargs
-            )
-            
-            return {
-                "text": response.choices[0].message.content,
+            response, texts = self._choices([{"role": "user", "content": prompt}], dict(options or {}, **kwargs))
+            result = {
+                "text": texts[0],
                 "usage": response.usage.dict() if response.usage else {},
                 "model": response.model
             }
+            if len(texts) > 1:
+                result["choices"] = texts
+            return result
         except Exception as e:
+            report_provider_error(e)
             return {"error": str(e)}
             
     def generate_chat_response(self, messages: List[Dict[str, str]], **kwargs) -> Dict[str, Any]:
         """Generate a response in a chat conversation using OpenAI"""
         try:
-            response = self.client.chat.completions.create(
-                model=self.model,
-                messages=messages,
-                **kwargs
-            )
-            
-            return {
-                "response": response.choices[0].message.content,
+            response, texts = self._choices(messages, dict(kwargs))
+            result = {
+                "response": texts[0],
                 "usage": response.usage.dict() if response.usage else {},
                 "model": response.model
             }
+            if len(texts) > 1:
+                result["choices"] = texts
+            return result
         except Exception as e:
+            report_provider_error(e)
             return {"error": str(e)}
             
-    def embed_text(self, text: str, **kwargs) -> List[float]:
+    def stream_chat_response(self, messages: List[Dict[str, str]], **kwargs) -> Iterator[str]:
+        """Stream a chat response from OpenAI as content deltas"""
+        # Only the first choice is streamed, so further candidates would be paid for and dropped
+        if max(kwargs.get('n', 1), kwargs.get('best_of') or 1) > 1:
+            raise ValueError("n and best_of cannot be used when streaming")
+        kwargs.pop('n', None)
+        kwargs.pop('best_of', None)
+        stream = self.client.chat.completions.create(
+            model=self.model,
+            messages=messages,
+            stream=True,
+            **kwargs
+        )
+        try:
+            for chunk in stream:
+                if chunk.choices and chunk.choices[0].delta.content:
+                    yield chunk.choices[0].delta.content
+        finally:
+            # Closing the HTTP stream stops generation when the client cancels
+            stream.close()
+            
+    def embed_text(self, text: str, **kwargs) -> Any:
         """Generate embeddings using OpenAI's embedding API"""
         try:
-            response = self.client.embeddings.create(
+            response = self._create(
+                self.client.embeddings,
                 model="text-embedding-ada-002",
                 input=text,
                 **kwargs
             )
             return response.data[0].embedding
         except Exception as e:
-            return []
+            report_provider_error(e)
+            return {"error": str(e)}
             
     def analyze_image(self, image_data: bytes, prompt: Optional[str] = None, **kwargs) -> Dict[str, Any]:
         """Analyze an image using OpenAI's GPT-4 Vision API"""
@@ -96,7 +154,8 @@ class OpenAIAdapter(AIModel):
                 }
             ]
             
-            response = self.client.chat.completions.create(
+            response = self._create(
+                self.client.chat.completions,
                 model="gpt-4-vision-preview",
                 messages=messages,
                 max_tokens=300,
@@ -108,14 +167,16 @@ class OpenAIAdapter(AIModel):
                 "model": response.model
             }
         except Exception as e:
+            report_provider_error(e)
             return {"error": str(e)}
             
     def moderate_content(self, content: str) -> Dict[str, Any]:
         """Check content using OpenAI's moderation API"""
         try:
-            response = self.client.moderations.create(input=content)
+            response = self._create(self.client.moderations, input=content)
             return response.results[0].dict()
         except Exception as e:
+            report_provider_error(e)
             return {"error": str(e)}
             
     @property
@@ -0,0 +1,169 @@
+from typing import Dict, Iterator, List, Optional, Any
+from mcp.core.ai_interface import AIModel
+from mcp.core.ai_factory import AIModelFactory
+from mcp.utils.rate_limiter import AdaptiveLimiter, limiter_permit, mark_throttled
+import threading
+import time
+
+# Adapters whose SDK holds one process-wide credential, so members would overwrite each other
+_GLOBAL_CREDENTIAL_TYPES = ('gemini',)
+
+class _Member:
+    def __init__(self, index: int, adapter: AIModel, limiter: AdaptiveLimiter, label: str):
+        self.index = index
+        self.adapter = adapter
+        self.limiter = limiter
+        self.label = label
+        self.ejected_until = 0.0
+        self.ejections = 0
+
+class ProviderPoolAdapter(AIModel):
+    """One model name backed by several accounts or deployments of the same provider.
+
+    Each member has its own client and adaptive rate limit. Calls go to the member with
+    the most headroom; a member that is throttled is ejected for a while and the call is
+    retried on another one.
+    """
+
+    def __init__(self):
+        self.members: List[_Member] = []
+        self.member_type = None
+        self._lock = threading.Lock()
+
+    def initialize(self, config: Dict[str, Any]) -> None:
+        """Create one adapter and limiter per member config."""
+        self.member_type = config.get('member_type')
+        if not self.member_type:
+            raise ValueError("member_type is required for a provider pool")
+        if self.member_type in _GLOBAL_CREDENTIAL_TYPES:
+            raise ValueError(f"{self.member_type} configures its SDK globally, so its credentials cannot be pooled")
+        member_configs = config.get('members') or []
+        if not member_configs:
+            raise ValueError("A provider pool needs at least one member")
+        self.eject_seconds = config.get('eject_seconds', 10.0)
+
+        for index, member_config in enumerate(member_configs):
+            adapter = AIModelFactory.create_model(self.member_type)
+            adapter.initialize(member_config)
+            key = member_config.get('api_key') or ''
+            # Identify members without exposing their keys
+            label = member_config.get('label') or (f"...{key[-4:]}" if key else f"member-{index}")
+            limiter = AdaptiveLimiter(requests_per_minute=member_config.get('requests_per_minute',
+                                                                           config.get('requests_per_minute', 60)))
+            self.members.append(_Member(index, adapter, limiter, label))
+
+    def _choose(self, tried: set) -> Optional[_Member]:
+        """The untried member with most headroom, preferring members that aren't ejected"""
+        now = time.monotonic()
+        candidates = [member for member in self.members if member.index not in tried]
+        if not candidates:
+            return None
+        available = [member for member in candidates if member.ejected_until <= now]
+        if not available:
+            return min(candidates, key=lambda member: member.ejected_until)
+        return max(available, key=lambda member: (member.limiter.headroom(), member.limiter.rate))
+
+    def _eject(self, member: _Member) -> None:
+        with self._lock:
+            member.ejected_until = max(member.ejected_until, time.monotonic() + self.eject_seconds,
+                                       member.limiter.paused_until)
+            member.ejections += 1
+
+    def _call(self, method: str, *args: Any, **kwargs: Any) -> Any:
+        """Run the call on the best member, retrying on the others while members are throttled"""
+        tried: set = set()
+        result = None
+        error: Optional[Exception] = None
+        while True:
+            member = self._choose(tried)
+            if member is None:
+                # Every member pushed back; hand the last answer to the caller, marked as
+                # throttling so the circuit breaker leaves it to the limiters
+                if tried:
+                    mark_throttled()
+                if error is not None:
+                    raise error
+                return result
+            tried.add(member.index)
+            try:
+                with limiter_permit(member.limiter, member.label) as permit:
+                    result = getattr(member.adapter, method)(*args, **kwargs)
+            except Exception as e:
+                if not permit.throttled:
+                    raise
+                error = e
+            else:
+                if not permit.throttled:
+                    return result
+                error = None
+            self._eject(member)
+
+    def generate_text(self, prompt: str, *args, **kwargs) -> Any:
+        """Generate text on the member with most headroom."""
+        return self._call('generate_text', prompt, *args, **kwargs)
+
+    def generate_chat_response(self, messages: List[Dict[str, str]], *args, **kwargs) -> Any:
+        """Generate a chat response on the member with most headroom."""
+        return self._call('generate_chat_response', messages, *args, **kwargs)
+
+    def stream_chat_response(self, messages: List[Dict[str, str]], *args, **kwargs) -> Iterator[str]:
+        """Stream from one member; a stream is not moved once it has started."""
+        member = self._choose(set())
+        throttled = False
+        try:
+            with limiter_permit(member.limiter, member.label) as permit:
+                stream = member.adapter.stream_chat_response(messages, *args, **kwargs)
+                try:
+                    yield from stream
+                finally:
+                    close = getattr(stream, 'close', None)
+                    if close:
+                        close()
+                    throttled = permit.throttled
+                    if throttled:
+                        self._eject(member)
+        finally:
+            # Outside the member's permit, so this marks the caller's
+            if throttled:
+                mark_throttled()
+
+    def embed_text(self, text: str, *args, **kwargs) -> Any:
+        """Embed on the member with most headroom."""
+        return self._call('embed_text', text, *args, **kwargs)
+
+    def analyze_image(self, image_data: bytes, *args, **kwargs) -> Any:
+        """Analyze an image on the member with most headroom."""
+        return self._call('analyze_image', image_data, *args, **kwargs)
+
+    def moderate_content(self, content: str, *args, **kwargs) -> Any:
+        """Moderate content on the member with most headroom."""
+        return self._call('moderate_content', content, *args, **kwargs)
+
+    def close(self) -> None:
+        """Close every member."""
+        for member in self.members:
+            close = getattr(member.adapter, 'close', None)
+            if close:
+                close()
+
+    @property
+    def capabilities(self) -> Dict[str, bool]:
+        """Return the members' capabilities."""
+        return self.members[0].adapter.capabilities if self.members else {}
+
+    @property
+    def option_schema(self) -> Dict[str, Any]:
+        """Return the members' request options."""
+        return getattr(self.members[0].adapter, 'option_schema', {}) if self.members else {}
+
+    @property
+    def model_info(self) -> Dict[str, Any]:
+        """Return the members' model info and per-member limits."""
+        now = time.monotonic()
+        info = dict(self.members[0].adapter.model_info) if self.members else {}
+        info['pool'] = [
+            dict(member.limiter.stats, member=member.label, ejections=member.ejections,
+                 ejected_for=round(max(0.0, member.ejected_until - now), 2))
+            for member in self.members
+        ]
+        return info
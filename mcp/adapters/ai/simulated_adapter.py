@@ -0,0 +1,113 @@
+from typing import Dict, Iterator, List, Optional, Any
+from mcp.core.ai_interface import AIModel
+from mcp.utils.request_schema import EMBEDDING_OPTIONS, GENERATION_OPTIONS
+from mcp.utils.traffic_capture import estimate_tokens
+import hashlib
+import math
+import random
+import time
+
+class SimulatedAdapter(AIModel):
+    """Stand-in model that costs time like a real one but calls no provider.
+
+    Latency is modelled as time to first token plus prompt and output tokens at the
+    configured rates, so replayed traffic loads the server realistically offline.
+    """
+
+    # Replayed traffic may carry any provider's options; only max_tokens changes the cost
+    option_schema = {'generate': GENERATION_OPTIONS, 'chat': GENERATION_OPTIONS, 'embed': EMBEDDING_OPTIONS}
+
+    def __init__(self):
+        self._capabilities = {
+            "text_generation": True,
+            "chat": True,
+            "embeddings": True,
+            "image_analysis": True,
+            "moderation": True
+        }
+
+    def initialize(self, config: Dict[str, Any]) -> None:
+        """Read the latency model from config."""
+        self.name = config.get('name', 'simulated')
+        self.ttft_ms = float(config.get('ttft_ms', 200.0))
+        self.prefill_tokens_per_second = float(config.get('prefill_tokens_per_second', 2000.0))
+        self.tokens_per_second = float(config.get('tokens_per_second', 40.0))
+        self.default_max_tokens = int(config.get('max_tokens', 128))
+        self.embedding_dim = int(config.get('embedding_dim', 768))
+        self.embed_ms = float(config.get('embed_ms', 20.0))
+        self.jitter = float(config.get('jitter', 0.1))
+        self.error_rate = float(config.get('error_rate', 0.0))
+
+    def _sleep(self, seconds: float) -> None:
+        if self.jitter:
+            seconds *= random.uniform(1.0 - self.jitter, 1.0 + self.jitter)
+        time.sleep(max(0.0, seconds))
+
+    def _output_tokens(self, options: Dict[str, Any]) -> int:
+        return int(options.get('max_tokens') or options.get('max_new_tokens') or self.default_max_tokens)
+
+    def _stream(self, prompt_tokens: int, options: Dict[str, Any]) -> Iterator[str]:
+        if self.error_rate and random.random() < self.error_rate:
+            raise RuntimeError("Simulated provider error")
+        self._sleep(self.ttft_ms / 1000 + prompt_tokens / self.prefill_tokens_per_second)
+        for index in range(self._output_tokens(options)):
+            if index:
+                self._sleep(1.0 / self.tokens_per_second)
+            # Four characters per token, matching estimate_tokens
+            yield 'tok '
+
+    def generate_text(self, prompt: str, options: Optional[Dict[str, Any]] = None) -> str:
+        """Wait as long as generating the requested tokens would take and return filler text."""
+        return ''.join(self._stream(estimate_tokens(prompt), options or {}))
+
+    def complete_text(self, prompt: str, options: Optional[Dict[str, Any]] = None) -> str:
+        """Simulate a raw completion."""
+        return self.generate_text(prompt, options)
+
+    def generate_chat_response(self, messages: List[Dict[str, str]],
+                             options: Optional[Dict[str, Any]] = None, **kwargs) -> str:
+        """Simulate a chat response."""
+        return ''.join(self.stream_chat_response(messages, options, **kwargs))
+
+    def stream_chat_response(self, messages: List[Dict[str, str]],
+                             options: Optional[Dict[str, Any]] = None, **kwargs) -> Iterator[str]:
+        """Simulate a streamed chat response, one token at a time."""
+        prompt_tokens = sum(estimate_tokens(str(message.get('content', ''))) for message in messages)
+        return self._stream(prompt_tokens, dict(options or {}, **kwargs))
+
+    def embed_text(self, text: str, options: Optional[Dict[str, Any]] = None, **kwargs) -> List[float]:
+        """Return a deterministic unit vector derived from the text."""
+        self._sleep(self.embed_ms / 1000)
+        seed = int.from_bytes(hashlib.blake2b(text.encode(), digest_size=8).digest(), 'big')
+        rng = random.Random(seed)
+        vector = [rng.gauss(0.0, 1.0) for _ in range(self.embedding_dim)]
+        norm = math.sqrt(sum(value * value for value in vector)) or 1.0
+        return [value / norm for value in vector]
+
+    def analyze_image(self, image_data: bytes, prompt: Optional[str] = None,
+                     options: Optional[Dict[str, Any]] = None) -> str:
+        """Simulate image analysis; the image counts as a fixed number of prompt tokens."""
+        return ''.join(self._stream(estimate_tokens(prompt or '') + 765, options or {}))
+
+    def moderate_content(self, content: str,
+                        options: Optional[Dict[str, Any]] = None) -> Dict[str, Any]:
+        """Simulate moderation; nothing is flagged."""
+        self._sleep(self.embed_ms / 1000)
+        return {"flagged": False, "categories": {}, "category_scores": {}}
+
+    @property
+    def capabilities(self) -> Dict[str, bool]:
+        """Return the simulated capabilities."""
+        return self._capabilities
+
+    @property
+    def model_info(self) -> Dict[str, Any]:
+        """Return the latency model in use."""
+        return {
+            "provider": "Simulated",
+            "model": self.name,
+            "type": "Latency simulation",
+            "ttft_ms": self.ttft_ms,
+            "tokens_per_second": self.tokens_per_second,
+            "capabilities": self.capabilities
+        }
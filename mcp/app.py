@@ -1,10 +1,36 @@
-from flask import Flask, request, jsonify
-from typing import Dict
+from flask import Flask, Response, request, jsonify, g, send_file
+from typing import Dict, Any, Iterator, List, Optional
+from collections import deque
+import hashlib
+import io
+import json
 import os
+import tempfile
+import time
 from dotenv import load_dotenv
 
-from .core.ai_factory import AIModelFactory
-from .core.ai_interface import AIModel
+from .core.model_registry import ModelRegistry, InsufficientMemoryError
+from .core.batch_jobs import BatchJobManager
+from .core.map_reduce import DocumentJobManager, TASKS
+from .core.fanout import FanOut, is_error_result
+from .core.chat_stream import TokenStream
+from .core.single_flight import SingleFlight, request_key
+from .core.bulkhead import BulkheadFullError, bulkheads_from_env
+from .model_host import local_model_configs
+from .utils.rate_limiter import ModelRateLimiter, pool_permit
+from .utils.circuit_breaker import CircuitOpenError, circuit_breakers_from_env
+from .utils.tracing import tracer, SamplingProfiler
+from .utils.request_schema import RequestSchemaRegistry, ValidationError
+from .utils.model_validator import ModelValidator
+from .utils.audit_log import audit_log_from_env
+from .utils.cluster import FORWARDED_HEADER, SESSION_HEADER, cluster_from_env
+from .utils.traffic_capture import CAPTURED_ROUTES, traffic_capture_from_env
+from .utils.moderation_filter import moderation_prefilter_from_env
+
+try:
+    from flask_sock import Sock
+except ImportError:  # WebSocket chat is only served when flask-sock is installed
+    Sock = None
 
 # Load environment variables
 load_dotenv()
@@ -12,50 +38,371 @@ load_dotenv()
 app = Flask(__name__)
 
 # Initialize AI models
-models: Dict[str, AIModel] = {}
+models = ModelRegistry(drain_timeout=float(os.getenv('MODEL_DRAIN_TIMEOUT', '60')))
+
+# Job files go here unless their own directory is set, never into the working directory;
+# each job directory is created when its first job arrives
+DATA_DIR = os.getenv('DATA_DIR') or os.path.join(tempfile.gettempdir(), 'mcp')
+
+# Request schemas are compiled per model and recompiled lazily after a swap
+schemas = RequestSchemaRegistry(
+    max_body_bytes=int(os.getenv('MAX_REQUEST_BYTES', str(1024 * 1024))),
+    max_image_bytes=int(os.getenv('MAX_IMAGE_BYTES', str(10 * 1024 * 1024)))
+)
+models.add_listener(schemas.invalidate)
+# Every hosted entry gets its own adaptive limiter when it is loaded
+models.add_listener(lambda name: ModelRateLimiter.sync_model(name, models.entry_config(name)))
+app.config['MAX_CONTENT_LENGTH'] = max(schemas.max_body_bytes, schemas.max_image_bytes)
+
+# Prompts and completions are queued here and written by a background thread
+audit_log = audit_log_from_env()
+
+# Request shapes (not content) recorded for offline replay when CAPTURE_DIR is set
+traffic_capture = traffic_capture_from_env()
+
+# Per-model circuit breakers fail fast while a provider is erroring or slow
+breakers = circuit_breakers_from_env()
+models.add_listener(breakers.reset)
+
+# Each model gets bounded executors per route, so a slow model can only tie up its own threads
+bulkheads = bulkheads_from_env()
+models.add_listener(bulkheads.reset)
+
+# Identical deterministic requests in flight at the same time share one provider call
+single_flight = SingleFlight()
+COALESCE_REQUESTS = os.getenv('COALESCE_REQUESTS', 'true').lower() == 'true'
+
+# Peers of this node; each session is served by the node owning it on a consistent-hash ring
+cluster = cluster_from_env()
+
+# Local term/classifier pass that answers clear-cut moderation requests without a provider call
+moderation_prefilter = moderation_prefilter_from_env()
+
+def env_model_configs() -> Dict[str, Dict[str, Any]]:
+    """Build the model type and configuration declared through environment variables"""
+    configs = {}
+    openai_keys = [key.strip() for key in os.getenv('OPENAI_API_KEYS', '').split(',') if key.strip()]
+    if len(openai_keys) > 1:
+        # Several accounts behind one name, each with its own client and rate limit
+        configs['openai'] = {'type': 'pool', 'config': {
+            'member_type': 'openai',
+            'members': [{'api_key': key, 'model': os.getenv('OPENAI_MODEL', 'gpt-4')} for key in openai_keys]
+        }}
+    elif os.getenv('OPENAI_API_KEY') or openai_keys:
+        configs['openai'] = {'type': 'openai', 'config': {
+            'api_key': os.getenv('OPENAI_API_KEY') or openai_keys[0],
+            'model': os.getenv('OPENAI_MODEL', 'gpt-4')
+        }}
+    if os.getenv('GEMINI_API_KEY'):
+        configs['gemini'] = {'type': 'gemini', 'config': {
+            'api_key': os.getenv('GEMINI_API_KEY'),
+            'model': os.getenv('GEMINI_MODEL', 'gemini-pro')
+        }}
+    host_socket = os.getenv('MODEL_HOST_SOCKET')
+    if host_socket:
+        # Local models live in a shared model host process instead of every worker
+        for name in os.getenv('MODEL_HOST_MODELS', 'local_llama').split(','):
+            configs[name.strip()] = {'type': 'model_host', 'config': {
+                'socket_path': host_socket,
+                'model': name.strip()
+            }}
+    else:
+        configs.update(local_model_configs())
+    simulated = os.getenv('SIMULATED_MODELS')
+    if simulated:
+        # Replay and load tests: serve these names from latency-only simulated adapters
+        for name in simulated.split(','):
+            configs[name.strip()] = {'type': 'simulated', 'config': {
+                'name': name.strip(),
+                'ttft_ms': float(os.getenv('SIMULATED_TTFT_MS', '200')),
+                'tokens_per_second': float(os.getenv('SIMULATED_TOKENS_PER_SECOND', '40'))
+            }}
+    return configs
 
 def initialize_models():
     """Initialize all configured AI models"""
-    # Initialize OpenAI if configured
-    if os.getenv('OPENAI_API_KEY'):
+    for name, spec in env_model_configs().items():
         try:
-            openai = AIModelFactory.create_model('openai')
-            openai.initialize({
-                'api_key': os.getenv('OPENAI_API_KEY'),
-                'model': os.getenv('OPENAI_MODEL', 'gpt-4')
-            })
-            models['openai'] = openai
+            models.load(name, spec['type'], spec['config'], background=False)
         except Exception as e:
-            print(f"Warning: Failed to initialize OpenAI: {str(e)}")
+            print(f"Warning: Failed to initialize {name}: {str(e)}")
             print("Continuing with other models...")
-        
-    # Initialize Gemini if configured
-    if os.getenv('GEMINI_API_KEY'):
-        gemini = AIModelFactory.create_model('gemini')
-        gemini.initialize({
-            'api_key': os.getenv('GEMINI_API_KEY'),
-            'model': os.getenv('GEMINI_MODEL', 'gemini-pro')
-        })
-        models['gemini'] = gemini
-
-    # Initialize Local Llama if configured
-    if os.getenv('LOCAL_LLAMA_MODEL_PATH'):
-        local_llama = AIModelFactory.create_model('local_llama')
-        local_llama.initialize({
-            'model_path': os.getenv('LOCAL_LLAMA_MODEL_PATH'),
-            'n_gpu_layers': int(os.getenv('LOCAL_LLAMA_N_GPU_LAYERS', '-1')),
-            'n_ctx': int(os.getenv('LOCAL_LLAMA_N_CTX', '2048'))
-        })
-        models['local_llama'] = local_llama
+    schemas.compile_all(models)
+
+def _admin_denied():
+    """Return an error response unless the caller may use the admin API"""
+    token = os.getenv('ADMIN_TOKEN')
+    if token:
+        if request.headers.get('X-Admin-Token') != token:
+            return jsonify({'error': 'Invalid admin token'}), 403
+    elif request.remote_addr not in ('127.0.0.1', '::1'):
+        return jsonify({'error': 'Admin API is only available locally unless ADMIN_TOKEN is set'}), 403
+    return None
+
+@app.before_request
+def _start_request_span():
+    g.trace_token = tracer.start_span('http.request', method=request.method, path=request.path)
+    if traffic_capture and traffic_capture.sampled():
+        g.capture_start = (time.time(), time.perf_counter())
+
+def _session_key() -> Optional[str]:
+    """The key a request is routed by: its session id, or for chats the conversation's opening"""
+    session = request.headers.get(SESSION_HEADER)
+    if session:
+        return session
+    if request.path.endswith('/chat'):
+        data = request.get_json(silent=True)
+        messages = data.get('messages') if isinstance(data, dict) else None
+        if isinstance(messages, list) and messages:
+            # Later turns resend the same system prompt and first user message
+            opening = [m for m in messages if isinstance(m, dict) and m.get('role') == 'system'][:1]
+            opening += [m for m in messages if isinstance(m, dict) and m.get('role') == 'user'][:1]
+            return hashlib.blake2b(json.dumps(opening, sort_keys=True).encode(), digest_size=16).hexdigest()
+    return None
+
+@app.before_request
+def _route_to_owner():
+    if cluster is None or request.method != 'POST':
+        return None
+    if request.headers.get(FORWARDED_HEADER):
+        cluster.count('received')
+        return None
+    if (request.view_args or {}).get('model') is None or request.path.rsplit('/', 1)[-1] not in ('chat', 'generate'):
+        return None
+    key = _session_key()
+    if key is None or cluster.is_local(key):
+        cluster.count('local')
+        return None
+    owner = cluster.owner(key)
+    with tracer.span('cluster.forward', owner=owner):
+        forwarded = cluster.forward(owner, request.method, request.path, request.query_string,
+                                    dict(request.headers), request.get_data())
+    if forwarded is None:
+        cluster.count('local')
+        return None
+    # The owner records the request; capturing it here too would count it twice
+    g.pop('capture_start', None)
+    status, headers, body = forwarded
+    return Response(body, status=status, headers=headers)
+
+@app.after_request
+def _capture_request(response):
+    started = g.pop('capture_start', None)
+    model = (request.view_args or {}).get('model')
+    route = request.path.rsplit('/', 1)[-1]
+    if started is None or model is None or route not in CAPTURED_ROUTES:
+        return response
+    arrived, start = started
+    # Bodies were parsed (and cached) by the handler; nothing here touches the filesystem
+    traffic_capture.record(
+        route, model,
+        request.get_json(silent=True) if request.is_json else None,
+        response.status_code, arrived, (time.perf_counter() - start) * 1000,
+        response=response.get_json(silent=True) if response.is_json else None,
+        image_bytes=request.content_length if route == 'analyze-image' else None
+    )
+    return response
+
+@app.teardown_request
+def _finish_request_span(error=None):
+    tracer.finish_span(g.pop('trace_token', None), error)
+
+@app.route('/cluster/health', methods=['GET'])
+def cluster_health():
+    """Liveness probe used by peers"""
+    return jsonify({'status': 'ok', 'models': list(models)})
 
 @app.route('/api/models', methods=['GET'])
 def list_models():
     """List all available models and their capabilities"""
     model_info = {}
     for name, model in models.items():
-        model_info[name] = model.model_info
+        model_info[name] = dict(model.model_info, circuit=breakers.info(name))
     return jsonify(model_info)
 
+# Errors caused by the request rather than the provider don't count against the breaker
+_CLIENT_ERRORS = (ValidationError, ValueError, NotImplementedError, LookupError)
+
+def _provider_failed(permit, error: Optional[Exception] = None, result: Any = None) -> bool:
+    """Whether a call's outcome counts as a provider failure for the circuit breaker"""
+    if permit is not None and permit.throttled:
+        # Throttling is left to the adaptive rate limiter
+        return False
+    if error is not None:
+        return not isinstance(error, _CLIENT_ERRORS)
+    # Hosted adapters report failures, embeddings included, as {"error": ...}; an empty
+    # embedding is no answer either
+    return is_error_result(result) or (isinstance(result, list) and not result)
+
+def _rate_limit(model: str):
+    """The model's rate limit; provider pools limit each member themselves and report throttling"""
+    entry = models.entry_config(model)
+    if entry and entry['type'] == 'pool':
+        return pool_permit()
+    return ModelRateLimiter.acquire(model)
+
+def _breaker(model: str):
+    """The model's circuit breaker, with thresholds from its entry's "breaker" config"""
+    entry = models.entry_config(model)
+    return breakers.get(model, entry['config'] if entry else None)
+
+def _call_model(model: str, method: str, *args, **kwargs):
+    """Invoke an adapter method under the model's circuit breaker and rate limit, tracing the provider call"""
+    breaker = _breaker(model)
+    breaker.before_call()
+    # Timed from when the call reaches the provider, so waiting for a permit isn't counted as slow
+    start = None
+    permit = None
+    try:
+        with _rate_limit(model) as permit, models.use(model) as instance:
+            start = time.perf_counter()
+            with tracer.span(f'adapter.{method}', model=model, adapter=type(instance).__name__):
+                result = getattr(instance, method)(*args, **kwargs)
+    except Exception as e:
+        duration_ms = (time.perf_counter() - start) * 1000 if start is not None else 0.0
+        breaker.record(_provider_failed(permit, error=e), duration_ms)
+        if audit_log:
+            audit_log.record(model, method, args, kwargs, error=str(e), duration_ms=duration_ms)
+        raise
+    duration_ms = (time.perf_counter() - start) * 1000
+    if is_error_result(result) and permit is not None and (permit.transient or permit.throttled):
+        # Tells callers, batch and document jobs included, that trying again later may work
+        result = dict(result, retryable=True)
+    breaker.record(_provider_failed(permit, result=result), duration_ms)
+    if audit_log:
+        audit_log.record(model, method, args, kwargs, result=result, duration_ms=duration_ms)
+    return result
+
+def _stream_model(model: str, messages: List[Dict[str, str]], options: Dict[str, Any]) -> Iterator[str]:
+    """Stream a chat response under the model's circuit breaker and rate limit, holding the model until the stream ends"""
+    breaker = _breaker(model)
+    breaker.before_call()
+    start = time.perf_counter()
+    chunks: List[str] = []
+    error = None
+    permit = None
+    # Latency for the breaker is time to first chunk, since long answers stream for a while
+    first_chunk_ms = None
+    try:
+        with _rate_limit(model) as permit, models.use(model) as instance:
+            # Timed from when the call reaches the provider, so waiting for a permit isn't counted as slow
+            start = time.perf_counter()
+            with tracer.span('adapter.stream_chat_response', model=model, adapter=type(instance).__name__):
+                stream = instance.stream_chat_response(messages, **options)
+                try:
+                    for chunk in stream:
+                        if first_chunk_ms is None:
+                            first_chunk_ms = (time.perf_counter() - start) * 1000
+                        chunks.append(chunk)
+                        yield chunk
+                finally:
+                    stream.close()
+    except Exception as e:
+        error = str(e)
+        breaker.record(_provider_failed(permit, error=e), (time.perf_counter() - start) * 1000)
+        raise
+    finally:
+        if error is None:
+            # Finished or abandoned by the client; either way the provider answered
+            breaker.record(False, first_chunk_ms if first_chunk_ms is not None else (time.perf_counter() - start) * 1000)
+        if audit_log:
+            audit_log.record(model, 'stream_chat_response', (messages,), options,
+                             result=''.join(chunks), error=error,
+                             duration_ms=(time.perf_counter() - start) * 1000)
+
+def _coalescable(model: str, method: str, options: Dict[str, Any]) -> bool:
+    """Whether identical calls may share one result; a model opts out with "coalesce": false in its config"""
+    if not COALESCE_REQUESTS:
+        return False
+    entry = models.entry_config(model)
+    if entry and entry['config'].get('coalesce') is False:
+        return False
+    # Sampled generations differ on every call; only greedy decoding gives the same answer
+    return method == 'embed_text' or options.get('temperature') == 0
+
+def _audit_follower(model: str, method: str, args: tuple, kwargs: Dict[str, Any]):
+    """Audit callback for a request that joined an identical call, so it is logged like any other"""
+    if not audit_log:
+        return None
+    start = time.perf_counter()
+
+    def joined(result: Any, error: Optional[BaseException]) -> None:
+        audit_log.record(model, method, args, kwargs, result=result if error is None else None,
+                         error=str(error) if error is not None else None,
+                         duration_ms=(time.perf_counter() - start) * 1000, coalesced=True)
+    return joined
+
+def _coalesced_call(model: str, method: str, request_options: Dict[str, Any], *args, **kwargs):
+    """Call the model, joining an identical deterministic call that is already in flight"""
+    if not _coalescable(model, method, request_options):
+        return _call_model(model, method, *args, **kwargs)
+    key = request_key(model, method, args, kwargs)
+    return single_flight.do(model, key, lambda: _call_model(model, method, *args, **kwargs),
+                            joined=_audit_follower(model, method, args, kwargs))
+
+def _coalesced_stream(model: str, messages: List[Dict[str, str]], options: Dict[str, Any]) -> Iterator[str]:
+    """Stream a chat response, subscribing to an identical deterministic stream already in flight"""
+    if not _coalescable(model, 'stream_chat_response', options):
+        return _stream_model(model, messages, options)
+    key = request_key(model, 'stream_chat_response', (messages,), options)
+    # The shared provider stream runs on the model's chat bulkhead behind a bounded buffer
+    return single_flight.stream(model, key, lambda: _stream_model(model, messages, options),
+                                joined=_audit_follower(model, 'stream_chat_response', (messages,), options),
+                                runner=_stream_runner(model), max_buffer=WS_STREAM_BUFFER)
+
+def _bulkheaded(model: str, route: str, call):
+    """Run a model call on the executor reserved for the model and route"""
+    if not bulkheads.enabled:
+        return call()
+    entry = models.entry_config(model)
+    return bulkheads.run(model, route, entry['config'] if entry else None, call)
+
+def _stream_runner(model: str):
+    """Runner producing a stream on the model's chat bulkhead, for TokenStream and shared streams"""
+    return lambda produce: _bulkheaded(model, 'chat', produce)
+
+def _respond(payload, status: int = 200):
+    """Serialise a JSON response inside its own span"""
+    with tracer.span('response.serialize'):
+        return jsonify(payload), status
+
+def _parse_body(model: str, route: str) -> Dict[str, Any]:
+    """Size-check, parse and validate a JSON body against the model's compiled schema"""
+    schema = schemas.get(model, route, models)
+    with tracer.span('request.validate'):
+        schema.check_size(request.content_length)
+    with tracer.span('request.parse'):
+        data = request.get_json(silent=True)
+    with tracer.span('request.validate'):
+        return schema.validate(data)
+
+def _dispatch(model: str, route: str, data: Dict[str, Any]) -> Any:
+    """Run a validated JSON request body against a model and return the response payload"""
+    options = data.get('options', {})
+    if route == 'generate':
+        return _coalesced_call(model, 'generate_text', options, data['prompt'], options=options)
+    if route == 'chat':
+        return _coalesced_call(model, 'generate_chat_response', options, data['messages'], **options)
+    if route == 'embed':
+        embedding = _coalesced_call(model, 'embed_text', options, data['text'], **options)
+        if is_error_result(embedding):
+            return embedding
+        # Local adapters return NumPy arrays
+        return {'embedding': embedding.tolist() if hasattr(embedding, 'tolist') else embedding}
+    if route == 'moderate':
+        if moderation_prefilter:
+            start = time.perf_counter()
+            with tracer.span('moderation.prefilter'):
+                verdict = moderation_prefilter.check(data['content'])
+            if verdict is not None:
+                if audit_log:
+                    # Decided without calling the model, so the entry is logged under the prefilter
+                    audit_log.record('local-prefilter', 'moderate_content', (data['content'],), {},
+                                     result=verdict, duration_ms=(time.perf_counter() - start) * 1000)
+                return verdict
+        return _call_model(model, 'moderate_content', data['content'])
+    raise ValidationError(f"Unsupported route: {route}")
+
 @app.route('/api/<model>/generate', methods=['POST'])
 def generate_text(model: str):
     """Generate text using specified model"""
@@ -63,13 +410,14 @@ def generate_text(model: str):
         return jsonify({'error': f'Model {model} not configured'}), 400
         
     try:
-        data = request.json
-        prompt = data.get('prompt')
-        if not prompt:
-            return jsonify({'error': 'No prompt provided'}), 400
-            
-        result = models[model].generate_text(prompt, options=data.get('options', {}))
-        return jsonify(result)
+        data = _parse_body(model, 'generate')
+        return _respond(_bulkheaded(model, 'generate', lambda: _dispatch(model, 'generate', data)))
+    except ValidationError as e:
+        return jsonify({'error': str(e)}), e.status
+    except CircuitOpenError as e:
+        return jsonify({'error': str(e)}), 503, {'Retry-After': str(max(1, round(e.retry_after)))}
+    except BulkheadFullError as e:
+        return jsonify({'error': str(e)}), 503, {'Retry-After': '1'}
     except Exception as e:
         return jsonify({'error': str(e)}), 500
 
@@ -80,13 +428,14 @@ def chat(model: str):
         return jsonify({'error': f'Model {model} not configured'}), 400
         
     try:
-        data = request.json
-        messages = data.get('messages', [])
-        if not messages:
-            return jsonify({'error': 'No messages provided'}), 400
-            
-        result = models[model].generate_chat_response(messages, **data.get('options', {}))
-        return jsonify(result)
+        data = _parse_body(model, 'chat')
+        return _respond(_bulkheaded(model, 'chat', lambda: _dispatch(model, 'chat', data)))
+    except ValidationError as e:
+        return jsonify({'error': str(e)}), e.status
+    except CircuitOpenError as e:
+        return jsonify({'error': str(e)}), 503, {'Retry-After': str(max(1, round(e.retry_after)))}
+    except BulkheadFullError as e:
+        return jsonify({'error': str(e)}), 503, {'Retry-After': '1'}
     except Exception as e:
         return jsonify({'error': str(e)}), 500
 
@@ -97,13 +446,14 @@ def embed_text(model: str):
         return jsonify({'error': f'Model {model} not configured'}), 400
         
     try:
-        data = request.json
-        text = data.get('text')
-        if not text:
-            return jsonify({'error': 'No text provided'}), 400
-            
-        result = models[model].embed_text(text, **data.get('options', {}))
-        return jsonify({'embedding': result})
+        data = _parse_body(model, 'embed')
+        return _respond(_bulkheaded(model, 'embed', lambda: _dispatch(model, 'embed', data)))
+    except ValidationError as e:
+        return jsonify({'error': str(e)}), e.status
+    except CircuitOpenError as e:
+        return jsonify({'error': str(e)}), 503, {'Retry-After': str(max(1, round(e.retry_after)))}
+    except BulkheadFullError as e:
+        return jsonify({'error': str(e)}), 503, {'Retry-After': '1'}
     except Exception as e:
         return jsonify({'error': str(e)}), 500
 
@@ -114,15 +464,30 @@ def analyze_image(model: str):
         return jsonify({'error': f'Model {model} not configured'}), 400
         
     try:
-        if 'image' not in request.files:
-            return jsonify({'error': 'No image provided'}), 400
-            
-        image_file = request.files['image']
-        image_data = image_file.read()
-        prompt = request.form.get('prompt')
+        schema = schemas.get(model, 'analyze-image', models)
+        with tracer.span('request.validate'):
+            schema.check_size(request.content_length)
+        with tracer.span('request.parse'):
+            if 'image' not in request.files:
+                return jsonify({'error': 'No image provided'}), 400
+                
+            image_file = request.files['image']
+            image_data = image_file.read()
+            prompt = request.form.get('prompt')
+        with tracer.span('request.validate'):
+            if prompt:
+                schema.check_field(prompt)
+            if not ModelValidator.validate_image_data(image_data, schema.max_body_bytes // (1024 * 1024)):
+                return jsonify({'error': 'Invalid or oversized image'}), 400
         
-        result = models[model].analyze_image(image_data, prompt)
-        return jsonify(result)
+        result = _bulkheaded(model, 'analyze-image', lambda: _call_model(model, 'analyze_image', image_data, prompt))
+        return _respond(result)
+    except ValidationError as e:
+        return jsonify({'error': str(e)}), e.status
+    except CircuitOpenError as e:
+        return jsonify({'error': str(e)}), 503, {'Retry-After': str(max(1, round(e.retry_after)))}
+    except BulkheadFullError as e:
+        return jsonify({'error': str(e)}), 503, {'Retry-After': '1'}
     except Exception as e:
         return jsonify({'error': str(e)}), 500
 
@@ -133,16 +498,401 @@ def moderate_content(model: str):
         return jsonify({'error': f'Model {model} not configured'}), 400
         
     try:
-        data = request.json
-        content = data.get('content')
-        if not content:
-            return jsonify({'error': 'No content provided'}), 400
-            
-        result = models[model].moderate_content(content)
-        return jsonify(result)
+        data = _parse_body(model, 'moderate')
+        return _respond(_bulkheaded(model, 'moderate', lambda: _dispatch(model, 'moderate', data)))
+    except ValidationError as e:
+        return jsonify({'error': str(e)}), e.status
+    except CircuitOpenError as e:
+        return jsonify({'error': str(e)}), 503, {'Retry-After': str(max(1, round(e.retry_after)))}
+    except BulkheadFullError as e:
+        return jsonify({'error': str(e)}), 503, {'Retry-After': '1'}
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+def _run_batch_line(model: str, route: str, data: Dict[str, Any]) -> Any:
+    """Validate and run one line of a batch job"""
+    if model not in models:
+        raise ValueError(f'Model {model} not configured')
+    data = schemas.get(model, route, models).validate(data)
+    # Batch lines share the model's bulkhead with live requests; a full one is retried with backoff
+    return _bulkheaded(model, route, lambda: _dispatch(model, route, data))
+
+batch_jobs = BatchJobManager(
+    os.getenv('BATCH_JOBS_DIR') or os.path.join(DATA_DIR, 'batch_jobs'),
+    _run_batch_line,
+    workers=int(os.getenv('BATCH_WORKERS', '4')),
+    max_attempts=int(os.getenv('BATCH_MAX_ATTEMPTS', '5'))
+)
+
+@app.route('/api/batch', methods=['POST'])
+def create_batch_job():
+    """Upload a JSONL file of generate/chat/embed requests and start a batch job"""
+    model = request.args.get('model')
+    if model and model not in models:
+        return jsonify({'error': f'Model {model} not configured'}), 400
+        
+    try:
+        upload = request.files['file'].stream if 'file' in request.files else request.stream
+        job = batch_jobs.create_job(upload, model=model)
+        return jsonify(job.state), 202
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+@app.route('/api/batch/<job_id>', methods=['GET'])
+def batch_job_status(job_id: str):
+    """Show status and progress of a batch job"""
+    job = batch_jobs.get(job_id)
+    if job is None:
+        return jsonify({'error': f'Batch job {job_id} not found'}), 404
+    return jsonify(job.state)
+
+@app.route('/api/batch/<job_id>/results', methods=['GET'])
+def batch_job_results(job_id: str):
+    """Download the results written so far as JSONL"""
+    job = batch_jobs.get(job_id)
+    if job is None or not os.path.exists(job.output_path):
+        return jsonify({'error': f'No results for batch job {job_id}'}), 404
+    return send_file(os.path.abspath(job.output_path), mimetype='application/x-ndjson')
+
+@app.route('/api/batch/<job_id>/cancel', methods=['POST'])
+def cancel_batch_job(job_id: str):
+    """Stop submitting new lines of a running batch job"""
+    job = batch_jobs.cancel(job_id)
+    if job is None:
+        return jsonify({'error': f'Batch job {job_id} is not running'}), 404
+    return jsonify(job.state)
+
+def _document_step(model: str, prompt: str, options: Dict[str, Any]) -> Any:
+    """Run one map or reduce prompt of a document job; the job takes the text or error out of the result"""
+    return _bulkheaded(model, 'generate', lambda: _dispatch(model, 'generate', {'prompt': prompt, 'options': options}))
+
+DOCUMENT_WORKERS = int(os.getenv('DOCUMENT_WORKERS', '8'))
+DOCUMENT_CHUNK_TOKENS = int(os.getenv('DOCUMENT_CHUNK_TOKENS', '1024'))
+
+def _document_tokens(targets: List[str], text: str) -> Optional[int]:
+    """Most tokens any of the models' tokenizers makes of text; None if none of them has one"""
+    counts = []
+    for name in targets:
+        if name not in models:
+            continue
+        with models.use(name) as instance:
+            count_tokens = getattr(instance, 'count_tokens', None)
+            if count_tokens is not None:
+                counts.append(count_tokens(text))
+    return max(counts, default=None)
+
+document_jobs = DocumentJobManager(
+    os.getenv('DOCUMENT_JOBS_DIR') or os.path.join(DATA_DIR, 'document_jobs'),
+    _document_step,
+    workers=DOCUMENT_WORKERS,
+    max_attempts=int(os.getenv('DOCUMENT_MAX_ATTEMPTS', '5')),
+    count_tokens=_document_tokens
+)
+
+def _context_tokens(model: str) -> Optional[int]:
+    """Context window of a local model, if it reports one"""
+    info = models[model].model_info
+    settings = (info.get('memory') or {}).get('settings') or {}
+    return settings.get('n_ctx') or info.get('n_ctx')
+
+def _document_params(params: Dict[str, Any]) -> Dict[str, Any]:
+    """Validate the settings of a document job, filling in defaults"""
+    task = params.get('task', 'summarize')
+    if task not in TASKS:
+        raise ValidationError(f"task must be one of: {', '.join(TASKS)}")
+    if task == 'extract' and not params.get('instructions'):
+        raise ValidationError("instructions are required for extraction")
+    targets = params.get('models') or params.get('model') or []
+    if isinstance(targets, str):
+        targets = [name.strip() for name in targets.split(',') if name.strip()]
+    if not isinstance(targets, list) or not targets:
+        raise ValidationError("No models provided")
+    missing = [name for name in targets if name not in models]
+    if missing:
+        raise ValidationError(f'Models not configured: {", ".join(map(str, missing))}')
+    options = params.get('options') or {}
+    if isinstance(options, str):
+        options = json.loads(options)
+    for name in targets:
+        # Every step is a generate call, so the generate schema checks capability and options
+        schemas.get(name, 'generate', models).validate({'prompt': '-', 'options': options})
+
+    # Leave half of the smallest local context for instructions and the output
+    contexts = [ctx for ctx in map(_context_tokens, targets) if ctx]
+    chunk_tokens = int(params.get('chunk_tokens') or min([DOCUMENT_CHUNK_TOKENS] + [ctx // 2 for ctx in contexts]))
+    overlap_tokens = int(params.get('overlap_tokens') or chunk_tokens // 10)
+    fan_in = int(params.get('fan_in') or 4)
+    if chunk_tokens < 64:
+        raise ValidationError("chunk_tokens must be at least 64")
+    if contexts and chunk_tokens > min(contexts) // 2:
+        raise ValidationError(f"chunk_tokens must be at most {min(contexts) // 2}, "
+                              f"half the smallest context window of the models")
+    if fan_in < 2:
+        raise ValidationError("fan_in must be at least 2")
+    return {
+        'task': task,
+        'instructions': params.get('instructions'),
+        'models': targets,
+        'options': options,
+        'chunk_tokens': chunk_tokens,
+        'overlap_tokens': max(0, overlap_tokens),
+        'fan_in': fan_in,
+        'window': DOCUMENT_WORKERS * 2
+    }
+
+@app.route('/api/documents', methods=['POST'])
+def create_document_job():
+    """Summarise or extract from a document larger than a model's context window"""
+    try:
+        if 'file' in request.files:
+            # Uploads are spooled to disk without being read into memory
+            params = _document_params(request.form.to_dict())
+            source = request.files['file'].stream
+        else:
+            data = request.get_json(silent=True)
+            if not isinstance(data, dict) or not isinstance(data.get('text'), str):
+                return jsonify({'error': "Send a JSON body with 'text' or upload a 'file'"}), 400
+            params = _document_params(data)
+            source = io.StringIO(data['text'])
+        job = document_jobs.create_job(source, params)
+        return jsonify(job.state), 202
+    except ValidationError as e:
+        return jsonify({'error': str(e)}), e.status
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+@app.route('/api/documents/<job_id>', methods=['GET'])
+def document_job_status(job_id: str):
+    """Show progress of a document job, and its result once completed"""
+    job = document_jobs.get(job_id)
+    if job is None:
+        return jsonify({'error': f'Document job {job_id} not found'}), 404
+    return jsonify(job.state)
+
+@app.route('/api/documents/<job_id>/cancel', methods=['POST'])
+def cancel_document_job(job_id: str):
+    """Stop a running document job"""
+    job = document_jobs.cancel(job_id)
+    if job is None:
+        return jsonify({'error': f'Document job {job_id} not found'}), 404
+    return jsonify(job.state)
+
+WS_STREAM_BUFFER = int(os.getenv('WS_STREAM_BUFFER', '64'))
+WS_MAX_PENDING = 16
+
+def _ws_send(ws, **message):
+    ws.send(json.dumps(message))
+
+def _ws_stream_turn(ws, model: str, messages: List[Dict[str, str]], options: Dict[str, Any],
+                    pending: deque) -> Optional[str]:
+    """Send one generated reply token by token, watching the socket for a cancel request"""
+    # A slow reader fills the bounded buffer, which pauses generation rather than queueing output
+    # The reply is generated on the model's chat bulkhead, holding one of its workers until it ends.
+    # A coalesced reply only follows a shared stream, which takes the bulkhead worker itself.
+    coalesced = _coalescable(model, 'stream_chat_response', options)
+    stream = TokenStream(lambda: _coalesced_stream(model, messages, options),
+                         max_buffer=WS_STREAM_BUFFER, name=f'ws-{model}',
+                         runner=None if coalesced else _stream_runner(model)).start()
+    try:
+        while not stream.finished:
+            chunk = stream.get(timeout=0.05)
+            if chunk:
+                _ws_send(ws, type='token', text=chunk)
+            incoming = ws.receive(timeout=0)
+            if incoming is None:
+                continue
+            try:
+                event = json.loads(incoming)
+            except ValueError:
+                event = None
+            if isinstance(event, dict) and event.get('type') == 'cancel':
+                stream.cancel()
+                break
+            # Other frames wait until this reply is finished
+            if len(pending) >= WS_MAX_PENDING:
+                _ws_send(ws, type='error', error='Too many frames queued behind the current reply')
+            else:
+                pending.append(incoming)
+    finally:
+        stream.close()
+    if stream.error is not None:
+        _ws_send(ws, type='error', error=str(stream.error))
+        return None
+    _ws_send(ws, type='done', response=stream.text, cancelled=stream.cancelled)
+    return stream.text
+
+def chat_socket(ws, model: str):
+    """Long-lived chat: turns are sent incrementally and replies streamed back over one WebSocket"""
+    try:
+        if model not in models:
+            raise ValidationError(f'Model {model} not configured')
+        # Replies are streamed, so only the options a stream can honour are accepted
+        schema = schemas.get(model, 'chat-stream', models)
+        schema.check_size(None)
+    except ValidationError as e:
+        _ws_send(ws, type='error', error=str(e))
+        return
+
+    # The conversation lives on the connection, so clients only send new turns
+    history: List[Dict[str, str]] = []
+    pending: deque = deque()
+    while True:
+        try:
+            event = json.loads(pending.popleft() if pending else ws.receive())
+        except ValueError:
+            event = None
+        if not isinstance(event, dict):
+            _ws_send(ws, type='error', error='Each frame must be a JSON object')
+            continue
+
+        kind = event.get('type', 'message')
+        if kind == 'reset':
+            history = [message for message in history if message['role'] == 'system']
+        elif kind == 'system':
+            history = [message for message in history if message['role'] != 'system']
+            history.insert(0, {'role': 'system', 'content': event.get('content')})
+        elif kind == 'message':
+            conversation = history + [{'role': event.get('role', 'user'), 'content': event.get('content')}]
+            # Oldest turns are dropped once the conversation outgrows the message limit
+            while len(conversation) > schema.max_field_length:
+                oldest = next(i for i, message in enumerate(conversation) if message['role'] != 'system')
+                del conversation[oldest]
+            try:
+                data = schema.validate({'messages': conversation, 'options': event.get('options')})
+            except ValidationError as e:
+                _ws_send(ws, type='error', error=str(e))
+                continue
+            with tracer.span('ws.turn', model=model, messages=len(conversation)):
+                reply = _ws_stream_turn(ws, model, conversation, data.get('options') or {}, pending)
+            if reply is not None:
+                # Partial replies of cancelled turns are kept, as the client has already shown them
+                history = conversation + [{'role': 'assistant', 'content': reply}]
+        elif kind != 'cancel':
+            _ws_send(ws, type='error', error=f"Unknown frame type '{kind}'")
+
+if Sock is not None:
+    app.config.setdefault('SOCK_SERVER_OPTIONS', {'ping_interval': 25})
+    Sock(app).route('/api/<model>/chat/ws')(chat_socket)
+
+fanout = FanOut(max_workers=int(os.getenv('FANOUT_WORKERS', '32')))
+
+@app.route('/api/fanout', methods=['POST'])
+def fan_out():
+    """Send one request to several models concurrently"""
+    data = request.get_json(silent=True)
+    if not isinstance(data, dict):
+        return jsonify({'error': 'Request body must be a JSON object'}), 400
+        
+    targets = data.get('models') or []
+    route = data.get('route', 'generate')
+    mode = data.get('mode', 'all')
+    timeout = data.get('timeout')
+    if not isinstance(targets, list) or not targets:
+        return jsonify({'error': 'No models provided'}), 400
+    missing = [name for name in targets if name not in models]
+    if missing:
+        return jsonify({'error': f'Models not configured: {", ".join(map(str, missing))}'}), 400
+    if mode not in ('all', 'first'):
+        return jsonify({'error': "mode must be 'all' or 'first'"}), 400
+    if timeout is not None and (not isinstance(timeout, (int, float)) or timeout <= 0):
+        return jsonify({'error': 'timeout must be a positive number of seconds'}), 400
+        
+    try:
+        # Validate against every target before any provider is called
+        payloads = {name: schemas.get(name, route, models).validate(data) for name in targets}
+        calls = {name: (lambda name=name: _bulkheaded(name, route, lambda: _dispatch(name, route, payloads[name])))
+                 for name in targets}
+        if mode == 'first':
+            result = fanout.first(calls, timeout)
+            return _respond(result, 200 if 'result' in result else 502)
+        return _respond(fanout.all(calls, timeout))
+    except ValidationError as e:
+        return jsonify({'error': str(e)}), e.status
     except Exception as e:
         return jsonify({'error': str(e)}), 500
 
+@app.route('/admin/models', methods=['GET'])
+def admin_model_status():
+    """Show load state and in-flight requests for every model"""
+    denied = _admin_denied()
+    if denied:
+        return denied
+    return jsonify(models.status())
+
+@app.route('/admin/models/<name>', methods=['PUT', 'POST'])
+def admin_load_model(name: str):
+    """Load a new model or replace an existing one without restarting"""
+    denied = _admin_denied()
+    if denied:
+        return denied
+        
+    data = request.json or {}
+    # Start from the current (or environment) settings so callers only send what changes
+    base = models.entry_config(name) or env_model_configs().get(name) or {}
+    model_type = data.get('type') or base.get('type')
+    if not model_type:
+        return jsonify({'error': 'No model type provided'}), 400
+    config = dict(base.get('config', {})) if model_type == base.get('type') else {}
+    config.update(data.get('config', {}))
+    
+    try:
+        status = models.load(name, model_type, config, background=not data.get('wait', False))
+    except InsufficientMemoryError as e:
+        return jsonify({'error': str(e)}), 507
+    except (ValueError, OSError) as e:
+        return jsonify({'error': str(e)}), 400
+    except RuntimeError as e:
+        return jsonify({'error': str(e)}), 409
+    return jsonify(status), 200 if status.get('state') == 'ready' else 202
+
+@app.route('/admin/models/<name>', methods=['DELETE'])
+def admin_unload_model(name: str):
+    """Unload a model after draining its in-flight requests"""
+    denied = _admin_denied()
+    if denied:
+        return denied
+    if name not in models:
+        return jsonify({'error': f'Model {name} not configured'}), 404
+        
+    models.unload(name)
+    return jsonify(models.status(name))
+
+@app.route('/admin/stats', methods=['GET'])
+def admin_stats():
+    """Report counters of the background subsystems"""
+    denied = _admin_denied()
+    if denied:
+        return denied
+    return jsonify({
+        'audit_log': audit_log.stats if audit_log else None,
+        'moderation_prefilter': moderation_prefilter.stats if moderation_prefilter else None,
+        'rate_limits': ModelRateLimiter.stats(),
+        'circuit_breakers': {name: breakers.info(name) for name in models},
+        'coalescing': single_flight.stats,
+        'bulkheads': bulkheads.stats,
+        'traffic_capture': traffic_capture.stats if traffic_capture else None,
+        'cluster': cluster.stats if cluster else None
+    })
+
+@app.route('/admin/profile', methods=['POST'])
+def admin_profile():
+    """Run the sampling profiler for N seconds and return the profile"""
+    denied = _admin_denied()
+    if denied:
+        return denied
+        
+    seconds = min(float(request.args.get('seconds', 10)), 300.0)
+    interval_ms = float(request.args.get('interval_ms', 5))
+    try:
+        profile = SamplingProfiler(interval_ms=interval_ms).run(seconds)
+    except RuntimeError as e:
+        return jsonify({'error': str(e)}), 409
+    if request.args.get('format') == 'folded':
+        return profile['folded'], 200, {'Content-Type': 'text/plain'}
+    return jsonify(profile)
+
 def main():
     import argparse
     parser = argparse.ArgumentParser()
@@ -154,6 +904,10 @@ def main():
         print("Warning: No AI models configured!")
         print("Please set up at least one model's API key in environment variables.")
         return
+    
+    resumed = batch_jobs.resume()
+    if resumed:
+        print(f"Resumed {resumed} unfinished batch job(s)")
         
     app.run(port=args.port)
     debug = os.getenv('DEBUG', 'false').lower() == 'true'
@@ -1,33 +1,73 @@
-from typing import Dict, Type
+from typing import Dict, Type, Union
+from importlib import import_module
+import threading
 
 from ..core.ai_interface import AIModel
-from ..adapters.ai.openai_adapter import OpenAIAdapter
-from ..adapters.ai.gemini_adapter import GeminiAdapter
-from ..adapters.ai.local_llama_adapter import LocalLlamaAdapter
+
+# Installed packages can contribute adapters through this entry point group, e.g.
+# [project.entry-points."mcp.adapters"] my_model = "my_package.adapter:MyAdapter"
+ENTRY_POINT_GROUP = 'mcp.adapters'
 
 class AIModelFactory:
     """Factory class for creating AI model instances"""
-    
-    _models: Dict[str, Type[AIModel]] = {
-        'openai': OpenAIAdapter,
-        'gemini': GeminiAdapter,
-        'local_llama': LocalLlamaAdapter
+
+    # Adapters are registered by dotted path and only imported by create_model,
+    # so importing the factory never pulls in a provider SDK
+    _models: Dict[str, Union[str, Type[AIModel]]] = {
+        'openai': 'mcp.adapters.ai.openai_adapter:OpenAIAdapter',
+        'gemini': 'mcp.adapters.ai.gemini_adapter:GeminiAdapter',
+        'local_llama': 'mcp.adapters.ai.local_llama_adapter:LocalLlamaAdapter',
+        'llama2': 'mcp.adapters.ai.llama_adapter:Llama2Adapter',
+        'claude': 'mcp.adapters.ai.claude_adapter:ClaudeAdapter',
+        'model_host': 'mcp.adapters.ai.model_host_adapter:ModelHostAdapter',
+        'simulated': 'mcp.adapters.ai.simulated_adapter:SimulatedAdapter',
+        'pool': 'mcp.adapters.ai.pool_adapter:ProviderPoolAdapter'
     }
-    
+    _entry_points_loaded = False
+    _lock = threading.Lock()
+
     @classmethod
-    def register_model(cls, name: str, model_class: Type[AIModel]) -> None:
-        """Register a new AI model type"""
+    def register_model(cls, name: str, model_class: Union[str, Type[AIModel]]) -> None:
+        """Register a new AI model type by class or by 'package.module:ClassName' path"""
         cls._models[name] = model_class
-    
+
     @classmethod
-    def create_model(cls, model_type: str) -> AIModel:
-        """Create a new AI model instance"""
+    def _load_entry_points(cls) -> None:
+        """Add adapters advertised by installed packages without importing them"""
+        with cls._lock:
+            if cls._entry_points_loaded:
+                return
+            # importlib.metadata is slow to import; only pay for it when needed
+            from importlib.metadata import entry_points
+            for entry_point in entry_points(group=ENTRY_POINT_GROUP):
+                cls._models.setdefault(entry_point.name, entry_point.value)
+            cls._entry_points_loaded = True
+
+    @classmethod
+    def get_model_class(cls, model_type: str) -> Type[AIModel]:
+        """Return the adapter class registered for a model type, importing it on first use"""
+        if model_type not in cls._models:
+            cls._load_entry_points()
         if model_type not in cls._models:
             raise ValueError(f"Unknown model type: {model_type}")
-            
-        return cls._models[model_type]()
-    
+
+        model_class = cls._models[model_type]
+        if isinstance(model_class, str):
+            module_name, _, class_name = model_class.partition(':')
+            try:
+                model_class = getattr(import_module(module_name), class_name)
+            except ImportError as e:
+                raise ValueError(f"Model type {model_type} is unavailable: {str(e)}") from e
+            cls._models[model_type] = model_class
+        return model_class
+
+    @classmethod
+    def create_model(cls, model_type: str) -> AIModel:
+        """Create a new AI model instance"""
+        return cls.get_model_class(model_type)()
+
     @classmethod
-    def list_available_models(cls) -> Dict[str, Type[AIModel]]:
-        """Return a dictionary of available models"""
-        return cls._models.copy() 
\ No newline at end of file
+    def list_available_models(cls) -> Dict[str, Union[str, Type[AIModel]]]:
+        """Return registered model types; adapters not yet imported are listed by path"""
+        cls._load_entry_points()
+        return cls._models.copy()
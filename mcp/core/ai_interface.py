@@ -1,9 +1,13 @@
 from abc import ABC, abstractmethod
-from typing import Dict, Any, Optional, List
+from typing import Dict, Any, Iterator, Optional, List
 
 class AIModel(ABC):
     """Abstract base class for AI model implementations"""
     
+    # Route -> {option: spec} of the request options the model honours; requests
+    # carrying any other option are rejected (see mcp.utils.request_schema)
+    option_schema: Dict[str, Dict[str, tuple]] = {}
+    
     @abstractmethod
     def initialize(self, config: Dict[str, Any]) -> None:
         """Initialize the AI model with configuration"""
@@ -19,6 +23,15 @@ class AIModel(ABC):
         """Generate a response in a chat conversation"""
         pass
     
+    def stream_chat_response(self, messages: List[Dict[str, str]], **kwargs) -> Iterator[str]:
+        """Yield the chat response in chunks as it is generated; by default the whole response at once"""
+        result = self.generate_chat_response(messages, **kwargs)
+        if isinstance(result, dict):
+            if result.get('error'):
+                raise RuntimeError(result['error'])
+            result = result.get('response', '')
+        yield result
+    
     @abstractmethod
     def embed_text(self, text: str, **kwargs) -> List[float]:
         """Generate embeddings for the given text"""
@@ -34,6 +47,10 @@ class AIModel(ABC):
         """Check content for potential violations or inappropriate content"""
         pass
     
+    def close(self) -> None:
+        """Release resources held by the model"""
+        pass
+    
     @property
     @abstractmethod
     def capabilities(self) -> Dict[str, bool]:
@@ -0,0 +1,270 @@
+from typing import Dict, Any, BinaryIO, Callable, Iterator, List, Optional, Set, Tuple
+from concurrent.futures import Future, ThreadPoolExecutor
+import json
+import os
+import random
+import shutil
+import threading
+import time
+import uuid
+
+from .fanout import is_error_result, is_transient
+
+# Statuses a job can be resumed from after a restart
+RESUMABLE = ('queued', 'running')
+
+
+class BatchJob:
+    """A JSONL batch of generate/chat/embed requests processed in the background"""
+
+    def __init__(self, directory: str, state: Dict[str, Any]):
+        self.directory = directory
+        self.state = state
+        self.lock = threading.Lock()
+        self.cancelled = threading.Event()
+        self._last_saved = 0.0
+
+    @property
+    def id(self) -> str:
+        return self.state['id']
+
+    @property
+    def input_path(self) -> str:
+        return os.path.join(self.directory, 'input.jsonl')
+
+    @property
+    def output_path(self) -> str:
+        return os.path.join(self.directory, 'output.jsonl')
+
+    def save(self, force: bool = True) -> None:
+        """Persist progress atomically; throttled unless forced"""
+        now = time.monotonic()
+        if not force and now - self._last_saved < 1.0:
+            return
+        self._last_saved = now
+        path = os.path.join(self.directory, 'state.json')
+        with open(path + '.tmp', 'w') as f:
+            json.dump(self.state, f)
+        os.replace(path + '.tmp', path)
+
+    def completed_lines(self) -> Tuple[Set[int], int]:
+        """Read which input lines already have a result (and how many failed), dropping a torn final write"""
+        done: Set[int] = set()
+        failed = 0
+        if not os.path.exists(self.output_path):
+            return done, failed
+        valid_bytes = 0
+        with open(self.output_path, 'rb') as f:
+            for raw in f:
+                if not raw.endswith(b'\n'):
+                    break
+                try:
+                    record = json.loads(raw)
+                    done.add(record['line'])
+                except (ValueError, KeyError):
+                    break
+                failed += 'error' in record
+                valid_bytes += len(raw)
+        with open(self.output_path, 'r+b') as f:
+            f.truncate(valid_bytes)
+        return done, failed
+
+
+class BatchJobManager:
+    """Runs offline batch jobs through a worker pool, resuming unfinished jobs after a crash"""
+
+    def __init__(self, directory: str, invoke: Callable[[str, str, Dict[str, Any]], Any],
+                 workers: int = 4, default_model: Optional[str] = None, max_attempts: int = 5,
+                 retry_delay: float = 1.0, max_retry_delay: float = 60.0):
+        self.directory = directory
+        self.invoke = invoke
+        self.workers = workers
+        self.default_model = default_model
+        self.max_attempts = max_attempts
+        self.retry_delay = retry_delay
+        self.max_retry_delay = max_retry_delay
+        self._jobs: Dict[str, BatchJob] = {}
+        self._lock = threading.Lock()
+        self._executor: Optional[ThreadPoolExecutor] = None
+
+    def _pool(self) -> ThreadPoolExecutor:
+        with self._lock:
+            if self._executor is None:
+                self._executor = ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix='batch-worker')
+            return self._executor
+
+    def create_job(self, upload: BinaryIO, model: Optional[str] = None) -> BatchJob:
+        """Store an uploaded JSONL file and start processing it"""
+        job_id = uuid.uuid4().hex
+        directory = os.path.join(self.directory, job_id)
+        os.makedirs(directory)
+        job = BatchJob(directory, {
+            'id': job_id,
+            'status': 'queued',
+            'model': model or self.default_model,
+            'total': 0,
+            'completed': 0,
+            'failed': 0,
+            'created_at': time.time()
+        })
+        # Stream the upload to disk so large files never sit in memory
+        with open(job.input_path, 'wb') as f:
+            shutil.copyfileobj(upload, f, 1024 * 1024)
+        with open(job.input_path, 'rb') as f:
+            job.state['total'] = sum(1 for line in f if line.strip())
+        job.save()
+        self._start(job)
+        return job
+
+    def get(self, job_id: str) -> Optional[BatchJob]:
+        job = self._jobs.get(job_id)
+        if job is None:
+            state_path = os.path.join(self.directory, job_id, 'state.json')
+            if os.path.exists(state_path):
+                with open(state_path) as f:
+                    job = BatchJob(os.path.dirname(state_path), json.load(f))
+        return job
+
+    def cancel(self, job_id: str) -> Optional[BatchJob]:
+        job = self._jobs.get(job_id)
+        if job is not None:
+            job.cancelled.set()
+        return job
+
+    def resume(self) -> int:
+        """Restart jobs that were queued or running when the process stopped"""
+        if not os.path.isdir(self.directory):
+            return 0
+        resumed = 0
+        for job_id in os.listdir(self.directory):
+            job = self.get(job_id)
+            if job is not None and job.state.get('status') in RESUMABLE and job_id not in self._jobs:
+                self._start(job)
+                resumed += 1
+        return resumed
+
+    def _start(self, job: BatchJob) -> None:
+        self._jobs[job.id] = job
+        threading.Thread(target=self._run, args=(job,), name=f'batch-{job.id[:8]}', daemon=True).start()
+
+    def _requests(self, job: BatchJob, done: Set[int]) -> Iterator[Tuple[int, bytes]]:
+        with open(job.input_path, 'rb') as f:
+            line_number = 0
+            for raw in f:
+                if not raw.strip():
+                    continue
+                line_number += 1
+                if line_number in done:
+                    continue
+                yield line_number, raw
+
+    def _run(self, job: BatchJob) -> None:
+        done, failed = job.completed_lines()
+        job.state.update(status='running', completed=len(done), failed=failed,
+                         started_at=job.state.get('started_at') or time.time())
+        job.save()
+
+        pool = self._pool()
+        # Bound in-flight lines so huge inputs are streamed, not loaded
+        slots = threading.BoundedSemaphore(self.workers * 2)
+        out = open(job.output_path, 'ab')
+
+        def process(line_number: int, raw: bytes) -> None:
+            try:
+                record = self._execute(job, raw)
+            finally:
+                slots.release()
+            if record is None:
+                # Cancelled while waiting to retry; the line stays unfinished
+                return
+            entry = json.dumps(dict(record, line=line_number)).encode() + b'\n'
+            with job.lock:
+                out.write(entry)
+                out.flush()
+                job.state['completed'] += 1
+                if 'error' in record:
+                    job.state['failed'] += 1
+                job.save(force=False)
+
+        # Only lines still in flight are kept; a finished future drops itself
+        in_flight: Set[Future] = set()
+        errors: List[BaseException] = []
+        tracking = threading.Lock()
+
+        def finished(future: Future) -> None:
+            with tracking:
+                in_flight.discard(future)
+                if future.exception() is not None:
+                    errors.append(future.exception())
+
+        try:
+            for line_number, raw in self._requests(job, done):
+                if job.cancelled.is_set() or errors:
+                    break
+                slots.acquire()
+                future = pool.submit(process, line_number, raw)
+                with tracking:
+                    in_flight.add(future)
+                future.add_done_callback(finished)
+            with tracking:
+                remaining = list(in_flight)
+            for future in remaining:
+                future.exception()
+            if errors:
+                raise errors[0]
+            job.state['status'] = 'cancelled' if job.cancelled.is_set() else 'completed'
+        except Exception as e:
+            job.state.update(status='failed', error=str(e))
+        finally:
+            out.close()
+            job.state['finished_at'] = time.time()
+            job.save()
+
+    def _execute(self, job: BatchJob, raw: bytes) -> Optional[Dict[str, Any]]:
+        """Run one input line, returning the result or the error for that line
+
+        Returns None if the job was cancelled while the line waited to be retried.
+        """
+        request: Dict[str, Any] = {}
+        try:
+            request = json.loads(raw)
+            model = request.get('model') or job.state.get('model')
+            route = request.get('route', 'generate')
+            if not model:
+                raise ValueError("No model given for this line or the job")
+            record = self._invoke_with_retries(job, model, route, request)
+        except Exception as e:
+            record = {'error': str(e)}
+        if record is None:
+            return None
+        if isinstance(request, dict) and 'custom_id' in request:
+            record['custom_id'] = request['custom_id']
+        return record
+
+    def _invoke_with_retries(self, job: BatchJob, model: str, route: str,
+                             request: Dict[str, Any]) -> Optional[Dict[str, Any]]:
+        """Invoke a line, retrying transient failures with exponential backoff
+
+        Throttling, 5xx, timeouts, a full bulkhead and an open breaker are retried until
+        the attempts are used up, so a burst of 429s delays the job instead of failing
+        its lines. Client errors, such as invalid options, fail the line at once.
+        """
+        for attempt in range(1, self.max_attempts + 1):
+            retry_after = None
+            try:
+                result = self.invoke(model, route, request)
+            except Exception as e:
+                if attempt == self.max_attempts or not is_transient(error=e):
+                    raise
+                retry_after = getattr(e, 'retry_after', None)
+            else:
+                if not is_error_result(result):
+                    return {'result': result}
+                if attempt == self.max_attempts or not is_transient(result=result):
+                    return {'error': result['error']}
+            backoff = min(self.retry_delay * 2 ** (attempt - 1), self.max_retry_delay)
+            # Jitter keeps the workers from retrying in lockstep
+            delay = max(retry_after or 0.0, backoff * random.uniform(0.5, 1.0))
+            if job.cancelled.wait(delay):
+                return None
+        return None
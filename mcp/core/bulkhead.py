@@ -0,0 +1,151 @@
+from typing import Dict, Any, Callable, Optional, Tuple
+from concurrent.futures import ThreadPoolExecutor
+from contextvars import copy_context
+import os
+import threading
+
+
+class BulkheadFullError(RuntimeError):
+    """Raised instead of queueing a call when a model's executor is saturated"""
+
+    def __init__(self, model: str, route: str):
+        super().__init__(f"Model {model} is at capacity for {route} requests; try again shortly")
+        self.model = model
+        self.route = route
+
+
+class BulkheadClosedError(RuntimeError):
+    """Raised when a call reaches a bulkhead that a reset has already shut down"""
+
+
+class Bulkhead:
+    """A bounded executor for one model and route
+
+    At most workers calls run and at most queue more wait; beyond that calls are
+    rejected at once. Callers block until their call finishes, so a slow model holds
+    at most workers + queue server threads, and the rest of the service keeps its
+    threads as long as that stays well below the server's thread count.
+    """
+
+    def __init__(self, model: str, route: str, workers: int, queue: int):
+        self.model = model
+        self.route = route
+        self.workers = workers
+        self.queue = queue
+        self._executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix=f'bulkhead-{model}-{route}')
+        self._slots = threading.BoundedSemaphore(workers + queue)
+        self._lock = threading.Lock()
+        self._closed = False
+        self._pending = 0
+        self._counts = {'calls': 0, 'rejected': 0}
+
+    def _release(self, _future=None) -> None:
+        with self._lock:
+            self._pending -= 1
+        self._slots.release()
+
+    def run(self, call: Callable[[], Any]) -> Any:
+        """Run call on the bulkhead's workers and wait for its result"""
+        if not self._slots.acquire(blocking=False):
+            with self._lock:
+                self._counts['rejected'] += 1
+            raise BulkheadFullError(self.model, self.route)
+        with self._lock:
+            self._pending += 1
+            self._counts['calls'] += 1
+        # The call runs in a copy of the handler's context so tracing spans join its trace
+        context = copy_context()
+        try:
+            future = self._executor.submit(context.run, call)
+        except RuntimeError:
+            self._release()
+            if self._closed:
+                raise BulkheadClosedError(f"Bulkhead for {self.model} {self.route} was shut down")
+            raise
+        future.add_done_callback(self._release)
+        return future.result()
+
+    def shutdown(self) -> None:
+        # Calls already accepted still finish on their worker threads
+        self._closed = True
+        self._executor.shutdown(wait=False)
+
+    @property
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return dict(self._counts, workers=self.workers, queue=self.queue, pending=self._pending)
+
+
+class BulkheadRegistry:
+    """Per-model, per-route bulkheads, sized from the model's "bulkhead" config
+
+    A model entry may set {"bulkhead": {"workers": 4, "queue": 8, "routes": {"embed":
+    {"workers": 16}}}}; anything not set falls back to the registry defaults.
+    """
+
+    def __init__(self, workers: int = 4, queue: int = 2):
+        self.workers = workers
+        self.queue = queue
+        self._bulkheads: Dict[Tuple[str, str], Bulkhead] = {}
+        self._lock = threading.Lock()
+
+    @property
+    def enabled(self) -> bool:
+        return self.workers > 0
+
+    def get(self, model: str, route: str, config: Optional[Dict[str, Any]] = None) -> Bulkhead:
+        key = (model, route)
+        with self._lock:
+            bulkhead = self._bulkheads.get(key)
+            if bulkhead is None:
+                settings = dict((config or {}).get('bulkhead') or {})
+                settings.update((settings.pop('routes', None) or {}).get(route) or {})
+                bulkhead = Bulkhead(model, route, int(settings.get('workers', self.workers)),
+                                    int(settings.get('queue', self.queue)))
+                self._bulkheads[key] = bulkhead
+            return bulkhead
+
+    def run(self, model: str, route: str, config: Optional[Dict[str, Any]], call: Callable[[], Any]) -> Any:
+        """Run call on the model's bulkhead for route
+
+        A reset may shut a bulkhead down between looking it up and submitting to it;
+        the call then goes to the bulkhead that replaced it.
+        """
+        while True:
+            try:
+                return self.get(model, route, config).run(call)
+            except BulkheadClosedError:
+                continue
+
+    def reset(self, model: str) -> None:
+        """Drop a model's bulkheads, e.g. after it was replaced or unloaded, so new sizes apply"""
+        with self._lock:
+            dropped = [self._bulkheads.pop(key) for key in list(self._bulkheads) if key[0] == model]
+        for bulkhead in dropped:
+            bulkhead.shutdown()
+
+    @property
+    def stats(self) -> Dict[str, Dict[str, Any]]:
+        with self._lock:
+            bulkheads = dict(self._bulkheads)
+        stats: Dict[str, Dict[str, Any]] = {}
+        for (model, route), bulkhead in bulkheads.items():
+            stats.setdefault(model, {})[route] = bulkhead.stats
+        return stats
+
+
+def bulkheads_from_env() -> BulkheadRegistry:
+    """Build the bulkhead registry from BULKHEAD_* environment variables; 0 workers disables it
+
+    Workers default to an eighth of SERVER_THREADS, the thread count of the server in
+    front of the app, so one saturated model cannot take more than a small share of it.
+    """
+    server_threads = int(os.getenv('SERVER_THREADS', '32'))
+    registry = BulkheadRegistry(
+        workers=int(os.getenv('BULKHEAD_WORKERS', str(max(1, server_threads // 8)))),
+        queue=int(os.getenv('BULKHEAD_QUEUE', '2'))
+    )
+    if registry.enabled and registry.workers + registry.queue > server_threads // 2:
+        print(f"Warning: bulkheads let one model hold {registry.workers + registry.queue} of "
+              f"{server_threads} server threads; lower BULKHEAD_WORKERS or BULKHEAD_QUEUE")
+    return registry
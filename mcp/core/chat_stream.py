@@ -0,0 +1,100 @@
+from typing import Any, Callable, Iterator, List, Optional
+from contextvars import copy_context
+import queue
+import threading
+
+
+class TokenStream:
+    """Runs a token generator on a worker thread behind a bounded buffer
+
+    When the reader falls behind the buffer fills and the producer blocks, pausing
+    generation instead of accumulating output in memory. Cancelling closes the
+    generator, which ends the provider stream. A runner, such as a bulkhead's run,
+    may be given to produce the tokens on its own worker instead.
+    """
+
+    def __init__(self, generate: Callable[[], Iterator[str]], max_buffer: int = 64, name: str = 'token-stream',
+                 runner: Optional[Callable[[Callable[[], None]], Any]] = None):
+        self._generate = generate
+        self._runner = runner
+        self._queue: "queue.Queue[str]" = queue.Queue(maxsize=max_buffer)
+        self._cancelled = threading.Event()
+        self._done = threading.Event()
+        self.error: Optional[Exception] = None
+        self.chunks: List[str] = []
+        # Run in a copy of the caller's context so tracing spans join its trace
+        context = copy_context()
+        self._thread = threading.Thread(target=context.run, args=(self._run,), name=name, daemon=True)
+
+    def start(self) -> 'TokenStream':
+        self._thread.start()
+        return self
+
+    def cancel(self) -> None:
+        self._cancelled.set()
+
+    def close(self) -> None:
+        """Cancel and drop unread chunks; the producer stops at its next chunk"""
+        self.cancel()
+        try:
+            while True:
+                self._queue.get_nowait()
+        except queue.Empty:
+            pass
+
+    @property
+    def cancelled(self) -> bool:
+        return self._cancelled.is_set()
+
+    @property
+    def finished(self) -> bool:
+        """True once the producer has stopped and every buffered chunk was read"""
+        return self._done.is_set() and self._queue.empty()
+
+    @property
+    def text(self) -> str:
+        return ''.join(self.chunks)
+
+    def get(self, timeout: float) -> Optional[str]:
+        """Return the next chunk, or None if none arrived within the timeout"""
+        try:
+            chunk = self._queue.get(timeout=timeout)
+        except queue.Empty:
+            return None
+        self.chunks.append(chunk)
+        return chunk
+
+    def _run(self) -> None:
+        try:
+            if self._runner:
+                self._runner(self._produce)
+            else:
+                self._produce()
+        except Exception as e:
+            # The runner refused the stream, e.g. its bulkhead was full
+            self.error = e
+        finally:
+            self._done.set()
+
+    def _produce(self) -> None:
+        iterator = None
+        try:
+            iterator = self._generate()
+            for chunk in iterator:
+                if chunk and not self._put(chunk):
+                    break
+        except Exception as e:
+            self.error = e
+        finally:
+            close = getattr(iterator, 'close', None)
+            if close:
+                close()
+
+    def _put(self, chunk: str) -> bool:
+        while not self._cancelled.is_set():
+            try:
+                self._queue.put(chunk, timeout=0.1)
+                return True
+            except queue.Full:
+                continue
+        return False
@@ -0,0 +1,242 @@
+from typing import Dict, Any, Callable, Iterable, List, Optional, Tuple
+from collections import OrderedDict
+import hashlib
+import json
+import re
+import threading
+
+# Fallback formats for models without an embedded template; llama-2 is rendered in code
+BUILTIN_STYLES: Dict[str, Dict[str, Any]] = {
+    'llama-2': {
+        'stop': ['</s>', '[INST]']
+    },
+    'chatml': {
+        'system': '<|im_start|>system\n{content}<|im_end|>\n',
+        'user': '<|im_start|>user\n{content}<|im_end|>\n',
+        'assistant': '<|im_start|>assistant\n{content}<|im_end|>\n',
+        'generation': '<|im_start|>assistant\n',
+        'stop': ['<|im_end|>']
+    },
+    'markdown': {
+        'system': '### System:\n{content}\n\n',
+        'user': '### User:\n{content}\n\n',
+        'assistant': '### Assistant:\n{content}\n\n',
+        'generation': '### Assistant:\n',
+        'stop': ['### User:', '### System:']
+    },
+    'plain': {
+        'system': 'System: {content}\n\n',
+        'user': 'User: {content}\n',
+        'assistant': 'Assistant: {content}\n',
+        'generation': 'Assistant: ',
+        'stop': ['User:']
+    }
+}
+
+
+# Strings that look like control tokens, e.g. <|im_end|>, <|eot_id|> or <end_of_turn>
+_CONTROL_TOKEN = re.compile(r'<\|[^|\s]+\|>|</?[a-z_]+>')
+
+
+def _raise_exception(message: str):
+    raise ValueError(message)
+
+
+class ChatTemplate:
+    """Renders chat messages with the model's own template, or a built-in format as fallback"""
+
+    def __init__(self, template: Optional[str] = None, style: str = 'llama-2',
+                 bos_token: str = '<s>', eos_token: str = '</s>'):
+        self.bos_token = bos_token
+        self.eos_token = eos_token
+        self.style = style
+        self.source = None
+        self._compiled = None
+        if template:
+            try:
+                from jinja2.sandbox import ImmutableSandboxedEnvironment
+                environment = ImmutableSandboxedEnvironment(trim_blocks=True, lstrip_blocks=True)
+                environment.globals['raise_exception'] = _raise_exception
+                # Compiled once; jinja joins output chunks internally
+                self._compiled = environment.from_string(template)
+                self.source = template
+                self.style = 'embedded'
+            except Exception as e:
+                print(f"Warning: unusable chat template, falling back to {style}: {str(e)}")
+        if self._compiled is None and style not in BUILTIN_STYLES:
+            raise ValueError(f"Unknown chat format: {style}")
+
+    @classmethod
+    def from_llama(cls, llm: Any, fallback: str = 'llama-2') -> 'ChatTemplate':
+        """Use the chat template embedded in a GGUF file loaded by llama.cpp"""
+        metadata = getattr(llm, 'metadata', None) or {}
+        bos, eos = '<s>', '</s>'
+        model = getattr(llm, '_model', None)
+        if model is not None and hasattr(model, 'token_get_text'):
+            bos = model.token_get_text(llm.token_bos()) or bos
+            eos = model.token_get_text(llm.token_eos()) or eos
+        return cls(metadata.get('tokenizer.chat_template'), style=fallback, bos_token=bos, eos_token=eos)
+
+    @classmethod
+    def from_tokenizer(cls, tokenizer: Any, fallback: str = 'llama-2') -> 'ChatTemplate':
+        """Use the chat template shipped with a Hugging Face tokenizer"""
+        return cls(getattr(tokenizer, 'chat_template', None), style=fallback,
+                   bos_token=tokenizer.bos_token or '<s>', eos_token=tokenizer.eos_token or '</s>')
+
+    @property
+    def stop(self) -> List[str]:
+        """Stop sequences that end the assistant turn"""
+        if self._compiled is not None:
+            return [self.eos_token]
+        return BUILTIN_STYLES[self.style]['stop']
+
+    @property
+    def special_tokens(self) -> List[str]:
+        """Strings the template renders that may be control tokens, such as turn delimiters"""
+        if self.source is not None:
+            source = self.source
+        else:
+            source = ''.join(str(value) for value in BUILTIN_STYLES[self.style].values())
+        return list(dict.fromkeys([self.bos_token, self.eos_token] + _CONTROL_TOKEN.findall(source)))
+
+    def render(self, messages: List[Dict[str, str]], add_generation_prompt: bool = True) -> str:
+        """Render a conversation into a single prompt string"""
+        if self._compiled is not None:
+            return self._compiled.render(
+                messages=messages, add_generation_prompt=add_generation_prompt,
+                bos_token=self.bos_token, eos_token=self.eos_token
+            )
+        if self.style == 'llama-2':
+            return self._render_llama2(messages, add_generation_prompt)
+
+        style = BUILTIN_STYLES[self.style]
+        parts = [style[message['role']].format(content=message['content'])
+                 for message in messages if message['role'] in style]
+        if add_generation_prompt:
+            parts.append(style['generation'])
+        return ''.join(parts)
+
+    def _render_llama2(self, messages: List[Dict[str, str]], add_generation_prompt: bool) -> str:
+        parts = []
+        system = None
+        for message in messages:
+            role, content = message['role'], message['content']
+            if role == 'system':
+                system = content
+            elif role == 'user':
+                # The system prompt is folded into the first user turn
+                if system is not None:
+                    content = f"<<SYS>>\n{system}\n<</SYS>>\n\n{content}"
+                    system = None
+                parts.append(f"{self.bos_token}[INST] {content.strip()} [/INST]")
+            elif role == 'assistant':
+                parts.append(f" {content.strip()} {self.eos_token}")
+        return ''.join(parts)
+
+
+class TokenizedPromptCache:
+    """Reuses the tokens of earlier renders so a growing conversation history is tokenised only once
+
+    Cached tokens always end at a special token, such as the end of a turn. Text after a
+    special token tokenises the same on its own as within the whole prompt, so cached
+    tokens plus the new text's tokens equal a full tokenisation. Splitting anywhere else
+    could add a SentencePiece leading space or lose a BPE merge across the join.
+    """
+
+    # Text put either side of a special token to check that it splits cleanly
+    _PROBES = ('Hello', ' Hello', '\nHello')
+
+    def __init__(self, tokenize: Callable[[str], List[int]], bos_token_id: Optional[int] = None,
+                 bos_token: str = '', max_entries: int = 256, special_tokens: Iterable[str] = ()):
+        self.tokenize = tokenize
+        self.bos_token_id = bos_token_id
+        self.bos_token = bos_token
+        self.max_entries = max_entries
+        self._entries: "OrderedDict[bytes, Tuple[str, List[int]]]" = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        # Without a special token that splits cleanly nothing is cached and every prompt is tokenised whole
+        self.boundaries = [token for token in dict.fromkeys(special_tokens) if token and self._splits_cleanly(token)]
+
+    def _splits_cleanly(self, token: str) -> bool:
+        """Whether token is a single special token that text on either side tokenises independently of"""
+        try:
+            alone = self.tokenize(token)
+            if len(alone) != 1:
+                return False
+            return all(
+                self.tokenize(token + text) == alone + self.tokenize(text) and
+                self.tokenize(text + token) == self.tokenize(text) + alone
+                for text in self._PROBES
+            )
+        except Exception:
+            return False
+
+    def _boundary(self, text: str, start: int) -> int:
+        """The end of the last special token in text after start, or start if there is none"""
+        end = start
+        for token in self.boundaries:
+            index = text.rfind(token, start)
+            if index >= 0:
+                end = max(end, index + len(token))
+        return end
+
+    @staticmethod
+    def _prefix_digests(messages: List[Dict[str, str]]) -> List[bytes]:
+        # Rolling hash: digests[k] identifies messages[:k + 1] in one linear pass
+        rolling = hashlib.sha1()
+        digests = []
+        for message in messages:
+            rolling.update(json.dumps([message.get('role'), message.get('content')]).encode())
+            digests.append(rolling.copy().digest())
+        return digests
+
+    def tokens_for(self, messages: List[Dict[str, str]], rendered: str) -> List[int]:
+        """Tokenise a rendered conversation, only tokenising text past the longest cached prefix"""
+        digests = self._prefix_digests(messages)
+        with self._lock:
+            for digest in reversed(digests):
+                entry = self._entries.get(digest)
+                if entry is not None and rendered.startswith(entry[0]):
+                    self._entries.move_to_end(digest)
+                    cached_text, cached_tokens = entry
+                    break
+            else:
+                cached_text, cached_tokens = None, None
+
+        if cached_text is not None:
+            self.hits += 1
+            start = len(cached_text)
+            head = list(cached_tokens)
+        else:
+            self.misses += 1
+            start = 0
+            head = []
+            if self.bos_token_id is not None and not (self.bos_token and rendered.startswith(self.bos_token)):
+                head = [self.bos_token_id]
+
+        # Tokenise up to the last special token and the rest separately; only the first part is cached
+        split = self._boundary(rendered, start)
+        if split > start:
+            head += self.tokenize(rendered[start:split])
+        tokens = head + self.tokenize(rendered[split:]) if len(rendered) > split else list(head)
+
+        if split > 0:
+            with self._lock:
+                self._entries[digests[-1]] = (rendered[:split], head)
+                self._entries.move_to_end(digests[-1])
+                while len(self._entries) > self.max_entries:
+                    self._entries.popitem(last=False)
+        return tokens
+
+    @classmethod
+    def for_llama(cls, llm: Any, template: ChatTemplate, max_entries: int = 256) -> 'TokenizedPromptCache':
+        """Cache tokenising with llama.cpp, parsing special tokens rendered by the template"""
+        return cls(
+            lambda text: llm.tokenize(text.encode('utf-8'), add_bos=False, special=True),
+            bos_token_id=llm.token_bos(),
+            bos_token=template.bos_token,
+            max_entries=max_entries,
+            special_tokens=template.special_tokens
+        )
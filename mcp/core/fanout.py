@@ -0,0 +1,90 @@
+from typing import Dict, Any, Callable, Optional
+from concurrent.futures import ThreadPoolExecutor, Future, FIRST_COMPLETED, wait
+from contextvars import copy_context
+import time
+
+from .bulkhead import BulkheadFullError
+from ..utils.circuit_breaker import CircuitOpenError
+from ..utils.rate_limiter import is_transient_error
+
+
+def is_error_result(result: Any) -> bool:
+    # Adapters report provider failures as {"error": ...} instead of raising
+    return isinstance(result, dict) and bool(result.get('error'))
+
+
+def is_transient(error: Optional[BaseException] = None, result: Any = None) -> bool:
+    """Whether a failed call may succeed later: shed, throttled, a server error or unreachable
+
+    Error results count when the app marked them "retryable"; client errors such as
+    invalid options never do.
+    """
+    if error is not None:
+        return isinstance(error, (CircuitOpenError, BulkheadFullError)) or is_transient_error(error)
+    return is_error_result(result) and bool(result.get('retryable'))
+
+
+class FanOut:
+    """Dispatches one request to several models concurrently"""
+
+    def __init__(self, max_workers: int = 32):
+        self.executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix='fanout')
+
+    def _submit(self, call: Callable[[], Any]) -> Future:
+        start = time.perf_counter()
+        # Each task gets its own context copy so tracing spans join the request's trace
+        context = copy_context()
+
+        def run():
+            result = context.run(call)
+            return result, (time.perf_counter() - start) * 1000
+        return self.executor.submit(run)
+
+    @staticmethod
+    def _outcome(future: Future) -> Dict[str, Any]:
+        try:
+            result, latency_ms = future.result()
+        except Exception as e:
+            return {'error': str(e)}
+        if is_error_result(result):
+            return {'error': result['error'], 'latency_ms': round(latency_ms, 2)}
+        return {'result': result, 'latency_ms': round(latency_ms, 2)}
+
+    def all(self, calls: Dict[str, Callable[[], Any]], timeout: Optional[float] = None) -> Dict[str, Any]:
+        """Wait for every model (up to the timeout) and return each result with its latency"""
+        start = time.perf_counter()
+        futures = {name: self._submit(call) for name, call in calls.items()}
+        wait(futures.values(), timeout=timeout)
+        results = {}
+        for name, future in futures.items():
+            if future.done():
+                results[name] = self._outcome(future)
+            else:
+                future.cancel()
+                results[name] = {'error': f'Timed out after {timeout}s'}
+        return {'results': results, 'latency_ms': round((time.perf_counter() - start) * 1000, 2)}
+
+    def first(self, calls: Dict[str, Callable[[], Any]], timeout: Optional[float] = None) -> Dict[str, Any]:
+        """Return the first successful result; failures are collected until one succeeds"""
+        start = time.perf_counter()
+        futures = {self._submit(call): name for name, call in calls.items()}
+        deadline = None if timeout is None else time.monotonic() + timeout
+        pending = set(futures)
+        errors: Dict[str, Any] = {}
+        while pending:
+            remaining = None if deadline is None else max(0.0, deadline - time.monotonic())
+            done, pending = wait(pending, timeout=remaining, return_when=FIRST_COMPLETED)
+            if not done:
+                break
+            for future in done:
+                outcome = self._outcome(future)
+                if 'result' in outcome:
+                    for other in pending:
+                        other.cancel()
+                    return dict(outcome, model=futures[future], errors=errors,
+                                total_latency_ms=round((time.perf_counter() - start) * 1000, 2))
+                errors[futures[future]] = outcome
+        for future in pending:
+            future.cancel()
+            errors[futures[future]] = {'error': f'Timed out after {timeout}s'}
+        return {'error': 'No model returned a successful result', 'errors': errors}
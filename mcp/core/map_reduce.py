@@ -0,0 +1,330 @@
+from typing import Dict, Any, Callable, Iterator, List, Optional, TextIO
+from concurrent.futures import ThreadPoolExecutor, Future, FIRST_COMPLETED, wait
+from contextvars import copy_context
+from functools import partial
+import os
+import random
+import shutil
+import threading
+import time
+import uuid
+
+from .fanout import is_error_result, is_transient
+from ..utils.response_formatter import response_text
+from ..utils.traffic_capture import CHARS_PER_TOKEN
+
+TASKS = ('summarize', 'extract')
+
+_MAP_PROMPTS = {
+    'summarize': ("Summarize part {part} of {parts} of a longer document. Keep names, figures and "
+                  "conclusions.{instructions}\n\n{text}"),
+    'extract': ("From part {part} of {parts} of a longer document, extract: {instructions}\n"
+                "Reply with NONE if this part contains nothing relevant.\n\n{text}")
+}
+_REDUCE_PROMPTS = {
+    'summarize': ("Combine these summaries of consecutive parts of a document into one coherent "
+                  "summary.{instructions}\n\n{text}"),
+    'extract': ("Merge these extraction results from parts of one document into a single result, "
+                "removing duplicates and NONE entries. Extract: {instructions}\n\n{text}")
+}
+
+
+def _boundary(text: str, limit: int) -> int:
+    # Prefer ending a chunk at a paragraph, then a sentence, then a word, in its second half
+    for separator in ('\n\n', '. ', '\n', ' '):
+        cut = text.rfind(separator, limit // 2, limit)
+        if cut != -1:
+            return cut + len(separator)
+    return limit
+
+
+def _fit_tokens(text: str, cut: int, limit: int, count_tokens: Callable[[str], Optional[int]]) -> int:
+    # Shorten text[:cut] until the tokenizer counts at most limit tokens, scaling the cut by
+    # the overshoot and ending it on a boundary again
+    tokens = count_tokens(text[:cut])
+    while tokens is not None and tokens > limit and cut > 1:
+        cut = _boundary(text, max(1, cut * limit * 9 // (tokens * 10)))
+        tokens = count_tokens(text[:cut])
+    return cut
+
+
+def iter_chunks(source: TextIO, chunk_tokens: int, overlap_tokens: int,
+                count_tokens: Optional[Callable[[str], Optional[int]]] = None) -> Iterator[str]:
+    """Split a text stream into overlapping chunks of at most chunk_tokens tokens
+
+    Chunks are sized at CHARS_PER_TOKEN characters a token. With count_tokens, e.g. the
+    target model's tokenizer, each chunk is then shortened until it really fits; without
+    it the size is an estimate. Only about two chunks of text are held in memory at a time.
+    """
+    size = chunk_tokens * CHARS_PER_TOKEN
+    overlap = min(overlap_tokens * CHARS_PER_TOKEN, size // 4)
+    buffer = ''
+    exhausted = False
+    while not exhausted or buffer:
+        if not exhausted and len(buffer) <= size:
+            data = source.read(size)
+            exhausted = not data
+            buffer += data
+            continue
+        cut = _boundary(buffer, size) if len(buffer) > size else len(buffer)
+        if count_tokens is not None:
+            cut = _fit_tokens(buffer, cut, chunk_tokens, count_tokens)
+        if cut == len(buffer):
+            if buffer.strip():
+                yield buffer
+            return
+        yield buffer[:cut]
+        # Start the next chunk a little earlier, on a word boundary, so context carries over
+        start = max(cut - overlap, 1)
+        space = buffer.find(' ', start, cut)
+        buffer = buffer[space + 1 if space != -1 else start:]
+
+
+class DocumentJob:
+    """A long document processed with map (per chunk) and hierarchical reduce steps"""
+
+    def __init__(self, directory: str, params: Dict[str, Any]):
+        self.directory = directory
+        self.params = params
+        self.cancelled = threading.Event()
+        self.state: Dict[str, Any] = {
+            'id': os.path.basename(directory),
+            'status': 'queued',
+            'task': params['task'],
+            'models': params['models'],
+            'chunk_tokens': params['chunk_tokens'],
+            'estimated_chunks': None,
+            'chunks': None,
+            'mapped': 0,
+            'reduced': 0,
+            'level': 0,
+            'created_at': time.time()
+        }
+
+    @property
+    def id(self) -> str:
+        return self.state['id']
+
+    @property
+    def input_path(self) -> str:
+        return os.path.join(self.directory, 'input.txt')
+
+
+class DocumentJobManager:
+    """Runs map-reduce jobs over documents too large for a model's context window
+
+    Chunks are mapped in parallel across the job's models (round robin, falling back to
+    the next model on failure). Partial outputs are combined in order, fan_in at a time
+    and level by level, until one result is left. At most window steps are in flight
+    per job, so memory stays bounded however large the document is. count_tokens, given
+    a job's models and a text, returns the most tokens any of their tokenizers makes of
+    it (None if none has one); chunks are then fitted to real token counts. A step
+    whose models all failed transiently (throttled, shed or unreachable) is tried again
+    with backoff, up to max_attempts rounds, before the job fails.
+    """
+
+    def __init__(self, directory: str, invoke: Callable[[str, str, Dict[str, Any]], Any],
+                 workers: int = 8, keep_finished: int = 100,
+                 count_tokens: Optional[Callable[[List[str], str], Optional[int]]] = None,
+                 max_attempts: int = 5, retry_delay: float = 1.0, max_retry_delay: float = 60.0):
+        self.directory = directory
+        self.invoke = invoke
+        self.count_tokens = count_tokens
+        self.max_attempts = max_attempts
+        self.retry_delay = retry_delay
+        self.max_retry_delay = max_retry_delay
+        self.workers = workers
+        self.keep_finished = keep_finished
+        self._jobs: Dict[str, DocumentJob] = {}
+        self._lock = threading.Lock()
+        self._executor: Optional[ThreadPoolExecutor] = None
+        self._rotation = 0
+
+    def _pool(self) -> ThreadPoolExecutor:
+        with self._lock:
+            if self._executor is None:
+                self._executor = ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix='document-worker')
+            return self._executor
+
+    def create_job(self, source, params: Dict[str, Any]) -> DocumentJob:
+        """Spool the document (a text or binary stream) to disk and start processing it"""
+        directory = os.path.join(self.directory, uuid.uuid4().hex)
+        os.makedirs(directory)
+        job = DocumentJob(directory, params)
+        mode = 'w' if isinstance(source.read(0), str) else 'wb'
+        with open(job.input_path, mode) as f:
+            shutil.copyfileobj(source, f, 1024 * 1024)
+        step = (params['chunk_tokens'] - min(params['overlap_tokens'], params['chunk_tokens'] // 4)) * CHARS_PER_TOKEN
+        job.state['estimated_chunks'] = max(1, -(-os.path.getsize(job.input_path) // step))
+        with self._lock:
+            self._jobs[job.id] = job
+            finished = [old for old in self._jobs.values() if old.state['status'] not in ('queued', 'running')]
+            for old in sorted(finished, key=lambda old: old.state['created_at'])[:-self.keep_finished or None]:
+                del self._jobs[old.id]
+        # Run in a copy of the caller's context so tracing spans join its trace
+        context = copy_context()
+        threading.Thread(target=context.run, args=(self._run, job), name=f'document-{job.id[:8]}', daemon=True).start()
+        return job
+
+    def get(self, job_id: str) -> Optional[DocumentJob]:
+        return self._jobs.get(job_id)
+
+    def cancel(self, job_id: str) -> Optional[DocumentJob]:
+        job = self._jobs.get(job_id)
+        if job is not None:
+            job.cancelled.set()
+        return job
+
+    def _step(self, job: DocumentJob, prompt: str) -> str:
+        """Run one map or reduce prompt, trying each of the job's models once, and return its text"""
+        models = job.params['models']
+        with self._lock:
+            first = self._rotation
+            self._rotation += 1
+        for attempt in range(1, self.max_attempts + 1):
+            errors = []
+            transient = False
+            retry_after = 0.0
+            for offset in range(len(models)):
+                model = models[(first + offset) % len(models)]
+                try:
+                    result = self.invoke(model, prompt, job.params['options'])
+                except Exception as e:
+                    errors.append(f"{model}: {str(e)}")
+                    transient = transient or is_transient(error=e)
+                    retry_after = max(retry_after, getattr(e, 'retry_after', None) or 0.0)
+                    continue
+                if is_error_result(result):
+                    errors.append(f"{model}: {result['error']}")
+                    transient = transient or is_transient(result=result)
+                    continue
+                # Adapters return strings, {"text"/"response": ...} dicts or lists of candidates
+                text = response_text(result)
+                if text is not None:
+                    return text
+                errors.append(f"{model}: no text in the model's response")
+            if not transient or attempt == self.max_attempts:
+                break
+            backoff = min(self.retry_delay * 2 ** (attempt - 1), self.max_retry_delay)
+            # Jitter keeps the job's workers from retrying in lockstep
+            if job.cancelled.wait(max(retry_after, backoff * random.uniform(0.5, 1.0))):
+                break
+        raise RuntimeError('; '.join(errors))
+
+    def _prompt(self, job: DocumentJob, prompts: Dict[str, str], text: str, **fields: Any) -> str:
+        instructions = job.params.get('instructions') or ''
+        if job.params['task'] == 'summarize' and instructions:
+            instructions = ' ' + instructions
+        return prompts[job.params['task']].format(text=text, instructions=instructions, **fields)
+
+    def _run(self, job: DocumentJob) -> None:
+        state = job.state
+        state.update(status='running', started_at=time.time())
+        pool = self._pool()
+        fan_in = job.params['fan_in']
+        size = job.params['chunk_tokens'] * CHARS_PER_TOKEN
+        window = job.params['window']
+        # Per level: finished outputs by index, next index to consume, the group being
+        # filled, groups emitted so far, and the level's total once it is known
+        ready: List[Dict[int, str]] = [{}]
+        cursor = [0]
+        group: List[List[str]] = [[]]
+        emitted = [0]
+        total: List[Optional[int]] = [None]
+        in_flight: Dict[Future, tuple] = {}
+
+        def add_level() -> None:
+            ready.append({})
+            cursor.append(0)
+            group.append([])
+            emitted.append(0)
+            total.append(None)
+
+        def emit(level: int) -> None:
+            parts = group[level]
+            group[level] = []
+            if level + 1 == len(ready):
+                add_level()
+            index = emitted[level]
+            emitted[level] += 1
+            if len(parts) == 1:
+                # A lone partial passes up unchanged
+                ready[level + 1][index] = parts[0]
+                return
+            text = '\n\n'.join(f"[{number}] {part}" for number, part in enumerate(parts, 1))
+            prompt = self._prompt(job, _REDUCE_PROMPTS, text)
+            in_flight[pool.submit(self._step, job, prompt)] = (level + 1, index)
+
+        def advance() -> Optional[str]:
+            level = 0
+            while level < len(ready):
+                while cursor[level] in ready[level]:
+                    part = ready[level].pop(cursor[level])
+                    cursor[level] += 1
+                    if len(part) > size // 2:
+                        # Cut overlong partials so any two fit in one reduce prompt
+                        part = part[:_boundary(part, size // 2)]
+                    # Groups stay within a chunk's budget so reduce prompts fit the context too,
+                    # but always combine at least two partials so every level shrinks
+                    if len(group[level]) >= fan_in or (len(group[level]) >= 2 and
+                                                       sum(map(len, group[level])) + len(part) > size):
+                        emit(level)
+                    group[level].append(part)
+                if total[level] is not None and cursor[level] == total[level] and group[level] is not None:
+                    if emitted[level] == 0 and len(group[level]) == 1:
+                        return group[level][0]
+                    if group[level]:
+                        emit(level)
+                    if emitted[level] >= total[level]:
+                        raise RuntimeError(f"Reduce level {level + 1} did not combine any partial results")
+                    total[level + 1] = emitted[level]
+                    # Closed: nothing more arrives at this level
+                    group[level] = None
+                    state['level'] = level + 1
+                level += 1
+            return None
+
+        try:
+            with open(job.input_path, encoding='utf-8', errors='replace') as source:
+                counter = partial(self.count_tokens, job.params['models']) if self.count_tokens else None
+                chunks = iter_chunks(source, job.params['chunk_tokens'], job.params['overlap_tokens'], counter)
+                mapped = 0
+                result = None
+                while result is None:
+                    if job.cancelled.is_set():
+                        state['status'] = 'cancelled'
+                        break
+                    while total[0] is None and len(in_flight) < window:
+                        chunk = next(chunks, None)
+                        if chunk is None:
+                            total[0] = state['chunks'] = mapped
+                            break
+                        prompt = self._prompt(job, _MAP_PROMPTS, chunk, part=mapped + 1,
+                                              parts=f"about {max(state['estimated_chunks'], mapped + 1)}")
+                        in_flight[pool.submit(self._step, job, prompt)] = (0, mapped)
+                        mapped += 1
+                    if total[0] == 0:
+                        raise ValueError("Document is empty")
+                    result = advance()
+                    if result is not None:
+                        break
+                    if not in_flight:
+                        raise RuntimeError("Map-reduce finished without a result")
+                    done, _ = wait(list(in_flight), timeout=1.0, return_when=FIRST_COMPLETED)
+                    for future in done:
+                        level, index = in_flight.pop(future)
+                        ready[level][index] = future.result()
+                        state['mapped' if level == 0 else 'reduced'] += 1
+            if state['status'] != 'cancelled':
+                state.update(status='completed', result=result)
+        except Exception as e:
+            if job.cancelled.is_set():
+                # A step given up on because of the cancel
+                state['status'] = 'cancelled'
+            else:
+                state.update(status='failed', error=str(e))
+        finally:
+            for future in in_flight:
+                future.cancel()
+            state['finished_at'] = time.time()
+            shutil.rmtree(job.directory, ignore_errors=True)
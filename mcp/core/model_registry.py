@@ -0,0 +1,220 @@
+from typing import Dict, Any, Callable, Iterator, List, Optional
+from collections.abc import Mapping
+from contextlib import contextmanager
+import os
+import threading
+import time
+
+from .ai_factory import AIModelFactory
+from .ai_interface import AIModel
+from ..utils.memory_budget import MemoryBudgetError
+
+
+class InsufficientMemoryError(RuntimeError):
+    """Raised when loading a model would exceed the memory available on the node"""
+
+
+def available_memory_bytes() -> Optional[int]:
+    """Return the memory currently available to new allocations, if it can be determined"""
+    try:
+        with open('/proc/meminfo') as f:
+            for line in f:
+                if line.startswith('MemAvailable:'):
+                    return int(line.split()[1]) * 1024
+    except OSError:
+        pass
+    try:
+        return os.sysconf('SC_AVPHYS_PAGES') * os.sysconf('SC_PAGE_SIZE')
+    except (ValueError, OSError, AttributeError):
+        return None
+
+
+class _ModelEntry:
+    """A loaded model together with its in-flight request accounting"""
+
+    def __init__(self, model: AIModel, model_type: Optional[str], config: Dict[str, Any]):
+        self.model = model
+        self.model_type = model_type
+        self.config = config
+        self.loaded_at = time.time()
+        self.in_flight = 0
+        self.condition = threading.Condition()
+
+    def drain(self, timeout: float) -> bool:
+        """Wait until no request is using this entry"""
+        deadline = time.monotonic() + timeout
+        with self.condition:
+            while self.in_flight:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    return False
+                self.condition.wait(remaining)
+        return True
+
+
+class ModelRegistry(Mapping):
+    """Thread-safe registry of model instances supporting load, unload and atomic replacement at runtime"""
+
+    def __init__(self, drain_timeout: float = 60.0, memory_headroom: float = 0.1):
+        self.drain_timeout = drain_timeout
+        self.memory_headroom = memory_headroom
+        self._entries: Dict[str, _ModelEntry] = {}
+        self._status: Dict[str, Dict[str, Any]] = {}
+        self._listeners: List[Callable[[str], None]] = []
+        self._lock = threading.Lock()
+
+    def __getitem__(self, name: str) -> AIModel:
+        return self._entries[name].model
+
+    def __iter__(self) -> Iterator[str]:
+        return iter(list(self._entries))
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def register(self, name: str, model: AIModel, model_type: Optional[str] = None,
+                 config: Optional[Dict[str, Any]] = None) -> None:
+        """Register an already initialized model, replacing any previous entry"""
+        self._swap(name, _ModelEntry(model, model_type, config or {}))
+
+    def add_listener(self, callback: Callable[[str], None]) -> None:
+        """Call back with the model name whenever an entry is replaced or removed"""
+        self._listeners.append(callback)
+
+    def _notify(self, name: str) -> None:
+        for callback in self._listeners:
+            callback(name)
+
+    @contextmanager
+    def use(self, name: str) -> Iterator[AIModel]:
+        """Borrow a model for the duration of a request so swaps can drain it"""
+        with self._lock:
+            entry = self._entries[name]
+            with entry.condition:
+                entry.in_flight += 1
+        try:
+            yield entry.model
+        finally:
+            with entry.condition:
+                entry.in_flight -= 1
+                if not entry.in_flight:
+                    entry.condition.notify_all()
+
+    def entry_config(self, name: str) -> Optional[Dict[str, Any]]:
+        """Return the type and configuration a model was loaded with"""
+        entry = self._entries.get(name)
+        if entry is None:
+            return None
+        return {'type': entry.model_type, 'config': dict(entry.config)}
+
+    def check_memory(self, model_type: str, config: Dict[str, Any]) -> None:
+        """Refuse loads whose estimated footprint does not fit in available memory"""
+        # A bad path is the caller's mistake, not a server error
+        for key in ('model_path', 'embedding_model_path'):
+            if config.get(key) and not os.path.isfile(config[key]):
+                raise ValueError(f"Model file not found: {config[key]}")
+        model_class = AIModelFactory.get_model_class(model_type)
+        estimate = getattr(model_class, 'estimate_memory', None)
+        if estimate is not None:
+            try:
+                required = estimate(config)
+            except MemoryBudgetError as e:
+                raise InsufficientMemoryError(str(e))
+            except OSError as e:
+                raise ValueError(f"Cannot read model file: {str(e)}")
+        elif config.get('model_path'):
+            required = os.path.getsize(config['model_path'])
+        else:
+            required = 0
+
+        available = available_memory_bytes()
+        if not required or available is None:
+            return
+        usable = int(available * (1 - self.memory_headroom))
+        if required > usable:
+            raise InsufficientMemoryError(
+                f"Loading {model_type} needs ~{required // 2**20} MiB but only "
+                f"{usable // 2**20} MiB is available"
+            )
+
+    def load(self, name: str, model_type: str, config: Dict[str, Any],
+             background: bool = True) -> Dict[str, Any]:
+        """Load a model and atomically swap it in once it is ready
+
+        The lock is only held to claim the name and, later, to install the model; the
+        memory check reads model files and must not stall requests borrowing models.
+        """
+        with self._lock:
+            previous = self._status.get(name)
+            if previous and previous.get('state') == 'loading':
+                raise RuntimeError(f"Model {name} is already loading")
+            self._status[name] = {'state': 'loading', 'type': model_type, 'started_at': time.time()}
+        try:
+            self.check_memory(model_type, config)
+        except Exception:
+            with self._lock:
+                if previous is None:
+                    del self._status[name]
+                else:
+                    self._status[name] = previous
+            raise
+
+        if not background:
+            self._load(name, model_type, config)
+            if self._status[name]['state'] == 'failed':
+                raise RuntimeError(self._status[name]['error'])
+        else:
+            threading.Thread(
+                target=self._load, args=(name, model_type, config),
+                name=f"model-load-{name}", daemon=True
+            ).start()
+        return self.status(name)
+
+    def _load(self, name: str, model_type: str, config: Dict[str, Any]) -> None:
+        try:
+            model = AIModelFactory.create_model(model_type)
+            model.initialize(config)
+        except Exception as e:
+            self._set_status(name, state='failed', error=str(e))
+            return
+        self._swap(name, _ModelEntry(model, model_type, config))
+        self._set_status(name, state='ready', loaded_at=time.time())
+
+    def unload(self, name: str) -> None:
+        """Remove a model once its in-flight requests have finished"""
+        with self._lock:
+            entry = self._entries.pop(name)
+            self._status[name] = {'state': 'unloaded', 'type': entry.model_type}
+        self._notify(name)
+        self._release(name, entry)
+
+    def _swap(self, name: str, entry: _ModelEntry) -> None:
+        with self._lock:
+            old = self._entries.get(name)
+            self._entries[name] = entry
+        self._notify(name)
+        if old is not None:
+            self._release(name, old)
+
+    def _release(self, name: str, entry: _ModelEntry) -> None:
+        def release():
+            if not entry.drain(self.drain_timeout):
+                print(f"Warning: releasing {name} with {entry.in_flight} request(s) still in flight")
+            entry.model.close()
+        threading.Thread(target=release, name=f"model-release-{name}", daemon=True).start()
+
+    def _set_status(self, name: str, **fields: Any) -> None:
+        with self._lock:
+            self._status.setdefault(name, {}).update(fields)
+
+    def status(self, name: Optional[str] = None) -> Dict[str, Any]:
+        """Return load state and in-flight counts for one or all models"""
+        names = [name] if name else sorted(set(self._entries) | set(self._status))
+        result = {}
+        for model_name in names:
+            entry = self._entries.get(model_name)
+            info = dict(self._status.get(model_name, {'state': 'ready' if entry else 'absent'}))
+            if entry is not None:
+                info.update(type=entry.model_type, in_flight=entry.in_flight, loaded_at=entry.loaded_at)
+            result[model_name] = info
+        return result[name] if name else result
@@ -0,0 +1,250 @@
+from typing import Dict, Any, Callable, Iterator, List, Optional
+from contextvars import copy_context
+import hashlib
+import json
+import threading
+
+
+def request_key(model: str, method: str, args: tuple, kwargs: Dict[str, Any]) -> str:
+    """Digest identifying identical calls; large prompts and texts don't end up as dict keys"""
+    data = json.dumps([model, method, list(args), kwargs], sort_keys=True, separators=(',', ':'), default=str)
+    return hashlib.blake2b(data.encode(), digest_size=16).hexdigest()
+
+
+class _Flight:
+    def __init__(self):
+        self.done = threading.Event()
+        self.result: Any = None
+        self.error: Optional[BaseException] = None
+
+
+class _SharedStream:
+    """One provider stream replayed to every subscriber
+
+    Chunks are kept so late joiners can catch up, but only until max_buffer of them
+    have been produced. After that no one else may join, and chunks every subscriber has
+    read are dropped. The producer waits while the slowest subscriber is max_buffer chunks
+    behind, as a TokenStream does for its reader.
+    """
+
+    def __init__(self, generate: Callable[[], Iterator[str]], forget: Callable[[], None],
+                 runner: Optional[Callable[[Callable[[], None]], Any]] = None, max_buffer: int = 64):
+        self._generate = generate
+        self._forget = forget
+        self._runner = runner
+        self.max_buffer = max_buffer
+        self._condition = threading.Condition()
+        self._chunks: List[str] = []
+        # Index of _chunks[0] among all chunks produced, and each subscriber's next index
+        self._base = 0
+        self._positions: Dict[object, int] = {}
+        self._joinable = True
+        self.done = False
+        self.error: Optional[Exception] = None
+        # Maintained by SingleFlight under its lock
+        self.subscribers = 0
+        self._abandoned = False
+
+    def start(self) -> None:
+        # Run in a copy of the first caller's context so tracing spans join its trace
+        context = copy_context()
+        threading.Thread(target=context.run, args=(self._run,), name='single-flight-stream', daemon=True).start()
+
+    def subscribe(self) -> object:
+        """Register a subscriber starting from the first chunk; only while the stream is joinable"""
+        subscriber = object()
+        with self._condition:
+            self._positions[subscriber] = 0
+        return subscriber
+
+    def unsubscribe(self, subscriber: object) -> None:
+        with self._condition:
+            self._positions.pop(subscriber, None)
+            self._trim()
+            self._condition.notify_all()
+
+    def abandon(self) -> None:
+        """Stop generating at the next chunk"""
+        with self._condition:
+            self._abandoned = True
+            self._condition.notify_all()
+
+    def _trim(self) -> None:
+        # Called with the condition held; chunks stay whole while someone may still join
+        if self._joinable:
+            return
+        lowest = min(self._positions.values(), default=self._base + len(self._chunks))
+        del self._chunks[:lowest - self._base]
+        self._base = lowest
+
+    def _run(self) -> None:
+        try:
+            if self._runner:
+                self._runner(self._produce)
+            else:
+                self._produce()
+        except Exception as e:
+            # The runner refused the stream, e.g. its bulkhead was full
+            self.error = e
+        finally:
+            # Later identical requests start a new call instead of replaying this one
+            self._close_to_joiners()
+            with self._condition:
+                self.done = True
+                self._condition.notify_all()
+
+    def _close_to_joiners(self) -> None:
+        # SingleFlight's lock is taken before the condition, so this runs without it
+        if self._joinable:
+            self._forget()
+            with self._condition:
+                self._joinable = False
+                self._trim()
+
+    def _produce(self) -> None:
+        iterator = None
+        try:
+            iterator = self._generate()
+            for chunk in iterator:
+                with self._condition:
+                    while (not self._abandoned and self._positions
+                           and self._base + len(self._chunks) - min(self._positions.values()) >= self.max_buffer):
+                        self._condition.wait()
+                    if self._abandoned:
+                        break
+                    self._chunks.append(chunk)
+                    produced = self._base + len(self._chunks)
+                    self._condition.notify_all()
+                if produced >= self.max_buffer:
+                    self._close_to_joiners()
+        except Exception as e:
+            self.error = e
+        finally:
+            close = getattr(iterator, 'close', None)
+            if close:
+                close()
+
+    def read(self, subscriber: object) -> Iterator[str]:
+        while True:
+            with self._condition:
+                position = self._positions[subscriber]
+                while position == self._base + len(self._chunks) and not self.done:
+                    self._condition.wait()
+                if position == self._base + len(self._chunks):
+                    error = self.error
+                    break
+                chunk = self._chunks[position - self._base]
+                self._positions[subscriber] = position + 1
+                self._trim()
+                self._condition.notify_all()
+            yield chunk
+        if error is not None:
+            raise error
+
+
+class SingleFlight:
+    """Coalesces identical in-flight calls so only the first one reaches the provider
+
+    Callers arriving while a call with the same key is running wait for it and share
+    its result or exception. Only deterministic requests should be coalesced.
+    """
+
+    def __init__(self):
+        self._calls: Dict[str, _Flight] = {}
+        self._streams: Dict[str, _SharedStream] = {}
+        self._lock = threading.Lock()
+        self._counts: Dict[str, Dict[str, int]] = {}
+
+    def _count(self, model: str, counter: str) -> None:
+        # Called with the lock held
+        counts = self._counts.setdefault(model, {'calls': 0, 'coalesced': 0})
+        counts[counter] += 1
+
+    def do(self, model: str, key: str, call: Callable[[], Any],
+           joined: Optional[Callable[[Any, Optional[BaseException]], None]] = None) -> Any:
+        """Run call, or wait for the identical call already in flight and return its result
+
+        joined is called with the shared result and error when this caller did not make
+        the call itself, e.g. so a coalesced request still gets its own audit entry.
+        """
+        with self._lock:
+            flight = self._calls.get(key)
+            leader = flight is None
+            if leader:
+                flight = self._calls[key] = _Flight()
+            self._count(model, 'calls' if leader else 'coalesced')
+
+        if not leader:
+            flight.done.wait()
+            if joined is not None:
+                joined(flight.result, flight.error)
+            if flight.error is not None:
+                raise flight.error
+            return flight.result
+
+        try:
+            flight.result = call()
+            return flight.result
+        except BaseException as e:
+            flight.error = e
+            raise
+        finally:
+            with self._lock:
+                del self._calls[key]
+            flight.done.set()
+
+    def stream(self, model: str, key: str, generate: Callable[[], Iterator[str]],
+               joined: Optional[Callable[[str, Optional[BaseException]], None]] = None,
+               runner: Optional[Callable[[Callable[[], None]], Any]] = None,
+               max_buffer: int = 64) -> Iterator[str]:
+        """Subscribe to the identical stream in flight, or start one
+
+        joined is called with the text this subscriber received, and any error, when it
+        followed a stream started by another caller. A new stream is produced through
+        runner, e.g. a bulkhead's run, and buffers at most max_buffer chunks.
+        """
+        def forget():
+            with self._lock:
+                if self._streams.get(key) is shared:
+                    del self._streams[key]
+
+        with self._lock:
+            shared = self._streams.get(key)
+            leader = shared is None
+            if leader:
+                shared = self._streams[key] = _SharedStream(generate, forget, runner, max_buffer)
+            shared.subscribers += 1
+            subscriber = shared.subscribe()
+            self._count(model, 'calls' if leader else 'coalesced')
+        if leader:
+            shared.start()
+        return self._follow(key, shared, subscriber, None if leader else joined)
+
+    def _follow(self, key: str, shared: _SharedStream, subscriber: object,
+                joined: Optional[Callable[[str, Optional[BaseException]], None]] = None) -> Iterator[str]:
+        received: List[str] = []
+        error: Optional[BaseException] = None
+        try:
+            for chunk in shared.read(subscriber):
+                received.append(chunk)
+                yield chunk
+        except Exception as e:
+            error = e
+            raise
+        finally:
+            if joined is not None:
+                joined(''.join(received), error)
+            shared.unsubscribe(subscriber)
+            with self._lock:
+                shared.subscribers -= 1
+                if shared.subscribers == 0 and not shared.done:
+                    # Nobody is listening any more, so stop paying for generation; dropping
+                    # it under the lock keeps new subscribers from joining a truncated stream
+                    shared.abandon()
+                    if self._streams.get(key) is shared:
+                        del self._streams[key]
+
+    @property
+    def stats(self) -> Dict[str, Dict[str, int]]:
+        with self._lock:
+            return {model: dict(counts) for model, counts in self._counts.items()}
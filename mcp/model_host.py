@@ -0,0 +1,176 @@
+from typing import Dict, Any, Callable, Optional
+import argparse
+import base64
+import json
+import os
+import socketserver
+
+from dotenv import load_dotenv
+
+from mcp.core.fanout import is_error_result
+from mcp.core.model_registry import ModelRegistry
+from mcp.utils.ipc import send_message, recv_message, pack_vectors
+
+# Load environment variables
+load_dotenv()
+
+DEFAULT_SOCKET = '/tmp/mcp-model-host.sock'
+
+# Adapter methods clients may call; everything else is rejected
+ALLOWED_METHODS = (
+    'generate_text', 'generate_chat_response', 'complete_text',
+    'embed_text', 'embed_texts', 'analyze_image', 'moderate_content'
+)
+_VECTOR_METHODS = ('embed_text', 'embed_texts')
+_STREAM_METHODS = ('stream_chat_response',)
+
+
+def local_model_configs() -> Dict[str, Dict[str, Any]]:
+    """Local model configurations from LOCAL_LLAMA_* environment variables"""
+    configs = {}
+    if os.getenv('LOCAL_LLAMA_MODEL_PATH'):
+        configs['local_llama'] = {'type': 'local_llama', 'config': {
+            'model_path': os.getenv('LOCAL_LLAMA_MODEL_PATH'),
+            'n_gpu_layers': int(os.getenv('LOCAL_LLAMA_N_GPU_LAYERS', '-1')),
+            'n_ctx': int(os.getenv('LOCAL_LLAMA_N_CTX', '2048')),
+            'n_threads': int(os.getenv('LOCAL_LLAMA_N_THREADS', '0')),
+            'n_threads_batch': int(os.getenv('LOCAL_LLAMA_N_THREADS_BATCH', '0')),
+            'n_batch': int(os.getenv('LOCAL_LLAMA_N_BATCH', '0')),
+            'cpu_affinity': os.getenv('LOCAL_LLAMA_CPU_AFFINITY'),
+            'autotune': os.getenv('LOCAL_LLAMA_AUTOTUNE', 'false').lower() == 'true',
+            'chat_format': os.getenv('LOCAL_LLAMA_CHAT_FORMAT', 'llama-2'),
+            'memory_budget_mb': int(os.getenv('LOCAL_LLAMA_MEMORY_BUDGET_MB', '0')),
+            'embedding_model_path': os.getenv('LOCAL_LLAMA_EMBEDDING_MODEL_PATH'),
+            'embedding_n_ctx': int(os.getenv('LOCAL_LLAMA_EMBEDDING_N_CTX', '2048')),
+            'embedding_pooling': os.getenv('LOCAL_LLAMA_EMBEDDING_POOLING', 'mean'),
+            'embedding_normalize': os.getenv('LOCAL_LLAMA_EMBEDDING_NORMALIZE', 'true').lower() == 'true'
+        }}
+    return configs
+
+
+class ModelHost:
+    """Owns the local models and serves them to web workers over a Unix domain socket"""
+
+    def __init__(self, socket_path: str, models: ModelRegistry, shm_threshold: int = 64 * 1024):
+        self.socket_path = socket_path
+        self.models = models
+        self.shm_threshold = shm_threshold
+
+    def dispatch(self, request: Dict[str, Any]) -> Dict[str, Any]:
+        """Run one request against a hosted model and build the reply"""
+        method = request.get('method')
+        if method == 'list_models':
+            return {'result': {
+                name: {
+                    'capabilities': model.capabilities,
+                    'model_info': model.model_info,
+                    # Option names per route; clients look the specs up in their own tables
+                    'options': {route: sorted(specs) for route, specs in
+                                (getattr(model, 'option_schema', None) or {}).items()}
+                }
+                for name, model in self.models.items()
+            }}
+        if method not in ALLOWED_METHODS:
+            return {'error': f"Unknown method: {method}", 'type': 'ValueError'}
+        name = request.get('model')
+        if name not in self.models:
+            return {'error': f"Model {name} is not loaded on this host", 'type': 'KeyError'}
+
+        args = request.get('args', [])
+        if method == 'analyze_image' and args:
+            args = [base64.b64decode(args[0])] + args[1:]
+        try:
+            with self.models.use(name) as model:
+                result = getattr(model, method)(*args, **request.get('kwargs', {}))
+        except Exception as e:
+            return {'error': str(e), 'type': type(e).__name__}
+
+        if method in _VECTOR_METHODS:
+            if is_error_result(result):
+                return {'error': result['error'], 'type': 'RuntimeError'}
+            vectors = [result] if method == 'embed_text' else result
+            # Large embedding payloads go through shared memory instead of the socket
+            return {'vectors': pack_vectors(vectors, self.shm_threshold)}
+        return {'result': result}
+
+    def stream(self, request: Dict[str, Any], send: Callable[[Dict[str, Any]], None]) -> None:
+        """Send each chunk of a streaming call as its own message, then a final done message"""
+        name = request.get('model')
+        if name not in self.models:
+            send({'error': f"Model {name} is not loaded on this host", 'type': 'KeyError'})
+            return
+        with self.models.use(name) as model:
+            chunks = None
+            try:
+                chunks = getattr(model, request['method'])(*request.get('args', []), **request.get('kwargs', {}))
+                for chunk in chunks:
+                    # A send failing because the client hung up ends generation here
+                    send({'chunk': chunk})
+            except ConnectionError:
+                raise
+            except Exception as e:
+                send({'error': str(e), 'type': type(e).__name__})
+                return
+            finally:
+                if chunks is not None and hasattr(chunks, 'close'):
+                    chunks.close()
+        send({'done': True})
+
+    def serve_forever(self) -> None:
+        host = self
+
+        class Handler(socketserver.BaseRequestHandler):
+            def handle(self):
+                while True:
+                    try:
+                        request = recv_message(self.request)
+                        if request is None:
+                            return
+                        reply_to = lambda reply: send_message(self.request, dict(reply, id=request.get('id')))
+                        if request.get('method') in _STREAM_METHODS:
+                            host.stream(request, reply_to)
+                        else:
+                            reply_to(host.dispatch(request))
+                    except (ConnectionError, ValueError):
+                        # Client went away or sent a malformed frame
+                        return
+
+        if os.path.exists(self.socket_path):
+            os.remove(self.socket_path)
+        with socketserver.ThreadingUnixStreamServer(self.socket_path, Handler) as server:
+            server.daemon_threads = True
+            # Only processes running as the same user may talk to the host
+            os.chmod(self.socket_path, 0o600)
+            print(f"Model host serving {', '.join(self.models) or 'no models'} on {self.socket_path}")
+            try:
+                server.serve_forever()
+            finally:
+                os.remove(self.socket_path)
+
+
+def main(argv: Optional[list] = None) -> None:
+    parser = argparse.ArgumentParser(description='Serve local models to MCP workers over a Unix socket')
+    parser.add_argument('--socket', default=os.getenv('MODEL_HOST_SOCKET', DEFAULT_SOCKET),
+                        help='Unix socket path to listen on')
+    parser.add_argument('--config', help='JSON file of {name: {"type": ..., "config": {...}}} to load')
+    parser.add_argument('--shm-threshold', type=int,
+                        default=int(os.getenv('MODEL_HOST_SHM_THRESHOLD', str(64 * 1024))),
+                        help='Embedding payloads of at least this many bytes use shared memory')
+    args = parser.parse_args(argv)
+
+    if args.config:
+        with open(args.config) as f:
+            configs = json.load(f)
+    else:
+        configs = local_model_configs()
+    if not configs:
+        parser.error('No models configured; set LOCAL_LLAMA_MODEL_PATH or pass --config')
+
+    models = ModelRegistry()
+    for name, spec in configs.items():
+        models.load(name, spec['type'], spec['config'], background=False)
+    ModelHost(args.socket, models, args.shm_threshold).serve_forever()
+
+
+if __name__ == '__main__':
+    main()
@@ -1,16 +1,22 @@
 from flask import Flask, request, jsonify
-from llama_cpp import Llama
 import os
 from dotenv import load_dotenv
 import sys
 import argparse
 
+from mcp.adapters.ai.model_host_adapter import ModelHostAdapter
+from mcp.core.chat_template import ChatTemplate, TokenizedPromptCache
+from mcp.utils.cpu_topology import pin_to_cores, resolve_thread_settings
+from mcp.utils.memory_budget import plan_memory, MemoryBudgetError
+
 # Load environment variables
 load_dotenv()
 
 app = Flask(__name__)
 
 def initialize_model():
+    from llama_cpp import Llama
+    
     # Try to get model path from environment variable
     model_path = os.getenv('LOCAL_LLAMA_MODEL_PATH')
     
@@ -40,14 +46,39 @@ def initialize_model():
     
     n_gpu_layers = int(os.getenv('LOCAL_LLAMA_N_GPU_LAYERS', '-1'))
     n_ctx = int(os.getenv('LOCAL_LLAMA_N_CTX', '4096'))  # Increased context window
+    threads = resolve_thread_settings({
+        'model_path': model_path,
+        'n_threads': int(os.getenv('LOCAL_LLAMA_N_THREADS', '0')),
+        'n_threads_batch': int(os.getenv('LOCAL_LLAMA_N_THREADS_BATCH', '0')),
+        'n_batch': int(os.getenv('LOCAL_LLAMA_N_BATCH', '0')),
+        'cpu_affinity': os.getenv('LOCAL_LLAMA_CPU_AFFINITY'),
+        'autotune': os.getenv('LOCAL_LLAMA_AUTOTUNE', 'false').lower() == 'true'
+    })
+    if threads['cpu_affinity']:
+        # This process serves only this model, so it is pinned as a whole before request threads start
+        pin_to_cores(threads['cpu_affinity'])
+    
+    # Fit context size and KV cache type to the memory budget, if one is set
+    memory_settings = {'n_ctx': n_ctx}
+    budget_mb = int(os.getenv('LOCAL_LLAMA_MEMORY_BUDGET_MB', '0'))
+    if budget_mb:
+        try:
+            plan = plan_memory(model_path, budget_mb * 2**20, n_ctx, threads['n_batch'])
+        except MemoryBudgetError as e:
+            print(f"Error loading model: {str(e)}")
+            sys.exit(1)
+        print(f"Memory budget {budget_mb} MiB: n_ctx {plan['n_ctx']}, KV cache {plan['kv_cache_type']}, "
+              f"estimated {plan['estimate']['total'] // 2**20} MiB")
+        memory_settings = {key: plan[key] for key in ('n_ctx', 'type_k', 'type_v', 'flash_attn', 'use_mmap', 'use_mlock')}
     
     try:
         llm = Llama(
             model_path=model_path,
             n_gpu_layers=n_gpu_layers,
-            n_ctx=n_ctx,
-            n_batch=512,  # Increased batch size for better performance
-            n_threads=4   # Use multiple threads for processing
+            n_batch=threads['n_batch'],                  # Prompt tokens per evaluation step
+            n_threads=threads['n_threads'],              # Decode threads (physical cores)
+            n_threads_batch=threads['n_threads_batch'],  # Prompt evaluation threads (all usable CPUs)
+            **memory_settings
         )
         print(f"Successfully loaded model from: {model_path}")
         return llm
@@ -55,8 +86,39 @@ def initialize_model():
         print(f"Error loading model: {str(e)}")
         sys.exit(1)
 
-# Initialize the model
-llm = initialize_model()
+# Initialize the model, or share the one loaded by the model host (python -m mcp.model_host)
+host = None
+if os.getenv('MODEL_HOST_SOCKET'):
+    host = ModelHostAdapter()
+    host.initialize({
+        'socket_path': os.getenv('MODEL_HOST_SOCKET'),
+        'model': os.getenv('MODEL_HOST_MODEL', 'local_llama')
+    })
+    print(f"Using model host at: {os.getenv('MODEL_HOST_SOCKET')}")
+else:
+    llm = initialize_model()
+    chat_template = ChatTemplate.from_llama(llm, fallback=os.getenv('LOCAL_LLAMA_CHAT_FORMAT', 'llama-2'))
+    prompt_cache = TokenizedPromptCache.for_llama(llm, chat_template)
+
+# Sampling settings shared by both endpoints
+SAMPLING = {
+    'top_p': 0.95,  # Added top_p for better response quality
+    'repeat_penalty': 1.1  # Added repeat penalty to avoid repetitive responses
+}
+
+def complete(prompt, options):
+    """Continue a raw prompt"""
+    if host:
+        return host.complete_text(prompt, options)
+    return llm(prompt, **options)['choices'][0]['text']
+
+def chat_completion(conversation, options):
+    """Answer a conversation using the model's chat format"""
+    if host:
+        return host.generate_chat_response(conversation, options)
+    # Earlier turns of the conversation reuse their cached tokens
+    tokens = prompt_cache.tokens_for(conversation, chat_template.render(conversation))
+    return llm(tokens, stop=chat_template.stop, **options)['choices'][0]['text']
 
 @app.route('/generate', methods=['POST'])
 def generate():
@@ -70,19 +132,17 @@ def generate():
         return jsonify({'error': 'No prompt provided'}), 400
     
     try:
-        # Combine system prompt and user prompt if system prompt is provided
-        full_prompt = f"System: {system_prompt}\n\nUser: {prompt}\n\nAssistant: " if system_prompt else prompt
-        
-        response = llm(
-            full_prompt,
-            max_tokens=max_tokens,
-            temperature=temperature,
-            top_p=0.95,  # Added top_p for better response quality
-            repeat_penalty=1.1,  # Added repeat penalty to avoid repetitive responses
-            stop=["User:", "\n\n"]
-        )
+        options = dict(SAMPLING, max_tokens=max_tokens, temperature=temperature)
+        # Use the model's chat format when a system prompt is provided
+        if system_prompt:
+            text = chat_completion([
+                {'role': 'system', 'content': system_prompt},
+                {'role': 'user', 'content': prompt}
+            ], options)
+        else:
+            text = complete(prompt, dict(options, stop=["User:", "\n\n"]))
         return jsonify({
-            'response': response['choices'][0]['text'].strip()
+            'response': text.strip()
         })
     except Exception as e:
         return jsonify({'error': str(e)}), 500
@@ -99,24 +159,14 @@ def chat():
         return jsonify({'error': 'No messages provided'}), 400
     
     try:
-        # Format messages into a prompt
-        prompt = f"System: {system_prompt}\n\n" if system_prompt else ""
-        for msg in messages:
-            role = msg.get('role', 'user')
-            content = msg.get('content', '')
-            prompt += f"{role.capitalize()}: {content}\n"
-        prompt += "Assistant: "
-        
-        response = llm(
-            prompt,
-            max_tokens=max_tokens,
-            temperature=temperature,
-            top_p=0.95,  # Added top_p for better response quality
-            repeat_penalty=1.1,  # Added repeat penalty to avoid repetitive responses
-            stop=["User:", "\n\n"]
-        )
+        conversation = [{'role': 'system', 'content': system_prompt}] if system_prompt else []
+        conversation += [
+            {'role': msg.get('role', 'user'), 'content': msg.get('content', '')}
+            for msg in messages
+        ]
+        text = chat_completion(conversation, dict(SAMPLING, max_tokens=max_tokens, temperature=temperature))
         return jsonify({
-            'response': response['choices'][0]['text'].strip()
+            'response': text.strip()
         })
     except Exception as e:
         return jsonify({'error': str(e)}), 500
@@ -126,7 +176,8 @@ def health_check():
     return jsonify({
         'status': 'healthy',
         'model_loaded': True,
-        'model_path': os.getenv('LOCAL_LLAMA_MODEL_PATH')
+        'model_path': os.getenv('LOCAL_LLAMA_MODEL_PATH'),
+        'model_host': os.getenv('MODEL_HOST_SOCKET')
     })
 
 if __name__ == '__main__':
@@ -0,0 +1,256 @@
+from typing import Dict, Any, List, Optional
+import base64
+import glob
+import gzip
+import json
+import os
+import queue
+import threading
+import time
+
+_STOP = object()
+
+# Segments this process has open, so recovery never seals one a live writer is still using
+_open_segments = set()
+_open_segments_lock = threading.Lock()
+
+
+def _pid_alive(pid: int) -> bool:
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        return True
+    return True
+
+
+class BatchedJsonlWriter:
+    """Drains a bounded in-memory queue into rotated, gzip-compressed JSONL segments from a background thread"""
+
+    def __init__(
+        self,
+        directory: str,
+        prefix: str = 'audit',
+        max_queue: int = 10000,
+        batch_size: int = 500,
+        flush_interval: float = 1.0,
+        segment_bytes: int = 64 * 1024 * 1024,
+        segment_seconds: float = 3600.0,
+        keep_segments: Optional[int] = None,
+        overflow: str = 'block',
+        block_timeout: Optional[float] = 5.0
+    ):
+        if overflow not in ('drop', 'block'):
+            raise ValueError(f"Unknown overflow policy: {overflow}")
+        self.directory = directory
+        self.prefix = prefix
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.segment_bytes = segment_bytes
+        self.segment_seconds = segment_seconds
+        self.keep_segments = keep_segments
+        self.overflow = overflow
+        self.block_timeout = block_timeout
+        self._queue: "queue.Queue[Any]" = queue.Queue(maxsize=max_queue)
+        self._segment = None
+        self._segment_path: Optional[str] = None
+        self._segment_started = 0.0
+        self._segment_written = 0
+        self._sequence = 0
+        self.written = 0
+        self.dropped = 0
+
+        os.makedirs(directory, exist_ok=True)
+        self._recover_partial_segments()
+        self._worker = threading.Thread(target=self._run, name=f'{prefix}-writer', daemon=True)
+        self._worker.start()
+
+    def write(self, record: Dict[str, Any]) -> bool:
+        """Queue a record; never touches the filesystem. Returns False if the record was dropped"""
+        try:
+            if self.overflow == 'drop':
+                self._queue.put_nowait(record)
+            else:
+                self._queue.put(record, timeout=self.block_timeout)
+            return True
+        except queue.Full:
+            self.dropped += 1
+            return False
+
+    def close(self, timeout: Optional[float] = None) -> None:
+        """Flush queued records, seal the current segment and stop the writer"""
+        self._queue.put(_STOP)
+        self._worker.join(timeout)
+
+    @property
+    def stats(self) -> Dict[str, Any]:
+        return {
+            'queued': self._queue.qsize(),
+            'written': self.written,
+            'dropped': self.dropped,
+            'overflow': self.overflow,
+            'segment': self._segment_path
+        }
+
+    def _recover_partial_segments(self) -> None:
+        # Segments left open by a crash are valid gzip up to the last flushed batch. Other
+        # processes may share the directory, so only seal segments whose writer is gone:
+        # its pid is dead, or it is this pid (reused after a restart) but not open here
+        for path in glob.glob(os.path.join(self.directory, f'{self.prefix}-*.jsonl.gz.part')):
+            try:
+                pid = int(os.path.basename(path).split('-')[-2])
+            except (IndexError, ValueError):
+                continue
+            with _open_segments_lock:
+                if path in _open_segments or (pid != os.getpid() and _pid_alive(pid)):
+                    continue
+                try:
+                    os.replace(path, path[:-len('.part')])
+                except FileNotFoundError:
+                    # Another process recovered it first
+                    pass
+
+    def _open_segment(self) -> None:
+        self._sequence += 1
+        stamp = time.strftime('%Y%m%dT%H%M%S', time.gmtime())
+        final = os.path.join(self.directory, f'{self.prefix}-{stamp}-{os.getpid()}-{self._sequence:04d}.jsonl.gz')
+        self._segment_path = final + '.part'
+        with _open_segments_lock:
+            _open_segments.add(self._segment_path)
+        try:
+            self._segment = gzip.open(self._segment_path, 'wb')
+        except OSError:
+            with _open_segments_lock:
+                _open_segments.discard(self._segment_path)
+            self._segment_path = None
+            raise
+        self._segment_started = time.monotonic()
+        self._segment_written = 0
+
+    def _seal_segment(self) -> None:
+        if self._segment is None:
+            return
+        segment, path = self._segment, self._segment_path
+        # The next batch opens a fresh segment even if sealing this one fails
+        self._segment = None
+        self._segment_path = None
+        with _open_segments_lock:
+            _open_segments.discard(path)
+        try:
+            segment.close()
+        finally:
+            os.replace(path, path[:-len('.part')])
+        if self.keep_segments:
+            sealed = sorted(glob.glob(os.path.join(self.directory, f'{self.prefix}-*.jsonl.gz')))
+            for path in sealed[:-self.keep_segments]:
+                os.remove(path)
+
+    def _write_batch(self, batch: List[Dict[str, Any]]) -> None:
+        if self._segment is None:
+            self._open_segment()
+        data = ''.join(json.dumps(record, default=_json_default) + '\n' for record in batch).encode()
+        self._segment.write(data)
+        # Sync flush so a crash loses at most the batch being written
+        self._segment.flush()
+        self._segment_written += len(data)
+        self.written += len(batch)
+
+        if (self._segment_written >= self.segment_bytes or
+                time.monotonic() - self._segment_started >= self.segment_seconds):
+            self._seal_segment()
+
+    def _run(self) -> None:
+        stopping = False
+        while not stopping:
+            batch = []
+            try:
+                item = self._queue.get(timeout=self.flush_interval)
+                deadline = time.monotonic() + self.flush_interval
+                while True:
+                    if item is _STOP:
+                        stopping = True
+                        break
+                    batch.append(item)
+                    if len(batch) >= self.batch_size:
+                        break
+                    item = self._queue.get(timeout=max(0.0, deadline - time.monotonic()))
+            except queue.Empty:
+                pass
+
+            try:
+                if batch:
+                    self._write_batch(batch)
+                elif (self._segment is not None and
+                        time.monotonic() - self._segment_started >= self.segment_seconds):
+                    self._seal_segment()
+            except Exception as e:
+                self.dropped += len(batch)
+                print(f"Warning: failed to write {self.prefix} batch: {str(e)}")
+        self._seal_segment()
+
+
+def _json_default(value: Any) -> Any:
+    if isinstance(value, (bytes, bytearray)):
+        return {'bytes': len(value)}
+    if hasattr(value, 'tolist'):
+        return value.tolist()
+    return str(value)
+
+
+class AuditLog:
+    """Compliance log of every prompt and completion, written asynchronously"""
+
+    def __init__(self, writer: BatchedJsonlWriter, include_images: bool = False):
+        self.writer = writer
+        self.include_images = include_images
+
+    def record(self, model: str, method: str, args: tuple, kwargs: Dict[str, Any],
+               result: Any = None, error: Optional[str] = None, duration_ms: Optional[float] = None,
+               coalesced: bool = False) -> None:
+        """Queue one request/response pair; serialisation happens on the writer thread
+
+        coalesced marks a request answered by an identical call already in flight, so
+        the provider was not called for it.
+        """
+        inputs = list(args)
+        if not self.include_images:
+            inputs = [{'bytes': len(arg)} if isinstance(arg, (bytes, bytearray)) else arg for arg in inputs]
+        else:
+            inputs = [base64.b64encode(arg).decode() if isinstance(arg, (bytes, bytearray)) else arg for arg in inputs]
+        self.writer.write({
+            'ts': time.time(),
+            'model': model,
+            'method': method,
+            'input': inputs,
+            'options': kwargs,
+            'output': result,
+            'error': error,
+            'duration_ms': duration_ms,
+            'coalesced': coalesced
+        })
+
+    @property
+    def stats(self) -> Dict[str, Any]:
+        return self.writer.stats
+
+    def close(self) -> None:
+        self.writer.close()
+
+
+def audit_log_from_env() -> Optional[AuditLog]:
+    """Build the audit log from AUDIT_LOG_* environment variables, if enabled"""
+    directory = os.getenv('AUDIT_LOG_DIR')
+    if not directory:
+        return None
+    keep = os.getenv('AUDIT_LOG_KEEP_SEGMENTS')
+    writer = BatchedJsonlWriter(
+        directory,
+        max_queue=int(os.getenv('AUDIT_LOG_QUEUE_SIZE', '10000')),
+        batch_size=int(os.getenv('AUDIT_LOG_BATCH_SIZE', '500')),
+        segment_bytes=int(os.getenv('AUDIT_LOG_SEGMENT_MB', '64')) * 1024 * 1024,
+        segment_seconds=float(os.getenv('AUDIT_LOG_SEGMENT_SECONDS', '3600')),
+        keep_segments=int(keep) if keep else None,
+        overflow=os.getenv('AUDIT_LOG_OVERFLOW', 'block')
+    )
+    return AuditLog(writer, include_images=os.getenv('AUDIT_LOG_INCLUDE_IMAGES', 'false').lower() == 'true')
@@ -0,0 +1,103 @@
+from typing import Any, Callable, Hashable, List, Optional, Tuple
+from concurrent.futures import Future
+import queue
+import threading
+import time
+
+class DynamicBatcher:
+    """Collects concurrent calls into batches processed together by a single worker thread"""
+
+    def __init__(
+        self,
+        process_batch: Callable[[List[Any]], List[Any]],
+        max_batch_size: int = 8,
+        max_wait_ms: float = 10.0,
+        key: Optional[Callable[[Any], Hashable]] = None,
+        name: str = 'batcher'
+    ):
+        self.process_batch = process_batch
+        self.max_batch_size = max(1, max_batch_size)
+        self.max_wait = max_wait_ms / 1000.0
+        self.key = key or (lambda item: None)
+        self.name = name
+        self._queue: "queue.Queue[Tuple[Any, Future]]" = queue.Queue()
+        self._pending: List[Tuple[Any, Future]] = []
+        self._worker: Optional[threading.Thread] = None
+        self._lock = threading.Lock()
+        self._closed = False
+
+    def submit(self, item: Any) -> Future:
+        """Queue an item and return a future for its result"""
+        if self._closed:
+            raise RuntimeError(f"{self.name} is closed")
+        future: Future = Future()
+        self._ensure_worker()
+        self._queue.put((item, future))
+        return future
+
+    def __call__(self, item: Any) -> Any:
+        """Queue an item and block until its batch has been processed"""
+        return self.submit(item).result()
+
+    def close(self) -> None:
+        """Stop the worker once queued items have been processed"""
+        self._closed = True
+        self._queue.put(None)
+
+    def _ensure_worker(self) -> None:
+        with self._lock:
+            if self._worker is None:
+                self._worker = threading.Thread(target=self._run, name=self.name, daemon=True)
+                self._worker.start()
+
+    def _next_batch(self) -> List[Tuple[Any, Future]]:
+        # Items left over from a previous round with a different key go first
+        if self._pending:
+            first = self._pending.pop(0)
+        else:
+            first = self._queue.get()
+            if first is None:
+                return []
+        batch_key = self.key(first[0])
+        batch = [first]
+
+        leftovers = []
+        for entry in self._pending:
+            if len(batch) < self.max_batch_size and self.key(entry[0]) == batch_key:
+                batch.append(entry)
+            else:
+                leftovers.append(entry)
+        self._pending = leftovers
+
+        deadline = time.monotonic() + self.max_wait
+        while len(batch) < self.max_batch_size:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                break
+            try:
+                entry = self._queue.get(timeout=remaining)
+            except queue.Empty:
+                break
+            if entry is None:
+                self._queue.put(None)
+                break
+            if self.key(entry[0]) == batch_key:
+                batch.append(entry)
+            else:
+                self._pending.append(entry)
+        return batch
+
+    def _run(self) -> None:
+        while True:
+            batch = self._next_batch()
+            if not batch:
+                return
+            items = [item for item, _ in batch]
+            try:
+                results = self.process_batch(items)
+                for (_, future), result in zip(batch, results):
+                    future.set_result(result)
+            except Exception as e:
+                for _, future in batch:
+                    if not future.done():
+                        future.set_exception(e)
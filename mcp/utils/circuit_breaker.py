@@ -0,0 +1,151 @@
+from typing import Dict, Any, Optional
+from collections import deque
+import os
+import threading
+import time
+
+CLOSED = 'closed'
+OPEN = 'open'
+HALF_OPEN = 'half_open'
+
+
+class CircuitOpenError(RuntimeError):
+    """Raised instead of calling a model whose circuit is open"""
+
+    def __init__(self, name: str, retry_after: float):
+        if retry_after > 0:
+            message = f"Model {name} is failing; circuit open for another {retry_after:.1f}s"
+        else:
+            message = f"Model {name} is recovering; probe requests are in flight"
+        super().__init__(message)
+        self.retry_after = retry_after
+
+
+class CircuitBreaker:
+    """Fails fast for a sick model: trips on error or slow-call rate, probes with limited traffic"""
+
+    def __init__(self, name: str, error_rate: float = 0.5, slow_call_ms: float = 10000.0,
+                 slow_call_rate: float = 0.5, window_seconds: float = 30.0, min_calls: int = 10,
+                 open_seconds: float = 30.0, half_open_calls: int = 2):
+        self.name = name
+        self.error_rate = error_rate
+        self.slow_call_ms = slow_call_ms
+        self.slow_call_rate = slow_call_rate
+        self.window_seconds = window_seconds
+        self.min_calls = min_calls
+        self.open_seconds = open_seconds
+        self.half_open_calls = half_open_calls
+        self.state = CLOSED
+        self._opened_at = 0.0
+        self._probes = 0
+        self._probe_successes = 0
+        # (finished_at, failed, slow) for calls inside the window
+        self._calls: deque = deque()
+        self._lock = threading.Lock()
+        self._counts = {'rejected': 0, 'trips': 0}
+
+    def before_call(self) -> None:
+        """Admit a call, or raise CircuitOpenError without touching the provider"""
+        with self._lock:
+            if self.state == OPEN:
+                remaining = self._opened_at + self.open_seconds - time.monotonic()
+                if remaining > 0:
+                    self._counts['rejected'] += 1
+                    raise CircuitOpenError(self.name, remaining)
+                self.state = HALF_OPEN
+                self._probes = 0
+                self._probe_successes = 0
+            if self.state == HALF_OPEN:
+                if self._probes >= self.half_open_calls:
+                    self._counts['rejected'] += 1
+                    raise CircuitOpenError(self.name, 0.0)
+                self._probes += 1
+
+    def record(self, failed: bool, duration_ms: float) -> None:
+        """Record the outcome of an admitted call"""
+        slow = duration_ms >= self.slow_call_ms
+        now = time.monotonic()
+        with self._lock:
+            if self.state == HALF_OPEN:
+                if failed or slow:
+                    self._trip(now)
+                else:
+                    self._probe_successes += 1
+                    if self._probe_successes >= self.half_open_calls:
+                        self.state = CLOSED
+                        self._calls.clear()
+                return
+            if self.state == OPEN:
+                # A call admitted before the trip finished late
+                return
+
+            self._calls.append((now, failed, slow))
+            while self._calls and self._calls[0][0] < now - self.window_seconds:
+                self._calls.popleft()
+            total = len(self._calls)
+            if total < self.min_calls:
+                return
+            failures = sum(1 for _, call_failed, _ in self._calls if call_failed)
+            slow_calls = sum(1 for _, _, call_slow in self._calls if call_slow)
+            if failures / total >= self.error_rate or slow_calls / total >= self.slow_call_rate:
+                self._trip(now)
+
+    def _trip(self, now: float) -> None:
+        self.state = OPEN
+        self._opened_at = now
+        self._calls.clear()
+        self._counts['trips'] += 1
+
+    @property
+    def info(self) -> Dict[str, Any]:
+        with self._lock:
+            info: Dict[str, Any] = dict(self._counts, state=self.state)
+            if self.state == OPEN:
+                info['retry_after'] = round(max(0.0, self._opened_at + self.open_seconds - time.monotonic()), 2)
+            else:
+                info['window_calls'] = len(self._calls)
+                info['window_failures'] = sum(1 for _, failed, _ in self._calls if failed)
+            return info
+
+
+class CircuitBreakerRegistry:
+    """One breaker per model entry; a replaced or unloaded model starts with a fresh breaker
+
+    A model entry may override the defaults with {"breaker": {"slow_call_ms": 60000, ...}},
+    e.g. for a local model whose normal latency would count as slow for a hosted API.
+    """
+
+    def __init__(self, **settings: Any):
+        self.settings = settings
+        self._breakers: Dict[str, CircuitBreaker] = {}
+        self._lock = threading.Lock()
+
+    def get(self, name: str, config: Optional[Dict[str, Any]] = None) -> CircuitBreaker:
+        breaker = self._breakers.get(name)
+        if breaker is None:
+            overrides = (config or {}).get('breaker') or {}
+            settings = dict(self.settings, **{key: value for key, value in overrides.items() if key in self.settings})
+            with self._lock:
+                breaker = self._breakers.setdefault(name, CircuitBreaker(name, **settings))
+        return breaker
+
+    def reset(self, name: str) -> None:
+        with self._lock:
+            self._breakers.pop(name, None)
+
+    def info(self, name: str) -> Dict[str, Any]:
+        breaker = self._breakers.get(name)
+        return breaker.info if breaker is not None else {'state': CLOSED}
+
+
+def circuit_breakers_from_env() -> CircuitBreakerRegistry:
+    """Build the breaker registry from BREAKER_* environment variables"""
+    return CircuitBreakerRegistry(
+        error_rate=float(os.getenv('BREAKER_ERROR_RATE', '0.5')),
+        slow_call_ms=float(os.getenv('BREAKER_SLOW_CALL_MS', '10000')),
+        slow_call_rate=float(os.getenv('BREAKER_SLOW_CALL_RATE', '0.5')),
+        window_seconds=float(os.getenv('BREAKER_WINDOW_SECONDS', '30')),
+        min_calls=int(os.getenv('BREAKER_MIN_CALLS', '10')),
+        open_seconds=float(os.getenv('BREAKER_OPEN_SECONDS', '30')),
+        half_open_calls=int(os.getenv('BREAKER_HALF_OPEN_CALLS', '2'))
+    )
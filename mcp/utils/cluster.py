@@ -0,0 +1,152 @@
+from typing import Dict, Any, Iterable, List, Optional, Tuple
+from bisect import bisect
+import hashlib
+import os
+import threading
+
+import requests
+
+# Set on requests a node forwards, so the receiving node serves them instead of forwarding again
+FORWARDED_HEADER = 'X-MCP-Forwarded'
+SESSION_HEADER = 'X-Session-Id'
+
+# Hop-by-hop and length headers are recomputed by whoever sends the message on
+_SKIPPED_HEADERS = {'connection', 'keep-alive', 'transfer-encoding', 'content-length', 'content-encoding', 'host'}
+
+
+def _point(value: str) -> int:
+    return int.from_bytes(hashlib.blake2b(value.encode(), digest_size=8).digest(), 'big')
+
+
+class HashRing:
+    """Consistent-hash ring with virtual nodes
+
+    Adding or removing a node only moves the keys in the arcs that node owns, about
+    1/N of them, so most sessions keep their owner when membership changes.
+    """
+
+    def __init__(self, nodes: Iterable[str] = (), replicas: int = 100):
+        self.replicas = replicas
+        self.nodes = tuple(sorted(set(nodes)))
+        ring = sorted((_point(f"{node}#{index}"), node) for node in self.nodes for index in range(replicas))
+        self._points = [point for point, _ in ring]
+        self._owners = [node for _, node in ring]
+
+    def owner(self, key: str) -> Optional[str]:
+        """The node owning key: the first virtual node clockwise from the key's hash"""
+        if not self._points:
+            return None
+        index = bisect(self._points, _point(key)) % len(self._points)
+        return self._owners[index]
+
+
+class Cluster:
+    """This node's view of its peers, used to send each session to the node that owns it
+
+    Peers are health-checked in the background. The ring holds the peers that are up
+    (and this node), and is rebuilt whenever one goes down or comes back, so a dead
+    node's sessions move to the surviving nodes and return once it recovers.
+    """
+
+    def __init__(self, self_url: str, peers: List[str], replicas: int = 100,
+                 health_interval: float = 2.0, forward_timeout: float = 300.0, fail_threshold: int = 2):
+        self.self_url = self_url.rstrip('/')
+        self.peers = [peer.rstrip('/') for peer in peers if peer.rstrip('/') != self.self_url]
+        self.replicas = replicas
+        self.health_interval = health_interval
+        self.forward_timeout = forward_timeout
+        self.fail_threshold = fail_threshold
+        # Peers start up; a node that is down is dropped after its first failed checks
+        self._failures = {peer: 0 for peer in self.peers}
+        self._lock = threading.Lock()
+        self.ring = HashRing([self.self_url] + self.peers, replicas)
+        self.rebalances = 0
+        self._counts = {'local': 0, 'forwarded': 0, 'forward_failed': 0, 'received': 0}
+        # One pooled session keeps connections to peers alive between forwards
+        self._http = requests.Session()
+        self._stopped = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+    def start(self) -> 'Cluster':
+        if self._thread is None and self.peers:
+            self._thread = threading.Thread(target=self._run, name='cluster-health', daemon=True)
+            self._thread.start()
+        return self
+
+    def stop(self) -> None:
+        self._stopped.set()
+
+    def owner(self, key: str) -> str:
+        return self.ring.owner(key) or self.self_url
+
+    def is_local(self, key: str) -> bool:
+        return self.owner(key) == self.self_url
+
+    def count(self, outcome: str) -> None:
+        with self._lock:
+            self._counts[outcome] += 1
+
+    def _set_health(self, peer: str, healthy: bool) -> None:
+        with self._lock:
+            self._failures[peer] = 0 if healthy else self._failures[peer] + 1
+            live = [self.self_url] + [p for p in self.peers if self._failures[p] < self.fail_threshold]
+            if tuple(sorted(live)) != self.ring.nodes:
+                # Rebalance: keys owned by the changed node move, all others stay put
+                self.ring = HashRing(live, self.replicas)
+                self.rebalances += 1
+
+    def _check(self, peer: str) -> bool:
+        try:
+            response = self._http.get(f"{peer}/cluster/health", timeout=min(self.health_interval, 5.0))
+            return response.status_code == 200
+        except requests.RequestException:
+            return False
+
+    def _run(self) -> None:
+        while not self._stopped.wait(self.health_interval):
+            for peer in self.peers:
+                self._set_health(peer, self._check(peer))
+
+    def forward(self, owner: str, method: str, path: str, query: bytes, headers: Dict[str, str],
+                body: bytes) -> Optional[Tuple[int, Dict[str, str], bytes]]:
+        """Send a request on to its owner; returns None if the owner could not be reached"""
+        headers = {name: value for name, value in headers.items() if name.lower() not in _SKIPPED_HEADERS}
+        headers[FORWARDED_HEADER] = self.self_url
+        url = f"{owner}{path}" + (f"?{query.decode()}" if query else '')
+        try:
+            response = self._http.request(method, url, headers=headers, data=body, timeout=self.forward_timeout)
+        except requests.RequestException:
+            # Serve it here rather than fail; the health check takes the owner out of the ring
+            self._set_health(owner, False)
+            self.count('forward_failed')
+            return None
+        self.count('forwarded')
+        reply_headers = {name: value for name, value in response.headers.items()
+                         if name.lower() not in _SKIPPED_HEADERS}
+        return response.status_code, reply_headers, response.content
+
+    @property
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return dict(
+                self._counts,
+                node=self.self_url,
+                members=list(self.ring.nodes),
+                down=[peer for peer in self.peers if self._failures[peer] >= self.fail_threshold],
+                rebalances=self.rebalances
+            )
+
+
+def cluster_from_env() -> Optional[Cluster]:
+    """Build the cluster view from CLUSTER_* environment variables, if clustering is enabled"""
+    peers = [peer.strip() for peer in os.getenv('CLUSTER_PEERS', '').split(',') if peer.strip()]
+    self_url = os.getenv('CLUSTER_SELF_URL')
+    if not peers or not self_url:
+        return None
+    return Cluster(
+        self_url,
+        peers,
+        replicas=int(os.getenv('CLUSTER_REPLICAS', '100')),
+        health_interval=float(os.getenv('CLUSTER_HEALTH_INTERVAL', '2')),
+        forward_timeout=float(os.getenv('CLUSTER_FORWARD_TIMEOUT', '300'))
+    ).start()
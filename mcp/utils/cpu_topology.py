@@ -0,0 +1,201 @@
+from typing import Dict, Any, Iterator, List, Optional, Set
+from contextlib import contextmanager
+import json
+import math
+import os
+import time
+
+DEFAULT_TUNING_CACHE = os.path.expanduser('~/.cache/mcp/thread_tuning.json')
+
+
+def parse_cpu_list(spec: str) -> List[int]:
+    """Parse a Linux style CPU list such as '0-3,8,10-11'"""
+    cpus: Set[int] = set()
+    for part in spec.split(','):
+        part = part.strip()
+        if not part:
+            continue
+        if '-' in part:
+            start, end = part.split('-', 1)
+            cpus.update(range(int(start), int(end) + 1))
+        else:
+            cpus.add(int(part))
+    return sorted(cpus)
+
+
+def affinity_cores() -> List[int]:
+    """Return the CPUs this process is allowed to run on"""
+    if hasattr(os, 'sched_getaffinity'):
+        return sorted(os.sched_getaffinity(0))
+    return list(range(os.cpu_count() or 1))
+
+
+def cgroup_cpu_quota() -> Optional[float]:
+    """Return the CPU quota imposed by cgroups (in cores), or None if unlimited"""
+    try:
+        # cgroup v2: "<quota> <period>" or "max <period>"
+        with open('/sys/fs/cgroup/cpu.max') as f:
+            quota, period = f.read().split()[:2]
+        if quota != 'max':
+            return int(quota) / int(period)
+        return None
+    except (OSError, ValueError):
+        pass
+    try:
+        with open('/sys/fs/cgroup/cpu/cpu.cfs_quota_us') as f:
+            quota = int(f.read())
+        with open('/sys/fs/cgroup/cpu/cpu.cfs_period_us') as f:
+            period = int(f.read())
+        if quota > 0 and period > 0:
+            return quota / period
+    except (OSError, ValueError):
+        pass
+    return None
+
+
+def usable_cores() -> int:
+    """Number of logical CPUs we can actually keep busy given affinity and cgroup quota"""
+    cores = len(affinity_cores())
+    quota = cgroup_cpu_quota()
+    if quota is not None:
+        cores = min(cores, max(1, math.floor(quota)))
+    return max(1, cores)
+
+
+def physical_cores(cpus: Optional[List[int]] = None) -> int:
+    """Count distinct physical cores among the given logical CPUs (hyperthreads share a core)"""
+    cpus = cpus if cpus is not None else affinity_cores()
+    seen = set()
+    for cpu in cpus:
+        base = f'/sys/devices/system/cpu/cpu{cpu}/topology'
+        try:
+            with open(f'{base}/physical_package_id') as f:
+                package = f.read().strip()
+            with open(f'{base}/core_id') as f:
+                core = f.read().strip()
+        except OSError:
+            return len(cpus)
+        seen.add((package, core))
+    return len(seen) or len(cpus)
+
+
+def recommended_threads() -> Dict[str, int]:
+    """Thread counts for llama.cpp: decode is memory bound, prompt evaluation is compute bound"""
+    usable = usable_cores()
+    return {
+        # One decode thread per physical core; extra hyperthreads only add contention
+        'n_threads': max(1, min(physical_cores(), usable)),
+        'n_threads_batch': usable
+    }
+
+
+def pin_to_cores(cores: List[int]) -> None:
+    """Restrict the calling thread, and threads it starts afterwards, to the given CPUs
+
+    Only suitable for a process that serves a single model, called before any other
+    threads start; servers hosting several models use pinned() around inference instead.
+    """
+    if not hasattr(os, 'sched_setaffinity'):
+        print("Warning: CPU pinning is not supported on this platform")
+        return
+    os.sched_setaffinity(0, set(cores))
+
+
+@contextmanager
+def pinned(cores: Optional[List[int]]) -> Iterator[None]:
+    """Run the calling thread on the given CPUs for the duration of the block
+
+    llama.cpp starts its compute threads from the thread that evaluates, so they
+    inherit the pinning; the thread's previous CPUs are restored afterwards.
+    """
+    if not cores or not hasattr(os, 'sched_setaffinity'):
+        yield
+        return
+    previous = os.sched_getaffinity(0)
+    os.sched_setaffinity(0, set(cores))
+    try:
+        yield
+    finally:
+        os.sched_setaffinity(0, previous)
+
+
+def _tuning_key(model_path: str) -> str:
+    stat = os.stat(model_path)
+    return f"{os.path.abspath(model_path)}:{stat.st_size}:{','.join(map(str, affinity_cores()))}:{usable_cores()}"
+
+
+def autotune(model_path: str, cache_path: str = DEFAULT_TUNING_CACHE,
+             prompt_tokens: int = 256, decode_tokens: int = 32) -> Dict[str, int]:
+    """Benchmark a few thread/batch settings for a model and remember the fastest"""
+    key = _tuning_key(model_path)
+    cache: Dict[str, Any] = {}
+    if os.path.exists(cache_path):
+        with open(cache_path) as f:
+            cache = json.load(f)
+        if key in cache:
+            return cache[key]
+
+    from llama_cpp import Llama
+
+    usable = usable_cores()
+    physical = min(physical_cores(), usable)
+    thread_options = sorted({max(1, physical // 2), physical, usable})
+    batch_options = [256, 512]
+
+    best_prompt = (0.0, None)
+    best_decode = (0.0, None)
+    for n_threads in thread_options:
+        for n_batch in batch_options:
+            llm = Llama(model_path=model_path, n_ctx=prompt_tokens + decode_tokens + 16,
+                        n_threads=n_threads, n_threads_batch=n_threads, n_batch=n_batch,
+                        n_gpu_layers=0, use_mmap=True, verbose=False)
+            tokens = llm.tokenize(b" hello" * prompt_tokens)[:prompt_tokens]
+
+            start = time.perf_counter()
+            llm.eval(tokens)
+            prompt_rate = len(tokens) / (time.perf_counter() - start)
+
+            start = time.perf_counter()
+            for _ in range(decode_tokens):
+                llm.eval([llm.sample(temp=0.0)])
+            decode_rate = decode_tokens / (time.perf_counter() - start)
+            if hasattr(llm, 'close'):
+                llm.close()
+
+            print(f"Autotune n_threads={n_threads} n_batch={n_batch}: "
+                  f"prompt {prompt_rate:.1f} tok/s, decode {decode_rate:.1f} tok/s")
+            if prompt_rate > best_prompt[0]:
+                best_prompt = (prompt_rate, (n_threads, n_batch))
+            if decode_rate > best_decode[0]:
+                best_decode = (decode_rate, n_threads)
+
+    result = {
+        'n_threads': best_decode[1],
+        'n_threads_batch': best_prompt[1][0],
+        'n_batch': best_prompt[1][1]
+    }
+    cache[key] = result
+    os.makedirs(os.path.dirname(cache_path) or '.', exist_ok=True)
+    with open(cache_path, 'w') as f:
+        json.dump(cache, f, indent=2)
+    return result
+
+
+def resolve_thread_settings(config: Dict[str, Any]) -> Dict[str, Any]:
+    """Merge explicit settings over autotuned or detected defaults
+
+    cpu_affinity comes back as a CPU list (or None) for the caller to pin inference to.
+    """
+    cores = config.get('cpu_affinity')
+    if isinstance(cores, str):
+        cores = parse_cpu_list(cores)
+    cores = list(cores) if cores else None
+    # Thread counts are sized (and tuned) for the CPUs inference will be pinned to
+    with pinned(cores):
+        settings: Dict[str, Any] = dict(recommended_threads(), n_batch=512, cpu_affinity=cores)
+        if config.get('autotune') and config.get('model_path'):
+            settings.update(autotune(config['model_path'], config.get('tuning_cache', DEFAULT_TUNING_CACHE)))
+    for key in ('n_threads', 'n_threads_batch', 'n_batch'):
+        if config.get(key):
+            settings[key] = int(config[key])
+    return settings
@@ -0,0 +1,69 @@
+from typing import Dict, Any, BinaryIO
+import struct
+
+GGUF_MAGIC = b'GGUF'
+
+# GGUF value type ids -> struct format of scalar values
+_SCALAR_FORMATS = {
+    0: '<B', 1: '<b', 2: '<H', 3: '<h', 4: '<I', 5: '<i',
+    6: '<f', 7: '<?', 10: '<Q', 11: '<q', 12: '<d'
+}
+_STRING = 8
+_ARRAY = 9
+
+
+class GGUFLength(int):
+    """Length of a metadata array whose values were skipped rather than read"""
+
+
+def _read(f: BinaryIO, fmt: str) -> Any:
+    size = struct.calcsize(fmt)
+    data = f.read(size)
+    if len(data) != size:
+        raise ValueError("Truncated GGUF header")
+    return struct.unpack(fmt, data)[0]
+
+
+def _read_string(f: BinaryIO) -> str:
+    length = _read(f, '<Q')
+    return f.read(length).decode('utf-8', errors='replace')
+
+
+def _read_value(f: BinaryIO, value_type: int, max_array: int) -> Any:
+    if value_type in _SCALAR_FORMATS:
+        return _read(f, _SCALAR_FORMATS[value_type])
+    if value_type == _STRING:
+        return _read_string(f)
+    if value_type == _ARRAY:
+        item_type = _read(f, '<I')
+        count = _read(f, '<Q')
+        if count <= max_array:
+            return [_read_value(f, item_type, max_array) for _ in range(count)]
+        # Large arrays (the vocabulary, merges) are skipped without decoding
+        if item_type in _SCALAR_FORMATS:
+            f.seek(count * struct.calcsize(_SCALAR_FORMATS[item_type]), 1)
+        elif item_type == _STRING:
+            for _ in range(count):
+                f.seek(_read(f, '<Q'), 1)
+        else:
+            for _ in range(count):
+                _read_value(f, item_type, max_array)
+        return GGUFLength(count)
+    raise ValueError(f"Unknown GGUF value type: {value_type}")
+
+
+def read_gguf_metadata(path: str, max_array: int = 64) -> Dict[str, Any]:
+    """Read the key/value metadata from a GGUF file header without loading any tensors"""
+    with open(path, 'rb') as f:
+        if f.read(4) != GGUF_MAGIC:
+            raise ValueError(f"Not a GGUF file: {path}")
+        version = _read(f, '<I')
+        if version < 2:
+            raise ValueError(f"Unsupported GGUF version {version}; re-convert the model")
+        tensor_count = _read(f, '<Q')
+        kv_count = _read(f, '<Q')
+        metadata: Dict[str, Any] = {'gguf.version': version, 'gguf.tensor_count': tensor_count}
+        for _ in range(kv_count):
+            key = _read_string(f)
+            metadata[key] = _read_value(f, _read(f, '<I'), max_array)
+    return metadata
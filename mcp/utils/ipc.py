@@ -0,0 +1,81 @@
+from typing import Dict, Any, List, Optional, Sequence
+from array import array
+from multiprocessing import resource_tracker, shared_memory
+import json
+import socket
+import struct
+
+# Every message is a 4-byte big-endian length followed by that many bytes of JSON
+_HEADER = struct.Struct('>I')
+MAX_MESSAGE_BYTES = 256 * 1024 * 1024
+
+
+def _recv_exactly(sock: socket.socket, size: int) -> Optional[bytes]:
+    buffer = bytearray(size)
+    view = memoryview(buffer)
+    received = 0
+    while received < size:
+        count = sock.recv_into(view[received:], size - received)
+        if not count:
+            return None
+        received += count
+    return bytes(buffer)
+
+
+def send_message(sock: socket.socket, message: Dict[str, Any]) -> None:
+    """Write one length-prefixed JSON message"""
+    data = json.dumps(message, separators=(',', ':')).encode()
+    sock.sendall(_HEADER.pack(len(data)) + data)
+
+
+def recv_message(sock: socket.socket) -> Optional[Dict[str, Any]]:
+    """Read one length-prefixed JSON message, or None if the peer closed the connection"""
+    header = _recv_exactly(sock, _HEADER.size)
+    if header is None:
+        return None
+    (length,) = _HEADER.unpack(header)
+    if length > MAX_MESSAGE_BYTES:
+        raise ValueError(f"Message of {length} bytes exceeds the {MAX_MESSAGE_BYTES} byte limit")
+    data = _recv_exactly(sock, length)
+    if data is None:
+        raise ConnectionError("Connection closed mid-message")
+    return json.loads(data)
+
+
+def pack_vectors(vectors: Sequence[Sequence[float]], shm_threshold: int) -> Dict[str, Any]:
+    """Encode float vectors inline, or in a shared memory block once they exceed the threshold
+
+    The receiver owns the block and must unlink it with unpack_vectors.
+    """
+    rows = len(vectors)
+    dim = len(vectors[0]) if rows else 0
+    if rows * dim * 4 < shm_threshold:
+        return {'vectors': [vector.tolist() if hasattr(vector, 'tolist') else list(vector) for vector in vectors]}
+    values = array('f')
+    for vector in vectors:
+        if hasattr(vector, 'astype'):
+            # NumPy rows are copied as raw float32 bytes
+            values.frombytes(vector.astype('float32').tobytes())
+        else:
+            values.extend(vector)
+    block = shared_memory.SharedMemory(create=True, size=len(values) * values.itemsize)
+    block.buf[:len(values) * values.itemsize] = values.tobytes()
+    # Ownership passes to the receiver; stop this process's tracker from unlinking it at exit
+    resource_tracker.unregister(block._name, 'shared_memory')
+    block.close()
+    return {'shm': block.name, 'shape': [rows, dim], 'dtype': 'float32'}
+
+
+def unpack_vectors(payload: Dict[str, Any]) -> List[List[float]]:
+    """Decode vectors written by pack_vectors, releasing any shared memory block"""
+    if 'vectors' in payload:
+        return payload['vectors']
+    rows, dim = payload['shape']
+    block = shared_memory.SharedMemory(name=payload['shm'])
+    try:
+        values = array('f')
+        values.frombytes(bytes(block.buf[:rows * dim * 4]))
+    finally:
+        block.close()
+        block.unlink()
+    return [values[row * dim:(row + 1) * dim].tolist() for row in range(rows)]
@@ -0,0 +1,139 @@
+from typing import Dict, Any, Optional, Sequence
+import os
+
+from .gguf import read_gguf_metadata
+
+# KV cache element types: name -> (ggml type id, bytes per element)
+KV_CACHE_TYPES = {
+    'f16': (1, 2.0),
+    'q8_0': (8, 34 / 32),
+    'q4_0': (2, 18 / 32)
+}
+
+# Fixed allowance for the llama.cpp context, tokenizer and Python objects
+_BASE_OVERHEAD = 64 * 1024 * 1024
+
+
+class MemoryBudgetError(RuntimeError):
+    """Raised when no load settings fit a model into its memory budget"""
+
+
+def process_rss_bytes() -> Optional[int]:
+    """Resident set size of this process, if it can be determined"""
+    try:
+        with open('/proc/self/statm') as f:
+            return int(f.read().split()[1]) * os.sysconf('SC_PAGE_SIZE')
+    except (OSError, ValueError, IndexError):
+        pass
+    try:
+        import resource
+        # Peak rather than current RSS, but the closest portable figure (KiB on Linux, bytes on macOS)
+        peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        return peak if os.uname().sysname == 'Darwin' else peak * 1024
+    except (ImportError, AttributeError):
+        return None
+
+
+def model_dimensions(metadata: Dict[str, Any]) -> Dict[str, int]:
+    """Pull the sizes that drive memory use out of GGUF metadata"""
+    arch = metadata.get('general.architecture', 'llama')
+
+    def field(name: str, default: Any = None) -> Any:
+        value = metadata.get(f'{arch}.{name}', default)
+        # Some architectures store per-layer head counts as arrays
+        if isinstance(value, list):
+            value = max(value) if value else default
+        return value
+
+    n_embd = field('embedding_length')
+    n_head = field('attention.head_count')
+    n_layer = field('block_count')
+    if not (n_embd and n_head and n_layer):
+        raise ValueError(f"GGUF metadata is missing model dimensions for architecture {arch}")
+    n_head_kv = field('attention.head_count_kv', n_head)
+    tokens = metadata.get('tokenizer.ggml.tokens')
+    if isinstance(tokens, list):
+        tokens = len(tokens)
+    n_vocab = field('vocab_size') or tokens or 32000
+    return {
+        'n_layer': int(n_layer),
+        'n_embd': int(n_embd),
+        'n_head': int(n_head),
+        'n_head_kv': int(n_head_kv),
+        'head_dim_k': int(field('attention.key_length', n_embd // n_head)),
+        'head_dim_v': int(field('attention.value_length', n_embd // n_head)),
+        'n_vocab': int(n_vocab),
+        'n_ctx_train': int(field('context_length', 0))
+    }
+
+
+def estimate_memory(model_path: str, n_ctx: int, n_batch: int = 512, kv_type: str = 'f16',
+                    logits_all: bool = False, flash_attn: bool = False,
+                    metadata: Optional[Dict[str, Any]] = None) -> Dict[str, int]:
+    """Estimate the bytes a llama.cpp model needs with the given settings, by component"""
+    dims = model_dimensions(metadata if metadata is not None else read_gguf_metadata(model_path))
+    kv_bytes = KV_CACHE_TYPES[kv_type][1]
+    n_batch = min(n_batch, n_ctx)
+
+    kv_cache = int(dims['n_layer'] * n_ctx * dims['n_head_kv'] *
+                   (dims['head_dim_k'] + dims['head_dim_v']) * kv_bytes)
+    # llama-cpp-python keeps a float32 score row per position when logits_all, else per batch slot
+    logits = (n_ctx if logits_all else n_batch) * dims['n_vocab'] * 4
+    # Compute buffer: activations plus, without flash attention, the KQ matrix for one batch
+    compute = n_batch * dims['n_embd'] * 4 * 8 + n_batch * dims['n_vocab'] * 4
+    if not flash_attn:
+        compute += n_batch * n_ctx * dims['n_head'] * 4
+    estimate = {
+        'weights': os.path.getsize(model_path),
+        'kv_cache': kv_cache,
+        'logits': logits,
+        'compute': compute + _BASE_OVERHEAD
+    }
+    estimate['total'] = sum(estimate.values())
+    return estimate
+
+
+def plan_memory(model_path: str, budget_bytes: int, n_ctx: int, n_batch: int = 512,
+                logits_all: bool = False, min_ctx: int = 512,
+                kv_types: Sequence[str] = ('f16', 'q8_0', 'q4_0')) -> Dict[str, Any]:
+    """Choose llama.cpp load settings that fit the model into a memory budget
+
+    The KV cache is quantised before the context is shrunk, since q8_0 keys and
+    values cost far less quality than a shorter context.
+    """
+    metadata = read_gguf_metadata(model_path)
+    n_ctx_train = model_dimensions(metadata)['n_ctx_train']
+    if n_ctx_train:
+        n_ctx = min(n_ctx, n_ctx_train)
+
+    smallest = None
+    ctx = n_ctx
+    while True:
+        for kv_type in kv_types:
+            # Quantised V caches need flash attention in llama.cpp
+            flash_attn = kv_type != 'f16'
+            estimate = estimate_memory(model_path, ctx, n_batch, kv_type, logits_all, flash_attn, metadata)
+            smallest = estimate
+            if estimate['total'] <= budget_bytes:
+                type_id = KV_CACHE_TYPES[kv_type][0]
+                return {
+                    'n_ctx': ctx,
+                    'kv_cache_type': kv_type,
+                    'type_k': type_id,
+                    'type_v': type_id,
+                    'flash_attn': flash_attn,
+                    'logits_all': logits_all,
+                    # Mapped weights stay in the shared page cache instead of a private copy
+                    'use_mmap': True,
+                    'use_mlock': False,
+                    'estimate': estimate
+                }
+        if ctx <= min_ctx:
+            break
+        ctx = max(min_ctx, ctx // 2)
+
+    raise MemoryBudgetError(
+        f"{os.path.basename(model_path)} needs at least ~{smallest['total'] // 2**20} MiB "
+        f"(weights {smallest['weights'] // 2**20} MiB, n_ctx {ctx}) but the budget is "
+        f"{budget_bytes // 2**20} MiB"
+    )
@@ -1,6 +1,10 @@
 from typing import Dict, Any, List, Optional
 import re
 
+# Compiled once: sanitize_prompt runs on every request
+_WHITESPACE_RE = re.compile(r'\s+')
+_DISALLOWED_CHARS_RE = re.compile(r'[^\w\s\.,!?\'"-]')
+
 class ModelValidator:
     """Validator for AI model inputs and configurations"""
     
@@ -76,13 +80,8 @@ class ModelValidator:
     @staticmethod
     def sanitize_prompt(prompt: str) -> str:
         """Sanitize prompt text"""
-        # Remove null bytes
-        prompt = prompt.replace('\x00', '')
-        
-        # Remove excessive whitespace
-        prompt = ' '.join(prompt.split())
-        
-        # Remove potentially harmful characters
-        prompt = re.sub(r'[^\w\s\.,!?\'"-]', '', prompt)
+        # Remove potentially harmful characters (null bytes included)
+        prompt = _DISALLOWED_CHARS_RE.sub('', prompt)
         
-        return prompt.strip() 
\ No newline at end of file
+        # Collapse whitespace runs in the same pass over the cleaned text
+        return _WHITESPACE_RE.sub(' ', prompt).strip() 
\ No newline at end of file
@@ -0,0 +1,177 @@
+from typing import Dict, Any, Iterator, List, Optional, Tuple
+from collections import deque
+import json
+import math
+import os
+import re
+import threading
+
+from .response_formatter import ResponseFormatter
+
+_WORD_RE = re.compile(r"[a-z0-9']+")
+
+
+class AhoCorasick:
+    """Multi-pattern matcher finding every occurrence of any term in a single pass over the text"""
+
+    def __init__(self, patterns: Dict[str, Any]):
+        # State 0 is the root; transitions, failure links and outputs are flat lists
+        self._goto: List[Dict[str, int]] = [{}]
+        self._fail: List[int] = [0]
+        self._out: List[List[Tuple[str, Any]]] = [[]]
+        for term, payload in patterns.items():
+            self._add(term.lower(), payload)
+        self._build()
+
+    def _add(self, term: str, payload: Any) -> None:
+        state = 0
+        for char in term:
+            nxt = self._goto[state].get(char)
+            if nxt is None:
+                nxt = len(self._goto)
+                self._goto[state][char] = nxt
+                self._goto.append({})
+                self._fail.append(0)
+                self._out.append([])
+            state = nxt
+        self._out[state].append((term, payload))
+
+    def _build(self) -> None:
+        pending = deque(self._goto[0].values())
+        while pending:
+            state = pending.popleft()
+            for char, nxt in self._goto[state].items():
+                pending.append(nxt)
+                fallback = self._fail[state]
+                while fallback and char not in self._goto[fallback]:
+                    fallback = self._fail[fallback]
+                self._fail[nxt] = self._goto[fallback].get(char, 0)
+                self._out[nxt] = self._out[nxt] + self._out[self._fail[nxt]]
+
+    def find(self, text: str) -> Iterator[Tuple[int, str, Any]]:
+        """Yield (start, term, payload) for every match in lowercase text"""
+        state = 0
+        goto, fail, out = self._goto, self._fail, self._out
+        for index, char in enumerate(text):
+            while state and char not in goto[state]:
+                state = fail[state]
+            state = goto[state].get(char, 0)
+            for term, payload in out[state]:
+                yield index - len(term) + 1, term, payload
+
+
+class LinearTextClassifier:
+    """Small bag-of-words logistic classifier loaded from a JSON weights file"""
+
+    def __init__(self, weights: Dict[str, float], bias: float = 0.0):
+        self.weights = weights
+        self.bias = bias
+
+    @classmethod
+    def load(cls, path: str) -> 'LinearTextClassifier':
+        with open(path) as f:
+            data = json.load(f)
+        return cls(data['weights'], data.get('bias', 0.0))
+
+    def predict(self, text: str) -> float:
+        """Probability that the text violates policy"""
+        score = self.bias + sum(self.weights.get(word, 0.0) for word in _WORD_RE.findall(text.lower()))
+        return 1.0 / (1.0 + math.exp(-max(-50.0, min(50.0, score))))
+
+
+class ModerationPrefilter:
+    """Local first pass over moderation requests; only uncertain content is escalated to the provider"""
+
+    def __init__(self, categories: Dict[str, Dict[str, List[str]]], classifier: Optional[Any] = None,
+                 flag_threshold: float = 0.9, clean_threshold: float = 0.1, pass_unmatched: bool = False):
+        patterns: Dict[str, Any] = {}
+        for category, lists in categories.items():
+            for term in lists.get('block', []):
+                patterns[term.lower()] = (category, 'block')
+            for term in lists.get('review', []):
+                patterns.setdefault(term.lower(), (category, 'review'))
+        self.categories = list(categories)
+        self.matcher = AhoCorasick(patterns) if patterns else None
+        self.classifier = classifier
+        self.flag_threshold = flag_threshold
+        self.clean_threshold = clean_threshold
+        self.pass_unmatched = pass_unmatched
+        self._lock = threading.Lock()
+        self._counts = {'total': 0, 'flagged': 0, 'clean': 0, 'escalated': 0}
+
+    def _matches(self, text: str) -> List[Tuple[str, str, str]]:
+        matches = []
+        for start, term, (category, severity) in self.matcher.find(text):
+            end = start + len(term)
+            # Only whole-word matches count, so "class" never matches "ass"
+            if (start == 0 or not text[start - 1].isalnum()) and (end == len(text) or not text[end].isalnum()):
+                matches.append((term, category, severity))
+        return matches
+
+    def check(self, content: str) -> Optional[Dict[str, Any]]:
+        """Return a verdict for high-confidence content, or None to escalate to the provider"""
+        text = content.lower()
+        matches = self._matches(text) if self.matcher else []
+        blocked = {category for _, category, severity in matches if severity == 'block'}
+        review = {category for _, category, severity in matches if severity == 'review'}
+        # The classifier only runs when the term lists are inconclusive
+        score = None
+        if not blocked and not review and self.classifier is not None:
+            score = self.classifier.predict(content)
+
+        verdict = None
+        if blocked:
+            verdict = True
+        elif not review:
+            if score is not None:
+                if score >= self.flag_threshold:
+                    verdict = True
+                elif score <= self.clean_threshold:
+                    verdict = False
+            elif self.pass_unmatched:
+                verdict = False
+
+        with self._lock:
+            self._counts['total'] += 1
+            self._counts['escalated' if verdict is None else ('flagged' if verdict else 'clean')] += 1
+        if verdict is None:
+            return None
+
+        scores = {category: 1.0 if category in blocked else 0.0 for category in self.categories}
+        if score is not None:
+            scores['classifier'] = score
+        return ResponseFormatter.format_moderation_response(
+            flagged=verdict,
+            categories={category: category in blocked for category in self.categories},
+            scores=scores,
+            model='local-prefilter',
+            metadata={'matched_terms': sorted({term for term, _, _ in matches}), 'short_circuit': True}
+        )
+
+    @property
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            counts = dict(self._counts)
+        counts['short_circuit_ratio'] = (
+            (counts['flagged'] + counts['clean']) / counts['total'] if counts['total'] else 0.0
+        )
+        return counts
+
+
+def moderation_prefilter_from_env() -> Optional[ModerationPrefilter]:
+    """Build the pre-filter from MODERATION_* environment variables, if term lists are configured"""
+    terms_path = os.getenv('MODERATION_TERMS_PATH')
+    classifier_path = os.getenv('MODERATION_CLASSIFIER_PATH')
+    if not terms_path and not classifier_path:
+        return None
+    categories: Dict[str, Dict[str, List[str]]] = {}
+    if terms_path:
+        with open(terms_path) as f:
+            categories = json.load(f)
+    return ModerationPrefilter(
+        categories,
+        classifier=LinearTextClassifier.load(classifier_path) if classifier_path else None,
+        flag_threshold=float(os.getenv('MODERATION_FLAG_THRESHOLD', '0.9')),
+        clean_threshold=float(os.getenv('MODERATION_CLEAN_THRESHOLD', '0.1')),
+        pass_unmatched=os.getenv('MODERATION_PASS_UNMATCHED', 'false').lower() == 'true'
+    )
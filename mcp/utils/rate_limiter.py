@@ -1,8 +1,23 @@
-from typing import Dict, Any, Optional
+from typing import Dict, Any, Iterator, Mapping, Optional, Union
+from contextlib import contextmanager
+from contextvars import ContextVar
+from datetime import datetime
+import re
 import time
-from threading import Lock
+from threading import Condition, Lock
 from collections import deque
 
+from .tracing import tracer
+
+# Statuses providers use for "slow down": rate limited, overloaded, unavailable
+THROTTLE_STATUSES = (429, 503, 529)
+
+# Model types served by a hosted API, which get an adaptive limiter per configured entry
+HOSTED_PROVIDERS = ('openai', 'gemini', 'claude')
+
+_DURATION_RE = re.compile(r'(\d+(?:\.\d+)?)(ms|h|m|s)')
+_DURATION_UNITS = {'ms': 0.001, 's': 1.0, 'm': 60.0, 'h': 3600.0}
+
 class RateLimiter:
     """Rate limiter for API calls"""
     
@@ -30,26 +45,320 @@ class RateLimiter:
             # Add current request
             self.requests.append(now)
 
+def _parse_reset(value: Optional[str]) -> Optional[float]:
+    """Seconds until a rate-limit window resets: "20", "1.5", "6m0s", "250ms" or an RFC 3339 time"""
+    if not value:
+        return None
+    value = value.strip()
+    try:
+        return max(0.0, float(value))
+    except ValueError:
+        pass
+    parts = _DURATION_RE.findall(value)
+    if parts and ''.join(number + unit for number, unit in parts) == value:
+        return sum(float(number) * _DURATION_UNITS[unit] for number, unit in parts)
+    try:
+        return max(0.0, datetime.fromisoformat(value.replace('Z', '+00:00')).timestamp() - time.time())
+    except ValueError:
+        return None
+
+
+def _header(headers: Mapping[str, str], *names: str) -> Optional[str]:
+    for name in names:
+        value = headers.get(name)
+        if value is not None:
+            return value
+    return None
+
+
+class AdaptiveLimiter:
+    """Learns a provider's real request rate and concurrency from its responses (AIMD)
+
+    Successful calls raise the allowed rate and concurrency, exponentially until the first
+    throttle and additively after it; a throttled call (429/overloaded) halves both and
+    pauses for Retry-After. Rate-limit headers cap the
+    rate at the advertised quota and pause the limiter when the remaining quota hits zero.
+    """
+
+    def __init__(self, requests_per_minute: float = 60, concurrency: float = 8,
+                 max_concurrency: float = 256, increase_rps: float = 0.5,
+                 decrease_factor: float = 0.5, min_rps: float = 0.1):
+        self.rate = requests_per_minute / 60.0
+        self.concurrency = concurrency
+        self.max_concurrency = max_concurrency
+        self.increase_rps = increase_rps
+        self.decrease_factor = decrease_factor
+        self.min_rps = min_rps
+        self.ceiling_rps: Optional[float] = None
+        self.slow_start = True
+        self.paused_until = 0.0
+        self.in_flight = 0
+        self._tokens = 1.0
+        self._refilled = time.monotonic()
+        self._last_decrease = 0.0
+        self._condition = Condition()
+        self._counts = {'requests': 0, 'throttled': 0, 'decreases': 0}
+
+    def _refill(self, now: float) -> None:
+        # Token bucket holding at most one second of burst
+        self._tokens = min(max(1.0, self.rate), self._tokens + (now - self._refilled) * self.rate)
+        self._refilled = now
+
+    def acquire(self) -> None:
+        """Block until both a concurrency slot and a rate token are available"""
+        with self._condition:
+            while True:
+                now = time.monotonic()
+                self._refill(now)
+                if now < self.paused_until:
+                    self._condition.wait(self.paused_until - now)
+                elif self.in_flight >= max(1, int(self.concurrency)):
+                    self._condition.wait()
+                elif self._tokens < 1.0:
+                    self._condition.wait((1.0 - self._tokens) / self.rate)
+                else:
+                    self._tokens -= 1.0
+                    self.in_flight += 1
+                    self._counts['requests'] += 1
+                    return
+
+    def release(self, throttled: bool = False) -> None:
+        with self._condition:
+            self.in_flight -= 1
+            if not throttled:
+                if self.slow_start:
+                    # Until the first throttle, grow exponentially (each success adds one request/s and one slot)
+                    self.rate += 1.0
+                    self.concurrency += 1.0
+                else:
+                    # Additive increase: roughly +increase_rps per second and +1 slot per window of successes
+                    self.rate += self.increase_rps / max(self.rate, 1.0)
+                    self.concurrency += 1.0 / self.concurrency
+                if self.ceiling_rps is not None:
+                    self.rate = min(self.rate, self.ceiling_rps)
+                self.concurrency = min(self.max_concurrency, self.concurrency)
+            self._condition.notify_all()
+
+    def throttled(self, retry_after: Optional[float] = None) -> None:
+        """Multiplicative decrease after a 429/overload, at most once per second of responses"""
+        with self._condition:
+            now = time.monotonic()
+            self._counts['throttled'] += 1
+            self.slow_start = False
+            if now - self._last_decrease >= 1.0:
+                self._last_decrease = now
+                self._counts['decreases'] += 1
+                self.rate = max(self.min_rps, self.rate * self.decrease_factor)
+                self.concurrency = max(1.0, self.concurrency * self.decrease_factor)
+                self._tokens = min(self._tokens, 0.0)
+            if retry_after:
+                self.paused_until = max(self.paused_until, now + retry_after)
+
+    def headroom(self) -> float:
+        """Calls that could start right now without waiting; 0 while paused or saturated"""
+        with self._condition:
+            now = time.monotonic()
+            self._refill(now)
+            if now < self.paused_until:
+                return 0.0
+            return max(0.0, min(self._tokens, max(1, int(self.concurrency)) - self.in_flight))
+
+    def observe_headers(self, headers: Mapping[str, str]) -> None:
+        """Learn the quota from OpenAI, Anthropic or IETF style rate-limit headers"""
+        headers = {key.lower(): value for key, value in headers.items()}
+        limit = _header(headers, 'x-ratelimit-limit-requests', 'anthropic-ratelimit-requests-limit')
+        remaining = _header(headers, 'x-ratelimit-remaining-requests',
+                            'anthropic-ratelimit-requests-remaining', 'ratelimit-remaining')
+        reset = _parse_reset(_header(headers, 'x-ratelimit-reset-requests',
+                                     'anthropic-ratelimit-requests-reset', 'ratelimit-reset'))
+        with self._condition:
+            if limit:
+                try:
+                    # Advertised request limits are per minute
+                    self.ceiling_rps = float(limit) / 60.0
+                    self.rate = min(self.rate, self.ceiling_rps)
+                except ValueError:
+                    pass
+            if remaining is not None and reset:
+                try:
+                    if int(remaining) <= 0:
+                        self.paused_until = max(self.paused_until, time.monotonic() + reset)
+                except ValueError:
+                    pass
+
+    @property
+    def stats(self) -> Dict[str, Any]:
+        with self._condition:
+            return dict(
+                self._counts,
+                requests_per_minute=round(self.rate * 60, 2),
+                quota_per_minute=round(self.ceiling_rps * 60, 2) if self.ceiling_rps else None,
+                concurrency=int(self.concurrency),
+                in_flight=self.in_flight,
+                paused_for=round(max(0.0, self.paused_until - time.monotonic()), 3),
+                slow_start=self.slow_start
+            )
+
+
+class _Permit:
+    """One call's hold on an adaptive limiter, marked when the provider pushes back"""
+
+    def __init__(self, limiter: Optional[AdaptiveLimiter]):
+        self.limiter = limiter
+        self.throttled = False
+        # Failed in a way worth retrying later: throttled, a server error or unreachable
+        self.transient = False
+
+
+# The permit of the provider call running in this context, for adapters to report into
+_current_permit: ContextVar[Optional[_Permit]] = ContextVar('rate_limit_permit', default=None)
+
+
+def report_provider_response(headers: Optional[Mapping[str, str]] = None, status: Optional[int] = None,
+                             retry_after: Optional[float] = None) -> None:
+    """Called by adapters with a provider response so the current model's limiter can adapt"""
+    permit = _current_permit.get()
+    if permit is None:
+        return
+    if headers and permit.limiter is not None:
+        permit.limiter.observe_headers(headers)
+        if retry_after is None:
+            retry_after = _parse_reset(_header({k.lower(): v for k, v in headers.items()}, 'retry-after'))
+    if status is not None and (status in THROTTLE_STATUSES or status >= 500):
+        permit.transient = True
+    if status in THROTTLE_STATUSES:
+        permit.throttled = True
+        if permit.limiter is not None:
+            permit.limiter.throttled(retry_after)
+
+
+def mark_throttled() -> None:
+    """Mark the current call as throttled, e.g. by a pool whose members all pushed back"""
+    permit = _current_permit.get()
+    if permit is not None:
+        permit.throttled = True
+
+
+def _error_status(error: BaseException) -> Optional[int]:
+    # OpenAI/Anthropic errors carry the response, Google ones a code
+    response = getattr(error, 'response', None)
+    status = getattr(error, 'status_code', None) or getattr(response, 'status_code', None)
+    if status is None:
+        code = getattr(error, 'code', None)
+        status = code if isinstance(code, int) else None
+    return status
+
+
+def is_transient_error(error: BaseException) -> bool:
+    """Whether a provider error may pass if retried: throttled, a server error, a timeout or no connection"""
+    if isinstance(error, (ConnectionError, TimeoutError)):
+        return True
+    status = _error_status(error)
+    if status is not None:
+        return status in THROTTLE_STATUSES or status >= 500
+    # SDK connection and timeout errors don't derive from the builtin ones
+    name = type(error).__name__
+    return 'Timeout' in name or 'Connection' in name
+
+
+def report_provider_error(error: BaseException) -> None:
+    """Report an SDK exception to the current call's limiter and permit"""
+    report_provider_response(getattr(getattr(error, 'response', None), 'headers', None), _error_status(error))
+    permit = _current_permit.get()
+    if permit is not None and is_transient_error(error):
+        permit.transient = True
+
+
+@contextmanager
+def limiter_permit(limiter: AdaptiveLimiter, name: str) -> Iterator[_Permit]:
+    """Hold an adaptive limiter for one provider call; adapters report into the yielded permit"""
+    with tracer.span('rate_limit.wait', model=name):
+        limiter.acquire()
+    permit = _Permit(limiter)
+    token = _current_permit.set(permit)
+    try:
+        yield permit
+    except Exception as e:
+        # Adapters that raise SDK errors are reported here rather than in each adapter
+        report_provider_error(e)
+        raise
+    finally:
+        _current_permit.reset(token)
+        limiter.release(permit.throttled)
+
+
+@contextmanager
+def pool_permit() -> Iterator[_Permit]:
+    """Track one call spread over a provider pool, whose members hold their own limiters"""
+    permit = _Permit(None)
+    token = _current_permit.set(permit)
+    try:
+        yield permit
+    finally:
+        _current_permit.reset(token)
+
+
 class ModelRateLimiter:
     """Rate limiter for specific AI models"""
     
-    _limiters: Dict[str, RateLimiter] = {
-        'openai': RateLimiter(requests_per_minute=60),  # OpenAI default limit
-        'gemini': RateLimiter(requests_per_minute=60),  # Gemini default limit
-    }
+    # Keyed by model entry name; hosted entries are registered as they are loaded
+    _limiters: Dict[str, Union[RateLimiter, AdaptiveLimiter]] = {}
+    
+    @classmethod
+    def register_model(cls, model: str, requests_per_minute: int, adaptive: bool = False) -> None:
+        """Register a new model with its rate limit (fixed, or the starting point when adaptive)"""
+        if adaptive:
+            cls._limiters[model] = AdaptiveLimiter(requests_per_minute)
+        else:
+            cls._limiters[model] = RateLimiter(requests_per_minute)
     
     @classmethod
-    def register_model(cls, model: str, requests_per_minute: int) -> None:
-        """Register a new model with its rate limit"""
-        cls._limiters[model] = RateLimiter(requests_per_minute)
+    def unregister_model(cls, model: str) -> None:
+        """Drop a model's limiter, e.g. after it was unloaded"""
+        cls._limiters.pop(model, None)
+    
+    @classmethod
+    def sync_model(cls, model: str, entry: Optional[Dict[str, Any]]) -> None:
+        """Give a loaded hosted entry its own adaptive limiter, starting from its configured rate
+
+        entry is the registry's {'type', 'config'} for the model, or None once it is unloaded.
+        """
+        if entry is None or entry['type'] not in HOSTED_PROVIDERS:
+            cls.unregister_model(model)
+            return
+        # Hosted providers start from a conservative guess and adapt to their real quota
+        cls.register_model(model, entry['config'].get('requests_per_minute', 60), adaptive=True)
     
     @classmethod
     def wait_if_needed(cls, model: str) -> None:
         """Wait if needed for the specified model"""
-        if model in cls._limiters:
-            cls._limiters[model].wait_if_needed()
+        limiter = cls._limiters.get(model)
+        if isinstance(limiter, RateLimiter):
+            with tracer.span('rate_limit.wait', model=model):
+                limiter.wait_if_needed()
+    
+    @classmethod
+    @contextmanager
+    def acquire(cls, model: str) -> Iterator[Optional[_Permit]]:
+        """Hold the model's limit for the duration of a provider call, yielding its permit if adaptive"""
+        limiter = cls._limiters.get(model)
+        if not isinstance(limiter, AdaptiveLimiter):
+            cls.wait_if_needed(model)
+            yield None
+            return
+        with limiter_permit(limiter, model) as permit:
+            yield permit
             
     @classmethod
-    def get_limiter(cls, model: str) -> Optional[RateLimiter]:
+    def get_limiter(cls, model: str) -> Optional[Union[RateLimiter, AdaptiveLimiter]]:
         """Get rate limiter for a specific model"""
-        return cls._limiters.get(model) 
\ No newline at end of file
+        return cls._limiters.get(model)
+    
+    @classmethod
+    def stats(cls) -> Dict[str, Any]:
+        """Current (learned) limits per model"""
+        return {
+            model: limiter.stats if isinstance(limiter, AdaptiveLimiter)
+            else {'requests_per_minute': limiter.requests_per_minute, 'adaptive': False}
+            for model, limiter in cls._limiters.items()
+        }
@@ -0,0 +1,192 @@
+from typing import Dict, Any, Callable, List, Mapping, Optional, Tuple
+import threading
+
+# Option name -> (accepted types, minimum, maximum); bounds apply to numbers and list lengths.
+# These are the specs adapters pick from: each declares in option_schema the options it
+# actually passes on, per route, and only those are accepted for its models.
+GENERATION_OPTIONS: Dict[str, Tuple[tuple, Optional[float], Optional[float]]] = {
+    'temperature': ((int, float), 0, 2),
+    'max_tokens': ((int,), 1, 32768),
+    'max_new_tokens': ((int,), 1, 32768),
+    'top_p': ((int, float), 0, 1),
+    'top_k': ((int,), 0, 1000),
+    'frequency_penalty': ((int, float), -2, 2),
+    'presence_penalty': ((int, float), -2, 2),
+    'repeat_penalty': ((int, float), 0, 2),
+    'seed': ((int,), None, None),
+    'stop': ((str, list), 0, 16),
+}
+
+# Several candidates per request
+SAMPLING_OPTIONS: Dict[str, Tuple[tuple, Optional[float], Optional[float]]] = {
+    'n': ((int,), 1, 16),
+    'best_of': ((int,), 1, 16),
+}
+
+EMBEDDING_OPTIONS: Dict[str, Tuple[tuple, Optional[float], Optional[float]]] = {
+    'pooling': ((str,), None, None),
+    'normalize': ((bool,), None, None),
+}
+
+
+def pick_options(table: Dict[str, Tuple[tuple, Optional[float], Optional[float]]],
+                 *names: str) -> Dict[str, Tuple[tuple, Optional[float], Optional[float]]]:
+    """The specs for the named options, for building an adapter's option_schema"""
+    return {name: table[name] for name in names}
+
+
+# Route -> (capability, body field, field type, max field length)
+ROUTES: Dict[str, Tuple[str, str, type, int]] = {
+    'generate': ('text_generation', 'prompt', str, 100_000),
+    'chat': ('chat', 'messages', list, 1_000),
+    'embed': ('embeddings', 'text', str, 100_000),
+    'moderate': ('moderation', 'content', str, 100_000),
+    'analyze-image': ('image_analysis', 'prompt', str, 10_000),
+}
+
+# Streaming route -> the route it streams; a stream carries a single candidate, so the
+# sampling options are left out unless the adapter declares the streaming route itself
+STREAM_ROUTES: Dict[str, str] = {
+    'chat-stream': 'chat',
+}
+
+VALID_ROLES = frozenset({'user', 'assistant', 'system'})
+MAX_MESSAGE_LENGTH = 100_000
+
+
+class ValidationError(ValueError):
+    """Raised when a request payload does not match its schema"""
+
+    def __init__(self, message: str, status: int = 400):
+        super().__init__(message)
+        self.status = status
+
+
+def _compile_option(name: str, types: tuple, minimum: Optional[float], maximum: Optional[float]) -> Callable[[Any], None]:
+    """Build a checker closure for one option so no table lookups happen per request"""
+    type_names = '/'.join(t.__name__ for t in types)
+
+    def check(value: Any) -> None:
+        # bool is an int subclass; only accept it where explicitly allowed
+        if not isinstance(value, types) or (isinstance(value, bool) and bool not in types):
+            raise ValidationError(f"Option '{name}' must be {type_names}")
+        size = len(value) if isinstance(value, list) else value
+        if isinstance(size, (int, float)) and not isinstance(size, bool):
+            if minimum is not None and size < minimum:
+                raise ValidationError(f"Option '{name}' must be >= {minimum}")
+            if maximum is not None and size > maximum:
+                raise ValidationError(f"Option '{name}' must be <= {maximum}")
+    return check
+
+
+class CompiledSchema:
+    """Validator for one (model, route) pair, compiled from the adapter's capabilities"""
+
+    def __init__(self, model: str, route: str, supported: bool, field: str, field_type: type,
+                 max_field_length: int, options: Dict[str, Callable[[Any], None]], max_body_bytes: int):
+        self.model = model
+        self.route = route
+        self.supported = supported
+        self.field = field
+        self.field_type = field_type
+        self.max_field_length = max_field_length
+        self.options = options
+        self.max_body_bytes = max_body_bytes
+
+    def check_size(self, content_length: Optional[int]) -> None:
+        """Reject oversized bodies before they are read or parsed"""
+        if not self.supported:
+            raise ValidationError(f"Model {self.model} does not support {self.route}")
+        if content_length is not None and content_length > self.max_body_bytes:
+            raise ValidationError(
+                f"Request body of {content_length} bytes exceeds {self.max_body_bytes} bytes", status=413
+            )
+
+    def validate(self, payload: Any) -> Dict[str, Any]:
+        """Validate a parsed body in one pass and return it with checked options"""
+        if not isinstance(payload, dict):
+            raise ValidationError("Request body must be a JSON object")
+
+        value = payload.get(self.field)
+        if not value:
+            raise ValidationError(f"No {self.field} provided")
+        self.check_field(value)
+
+        options = payload.get('options') or {}
+        if not isinstance(options, dict):
+            raise ValidationError("'options' must be an object")
+        for name, option in options.items():
+            check = self.options.get(name)
+            if check is None:
+                raise ValidationError(f"Unsupported option '{name}' for {self.model}/{self.route}")
+            check(option)
+        return payload
+
+    def check_field(self, value: Any) -> None:
+        """Check the route's main field, e.g. a prompt sent as a form field rather than JSON"""
+        if not isinstance(value, self.field_type):
+            raise ValidationError(f"'{self.field}' must be a {self.field_type.__name__}")
+        if len(value) > self.max_field_length:
+            raise ValidationError(f"'{self.field}' exceeds {self.max_field_length} items", status=413)
+        if self.field == 'messages':
+            for message in value:
+                if not isinstance(message, dict) or message.get('role') not in VALID_ROLES:
+                    raise ValidationError("Each message needs a role of user, assistant or system")
+                content = message.get('content')
+                if not isinstance(content, str) or len(content) > MAX_MESSAGE_LENGTH:
+                    raise ValidationError("Each message needs string content within the size limit")
+
+
+class RequestSchemaRegistry:
+    """Compiled request schemas for every configured model and route"""
+
+    def __init__(self, max_body_bytes: int = 1024 * 1024, max_image_bytes: int = 10 * 1024 * 1024):
+        self.max_body_bytes = max_body_bytes
+        self.max_image_bytes = max_image_bytes
+        self._schemas: Dict[Tuple[str, str], CompiledSchema] = {}
+        self._lock = threading.Lock()
+
+    def compile_model(self, name: str, model: Any) -> None:
+        """Compile the schemas of every route for one model from its capabilities"""
+        capabilities = model.capabilities
+        # Only the options the adapter declares for a route are accepted on it
+        declared = getattr(model, 'option_schema', None) or {}
+        routes = {route: (route, declared.get(route) or {}) for route in ROUTES}
+        for route, base in STREAM_ROUTES.items():
+            specs = declared.get(route)
+            if specs is None:
+                specs = {key: spec for key, spec in (declared.get(base) or {}).items() if key not in SAMPLING_OPTIONS}
+            routes[route] = (base, specs)
+        compiled = {}
+        for route, (base, specs) in routes.items():
+            capability, field, field_type, max_length = ROUTES[base]
+            options = {key: _compile_option(key, *spec) for key, spec in specs.items()}
+            max_body = self.max_image_bytes if route == 'analyze-image' else self.max_body_bytes
+            compiled[(name, route)] = CompiledSchema(
+                name, route, bool(capabilities.get(capability)), field, field_type,
+                max_length, options, max_body
+            )
+        with self._lock:
+            self._schemas.update(compiled)
+
+    def compile_all(self, models: Mapping[str, Any]) -> None:
+        """Compile schemas for every configured model"""
+        for name in list(models):
+            self.compile_model(name, models[name])
+
+    def invalidate(self, name: str) -> None:
+        """Drop a model's schemas, e.g. after it was replaced or unloaded"""
+        with self._lock:
+            for key in [key for key in self._schemas if key[0] == name]:
+                del self._schemas[key]
+
+    def get(self, name: str, route: str, models: Mapping[str, Any]) -> CompiledSchema:
+        """Return the compiled schema, compiling on first use after a model swap"""
+        schema = self._schemas.get((name, route))
+        if schema is None:
+            self.compile_model(name, models[name])
+            schema = self._schemas[(name, route)]
+        return schema
+
+    def routes(self) -> List[str]:
+        return list(ROUTES)
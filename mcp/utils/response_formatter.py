@@ -1,9 +1,42 @@
 from typing import Dict, Any, List, Optional
 
+from .tracing import tracer
+
+# Keys under which adapters return generated text: generate, chat and image analysis
+_TEXT_KEYS = ('text', 'response', 'description')
+
+
+def response_texts(result: Any) -> List[str]:
+    """Every generated text in an adapter result, best first
+
+    Adapters return a bare string, a list of candidates (local models with n > 1), or a
+    dict with the text under "text", "response" or "description" and, for several
+    candidates, all of them under "choices".
+    """
+    if isinstance(result, str):
+        return [result]
+    if isinstance(result, list):
+        return [text for text in result if isinstance(text, str)]
+    if isinstance(result, dict):
+        choices = result.get('choices')
+        if isinstance(choices, list) and choices:
+            return [text for text in choices if isinstance(text, str)]
+        for key in _TEXT_KEYS:
+            if isinstance(result.get(key), str):
+                return [result[key]]
+    return []
+
+
+def response_text(result: Any) -> Optional[str]:
+    """The (best) generated text in an adapter result, or None if it carries none"""
+    texts = response_texts(result)
+    return texts[0] if texts else None
+
 class ResponseFormatter:
     """Utility class for formatting AI model responses"""
     
     @staticmethod
+    @tracer.traced('formatter.format_text_response')
     def format_text_response(
         text: str,
         model: str,
@@ -19,6 +52,7 @@ class ResponseFormatter:
         }
     
     @staticmethod
+    @tracer.traced('formatter.format_chat_response')
     def format_chat_response(
         messages: List[Dict[str, str]],
         response: str,
@@ -36,6 +70,7 @@ class ResponseFormatter:
         }
     
     @staticmethod
+    @tracer.traced('formatter.format_embedding_response')
     def format_embedding_response(
         embedding: List[float],
         model: str,
@@ -50,6 +85,7 @@ class ResponseFormatter:
         }
     
     @staticmethod
+    @tracer.traced('formatter.format_image_analysis_response')
     def format_image_analysis_response(
         description: str,
         model: str,
@@ -65,6 +101,7 @@ class ResponseFormatter:
         }
     
     @staticmethod
+    @tracer.traced('formatter.format_moderation_response')
     def format_moderation_response(
         flagged: bool,
         categories: Dict[str, bool],
@@ -82,6 +119,7 @@ class ResponseFormatter:
         }
     
     @staticmethod
+    @tracer.traced('formatter.format_error_response')
     def format_error_response(
         error: str,
         model: str,
@@ -0,0 +1,247 @@
+from typing import Dict, Any, List, Optional, Callable
+from collections import Counter
+from contextlib import contextmanager
+from contextvars import ContextVar
+import functools
+import json
+import os
+import queue
+import random
+import sys
+import threading
+import time
+import urllib.request
+
+
+class Span:
+    """A timed operation within a trace"""
+
+    __slots__ = ('name', 'trace_id', 'span_id', 'parent_id', 'start_ns', 'end_ns', 'attributes', 'error', 'children')
+
+    def __init__(self, name: str, trace_id: str, parent_id: Optional[str], attributes: Dict[str, Any]):
+        self.name = name
+        self.trace_id = trace_id
+        self.span_id = '%016x' % random.getrandbits(64)
+        self.parent_id = parent_id
+        self.start_ns = time.time_ns()
+        self.end_ns: Optional[int] = None
+        self.attributes = attributes
+        self.error: Optional[str] = None
+        # Only the root span collects the finished spans of its trace
+        self.children: List['Span'] = []
+
+    @property
+    def duration_ms(self) -> float:
+        return ((self.end_ns or time.time_ns()) - self.start_ns) / 1e6
+
+    def to_otlp(self) -> Dict[str, Any]:
+        """Serialise in the OTLP/JSON span layout"""
+        return {
+            'traceId': self.trace_id,
+            'spanId': self.span_id,
+            'parentSpanId': self.parent_id or '',
+            'name': self.name,
+            'startTimeUnixNano': str(self.start_ns),
+            'endTimeUnixNano': str(self.end_ns),
+            'attributes': [
+                {'key': key, 'value': {'stringValue': str(value)}}
+                for key, value in self.attributes.items()
+            ],
+            'status': {'code': 2, 'message': self.error} if self.error else {'code': 1}
+        }
+
+
+class JsonlSpanExporter:
+    """Append finished traces to a local JSONL file, one OTLP span per line"""
+
+    def __init__(self, path: str):
+        self.path = path
+        os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+
+    def export(self, spans: List[Span]) -> None:
+        with open(self.path, 'a') as f:
+            for span in spans:
+                f.write(json.dumps(span.to_otlp()) + '\n')
+
+
+class OtlpHttpSpanExporter:
+    """Send finished traces to an OTLP/HTTP JSON collector"""
+
+    def __init__(self, endpoint: str, service_name: str = 'mcp'):
+        self.url = endpoint.rstrip('/') + '/v1/traces'
+        self.service_name = service_name
+
+    def export(self, spans: List[Span]) -> None:
+        body = {'resourceSpans': [{
+            'resource': {'attributes': [{'key': 'service.name', 'value': {'stringValue': self.service_name}}]},
+            'scopeSpans': [{'scope': {'name': 'mcp.tracing'}, 'spans': [span.to_otlp() for span in spans]}]
+        }]}
+        request = urllib.request.Request(
+            self.url, data=json.dumps(body).encode(), headers={'Content-Type': 'application/json'}
+        )
+        urllib.request.urlopen(request, timeout=5).close()
+
+
+class Tracer:
+    """Lightweight request tracer with head sampling plus always-on slow request capture"""
+
+    def __init__(self, sample_rate: float = 0.0, slow_ms: Optional[float] = None,
+                 exporters: Optional[List[Any]] = None, max_queue: int = 1000):
+        self.sample_rate = sample_rate
+        self.slow_ms = slow_ms
+        self.exporters = exporters or []
+        self._current: ContextVar[Optional[Span]] = ContextVar('mcp_current_span', default=None)
+        self._root: ContextVar[Optional[Span]] = ContextVar('mcp_root_span', default=None)
+        self._queue: "queue.Queue[List[Span]]" = queue.Queue(maxsize=max_queue)
+        self._worker: Optional[threading.Thread] = None
+
+    @property
+    def enabled(self) -> bool:
+        return bool(self.sample_rate > 0 or self.slow_ms is not None)
+
+    def start_span(self, name: str, **attributes: Any):
+        """Open a span as a child of the current one and return a token for finish_span"""
+        if not self.enabled:
+            return None
+        parent = self._current.get()
+        root = self._root.get()
+        span = Span(name, parent.trace_id if parent else '%032x' % random.getrandbits(128),
+                    parent.span_id if parent else None, attributes)
+        root_token = self._root.set(span) if root is None else None
+        return span, self._current.set(span), root_token
+
+    def finish_span(self, token, error: Optional[BaseException] = None) -> None:
+        """Close a span opened by start_span and export its trace if it was the root"""
+        if token is None:
+            return
+        span, current_token, root_token = token
+        span.end_ns = time.time_ns()
+        if error is not None:
+            span.error = f"{type(error).__name__}: {error}"
+        self._current.reset(current_token)
+
+        if root_token is None:
+            root = self._root.get()
+            if root is not None:
+                root.children.append(span)
+            return
+
+        self._root.reset(root_token)
+        slow = self.slow_ms is not None and span.duration_ms >= self.slow_ms
+        if slow:
+            breakdown = ', '.join(f"{child.name}={child.duration_ms:.1f}ms" for child in span.children)
+            print(f"Slow request {span.attributes.get('path', span.name)} took {span.duration_ms:.1f}ms: {breakdown}")
+        if slow or random.random() < self.sample_rate:
+            self._enqueue(span.children + [span])
+
+    @contextmanager
+    def span(self, name: str, **attributes: Any):
+        """Trace the enclosed block"""
+        token = self.start_span(name, **attributes)
+        try:
+            yield
+        except BaseException as e:
+            self.finish_span(token, e)
+            raise
+        self.finish_span(token)
+
+    def traced(self, name: Optional[str] = None) -> Callable:
+        """Decorator tracing every call of a function"""
+        def decorator(func: Callable) -> Callable:
+            span_name = name or func.__qualname__
+
+            @functools.wraps(func)
+            def wrapper(*args, **kwargs):
+                with self.span(span_name):
+                    return func(*args, **kwargs)
+            return wrapper
+        return decorator
+
+    def _enqueue(self, spans: List[Span]) -> None:
+        if not self.exporters:
+            return
+        if self._worker is None:
+            self._worker = threading.Thread(target=self._export_loop, name='trace-exporter', daemon=True)
+            self._worker.start()
+        try:
+            # Never block the request path on exporting
+            self._queue.put_nowait(spans)
+        except queue.Full:
+            pass
+
+    def _export_loop(self) -> None:
+        while True:
+            spans = self._queue.get()
+            for exporter in self.exporters:
+                try:
+                    exporter.export(spans)
+                except Exception as e:
+                    print(f"Warning: trace export failed: {str(e)}")
+
+
+def tracer_from_env() -> Tracer:
+    """Build the process tracer from TRACE_* environment variables"""
+    exporters: List[Any] = []
+    if os.getenv('TRACE_EXPORT_PATH'):
+        exporters.append(JsonlSpanExporter(os.getenv('TRACE_EXPORT_PATH')))
+    if os.getenv('OTEL_EXPORTER_OTLP_ENDPOINT'):
+        exporters.append(OtlpHttpSpanExporter(os.getenv('OTEL_EXPORTER_OTLP_ENDPOINT')))
+    slow_ms = os.getenv('TRACE_SLOW_REQUEST_MS')
+    return Tracer(
+        sample_rate=float(os.getenv('TRACE_SAMPLE_RATE', '0')),
+        slow_ms=float(slow_ms) if slow_ms else None,
+        exporters=exporters
+    )
+
+
+tracer = tracer_from_env()
+
+
+class SamplingProfiler:
+    """Statistical profiler sampling the stacks of all threads at a fixed interval"""
+
+    _lock = threading.Lock()
+
+    def __init__(self, interval_ms: float = 5.0):
+        self.interval = interval_ms / 1000.0
+        self.stacks: Counter = Counter()
+        self.samples = 0
+
+    def run(self, seconds: float) -> Dict[str, Any]:
+        """Sample for the given duration; only one profile can run at a time"""
+        if not self._lock.acquire(blocking=False):
+            raise RuntimeError("A profile is already running")
+        try:
+            me = threading.get_ident()
+            deadline = time.monotonic() + seconds
+            while time.monotonic() < deadline:
+                for thread_id, frame in sys._current_frames().items():
+                    if thread_id == me:
+                        continue
+                    stack = []
+                    while frame is not None:
+                        code = frame.f_code
+                        stack.append(f"{code.co_name} ({os.path.basename(code.co_filename)}:{frame.f_lineno})")
+                        frame = frame.f_back
+                    self.stacks[';'.join(reversed(stack))] += 1
+                self.samples += 1
+                time.sleep(self.interval)
+        finally:
+            self._lock.release()
+        return self.report()
+
+    def report(self, top: int = 25) -> Dict[str, Any]:
+        """Summarise as folded stacks (flamegraph input) plus the hottest leaf frames"""
+        leaves: Counter = Counter()
+        for stack, count in self.stacks.items():
+            leaves[stack.rsplit(';', 1)[-1]] += count
+        total = sum(self.stacks.values()) or 1
+        return {
+            'samples': self.samples,
+            'interval_ms': self.interval * 1000,
+            'top': [
+                {'frame': frame, 'samples': count, 'percent': round(100.0 * count / total, 2)}
+                for frame, count in leaves.most_common(top)
+            ],
+            'folded': '\n'.join(f"{stack} {count}" for stack, count in self.stacks.most_common())
+        }
@@ -0,0 +1,122 @@
+from typing import Dict, Any, List, Optional
+import glob
+import gzip
+import hashlib
+import json
+import os
+import random
+
+from .audit_log import BatchedJsonlWriter
+from .response_formatter import response_texts
+
+# Routes whose request shapes are captured, keyed by the route segment after /api/<model>/
+CAPTURED_ROUTES = ('generate', 'chat', 'embed', 'moderate', 'analyze-image')
+
+
+# Typical for English text with BPE tokenizers; close enough for sizing without a tokenizer
+CHARS_PER_TOKEN = 4
+
+
+def estimate_tokens(text: str) -> int:
+    """Rough token count that needs no tokenizer"""
+    return max(1, round(len(text) / CHARS_PER_TOKEN)) if text else 0
+
+
+def _content_hash(value: Any) -> str:
+    data = value if isinstance(value, bytes) else json.dumps(value, sort_keys=True).encode()
+    return hashlib.blake2b(data, digest_size=8).hexdigest()
+
+
+class TrafficCapture:
+    """Records the shape of served requests (not their content) for offline replay
+
+    Each record carries arrival time, route, model, token counts, options, status and
+    latency. With hash_content a short digest of the input is kept so repeated prompts
+    can be recognised without storing them.
+    """
+
+    def __init__(self, writer: BatchedJsonlWriter, hash_content: bool = False, sample_rate: float = 1.0):
+        self.writer = writer
+        self.hash_content = hash_content
+        self.sample_rate = sample_rate
+
+    def sampled(self) -> bool:
+        return self.sample_rate >= 1.0 or random.random() < self.sample_rate
+
+    def record(self, route: str, model: str, body: Optional[Dict[str, Any]], status: int, arrived: float,
+               latency_ms: float, response: Any = None, image_bytes: Optional[int] = None) -> None:
+        """Queue the shape of one request; arrived is its wall-clock arrival time"""
+        record: Dict[str, Any] = {
+            'ts': arrived,
+            'route': route,
+            'model': model,
+            'status': status,
+            'latency_ms': round(latency_ms, 3)
+        }
+        body = body if isinstance(body, dict) else {}
+        content: Any = None
+        if route == 'chat':
+            messages = body.get('messages') or []
+            content = messages
+            record['messages'] = len(messages)
+            record['input_tokens'] = [estimate_tokens(str(m.get('content', ''))) if isinstance(m, dict) else 0
+                                      for m in messages]
+        elif route == 'analyze-image':
+            record['image_bytes'] = image_bytes
+        else:
+            content = body.get({'generate': 'prompt', 'embed': 'text', 'moderate': 'content'}.get(route))
+            record['input_tokens'] = estimate_tokens(content) if isinstance(content, str) else 0
+        options = body.get('options')
+        if isinstance(options, dict):
+            record['options'] = options
+        texts = response_texts(response)
+        if texts:
+            # Every candidate was generated, so n > 1 counts them all
+            record['output_tokens'] = sum(estimate_tokens(text) for text in texts)
+        elif isinstance(response, dict) and isinstance(response.get('embedding'), list):
+            record['dimensions'] = len(response['embedding'])
+        if self.hash_content and content is not None:
+            record['content_hash'] = _content_hash(content)
+        self.writer.write(record)
+
+    @property
+    def stats(self) -> Dict[str, Any]:
+        return dict(self.writer.stats, sample_rate=self.sample_rate)
+
+    def close(self) -> None:
+        self.writer.close()
+
+
+def read_trace(path: str) -> List[Dict[str, Any]]:
+    """Load capture records from a segment file or a capture directory, in arrival order"""
+    if os.path.isdir(path):
+        files = sorted(glob.glob(os.path.join(path, 'capture-*.jsonl.gz')))
+    else:
+        files = [path]
+    records = []
+    for file in files:
+        opener = gzip.open if file.endswith('.gz') else open
+        with opener(file, 'rt') as f:
+            records.extend(json.loads(line) for line in f if line.strip())
+    records.sort(key=lambda record: record['ts'])
+    return records
+
+
+def traffic_capture_from_env() -> Optional[TrafficCapture]:
+    """Build the traffic capture from CAPTURE_* environment variables, if enabled"""
+    directory = os.getenv('CAPTURE_DIR')
+    if not directory:
+        return None
+    # Capture must never slow serving down, so a full queue drops records
+    writer = BatchedJsonlWriter(
+        directory,
+        prefix='capture',
+        max_queue=int(os.getenv('CAPTURE_QUEUE_SIZE', '10000')),
+        segment_bytes=int(os.getenv('CAPTURE_SEGMENT_MB', '16')) * 1024 * 1024,
+        overflow='drop'
+    )
+    return TrafficCapture(
+        writer,
+        hash_content=os.getenv('CAPTURE_HASH_CONTENT', 'false').lower() == 'true',
+        sample_rate=float(os.getenv('CAPTURE_SAMPLE_RATE', '1.0'))
+    )